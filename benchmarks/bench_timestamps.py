@@ -0,0 +1,72 @@
+# encoding=utf-8
+"""Compares the timestamp parsing paths used when iterating over lists.
+
+Run it from the repository root with
+``PYTHONPATH=. python benchmarks/bench_timestamps.py [number of items]``.
+"""
+import random
+import sys
+import time
+import timeit
+
+from mwklient.listing import List
+from mwklient.metrics import Metrics
+from mwklient.util import parse_timestamp
+
+
+class FakeSite():
+    """Just enough of a Site to feed a List with a single chunk."""
+
+    def __init__(self, items):
+        self.items = items
+        self.metrics = Metrics()
+
+    def get(self, *args, **kwargs):
+        return {'query': {'recentchanges': [dict(item)
+                                            for item in self.items]}}
+
+
+def make_timestamps(count):
+    start = time.mktime((2019, 1, 1, 0, 0, 0, 0, 0, 0))
+    return [time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                          time.gmtime(start + random.randint(0, 86400 * 30)))
+            for _ in range(count)]
+
+
+def iterate(items, lazy):
+    lst = List(FakeSite(items), 'recentchanges', 'rc', lazy_timestamps=lazy)
+    for _ in lst:
+        pass
+
+
+def report(name, seconds, count):
+    print('{:<36} {:>8.3f} s {:>8.2f} us/item'.format(
+        name, seconds, seconds / count * 1e6))
+
+
+def main(count):
+    timestamps = make_timestamps(count)
+    items = [{'title': 'Page %d' % i, 'timestamp': ts}
+             for i, ts in enumerate(timestamps)]
+
+    def strptime_path():
+        for ts in timestamps:
+            time.strptime(ts, '%Y-%m-%dT%H:%M:%SZ')
+
+    def fast_path():
+        for ts in timestamps:
+            parse_timestamp(ts)
+
+    print('{} timestamps'.format(count))
+    report('time.strptime', min(timeit.repeat(strptime_path, number=1,
+                                              repeat=3)), count)
+    report('parse_timestamp', min(timeit.repeat(fast_path, number=1,
+                                                repeat=3)), count)
+    report('List iteration', min(timeit.repeat(
+        lambda: iterate(items, False), number=1, repeat=3)), count)
+    report('List iteration, lazy timestamps', min(timeit.repeat(
+        lambda: iterate(items, True), number=1, repeat=3)), count)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
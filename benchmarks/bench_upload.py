@@ -0,0 +1,125 @@
+# encoding=utf-8
+"""Measures the throughput and the peak memory of chunked uploads of a large
+local file to a stub API, which reads and discards the chunks.
+
+Run it from the repository root, with the stub server of the tests, with
+``PYTHONPATH=.:test python benchmarks/bench_upload.py [size in MiB] [chunk
+size in MiB]``. Each mode runs in its own process, so that its peak RSS is
+measured alone:
+
+- copy: the chunks are read, then copied into a BytesIO and encoded by
+  requests, as before memoryview uploads
+- stream: the chunks are read into a reused buffer and sent as memoryviews
+- mmap: the file is memory-mapped, and its slices are sent as memoryviews
+- pipelined: the chunks are read ahead while the previous one is being sent,
+  and their size is tuned from the throughput
+"""
+import io
+import mmap
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import mwklient
+from stub_server import StubHandler, serve
+
+MIB = 1024 * 1024
+
+SITEINFO = {
+    'general': {'generator': 'MediaWiki 1.34.0', 'writeapi': ''},
+    'namespaces': {'0': {'*': '', 'id': 0}, '6': {'*': 'File', 'id': 6}},
+    'userinfo': {'id': 1, 'name': 'Bench', 'groups': ['user'],
+                 'rights': ['read', 'edit', 'writeapi', 'upload']},
+    'tokens': {'csrftoken': 'csrf+\\'},
+    'pages': {'-1': {'ns': 6, 'title': 'File:Bench.bin', 'missing': ''}},
+}
+
+
+class UploadHandler(StubHandler):
+    """Answers every GET with the site information, and every POST as if
+    it were a chunk of the upload, whose size it does not check."""
+
+    def do_GET(self):
+        self.send_json(200, {'query': SITEINFO})
+
+    def do_POST(self):
+        remaining = int(self.headers.get('Content-Length', 0))
+        server = self.server
+        server.received += remaining
+        while remaining:
+            remaining -= len(self.rfile.read(min(remaining, MIB)))
+        # The chunks end with the file, and the size of the next ones is
+        # up to the client
+        self.send_json(200, {'upload': {'result': 'Continue',
+                                        'filekey': 'key',
+                                        'offset': server.received}})
+
+
+def upload_with_copies(site, path):
+    """The upload loop of `Site.chunk_upload()` before memoryview chunks."""
+    params = {'action': 'upload', 'format': 'json', 'stash': 1, 'offset': 0,
+              'filename': 'Bench.bin', 'filesize': os.path.getsize(path),
+              'token': 'csrf+\\'}
+    with open(path, 'rb') as fd:
+        while True:
+            data = fd.read(site.chunk_size)
+            if not data:
+                break
+            site.raw_call('api', params, files={'chunk': io.BytesIO(data)})
+
+
+def run(mode, path, port, chunk_size):
+    site = mwklient.Site('127.0.0.1:%d' % port, scheme='http')
+    site.chunk_size = chunk_size
+    site.max_chunk_size = 64 * MIB
+    start = time.perf_counter()
+    if mode == 'copy':
+        upload_with_copies(site, path)
+    elif mode == 'stream':
+        with open(path, 'rb') as fd:
+            site.chunk_upload(fd, 'Bench.bin', True, '', '')
+    elif mode == 'pipelined':
+        with open(path, 'rb') as fd:
+            site.chunk_upload(fd, 'Bench.bin', True, '', '', pipelined=True)
+    else:
+        with open(path, 'rb') as fd:
+            with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                site.chunk_upload(data, 'Bench.bin', True, '', '')
+    elapsed = time.perf_counter() - start
+    # KiB on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    size = os.path.getsize(path) / float(MIB)
+    print('{:<9} {:>8.1f} MiB/s {:>10.1f} MiB peak RSS'.format(
+        mode, size / elapsed, peak))
+
+
+def main(size, chunk_size):
+    fd, path = tempfile.mkstemp(suffix='.bin')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            block = os.urandom(MIB)
+            for _ in range(size):
+                out.write(block)
+
+        server = serve(None, UploadHandler)
+
+        print('{} MiB in chunks of {} MiB'.format(size, chunk_size // MIB))
+        for mode in ('copy', 'stream', 'mmap', 'pipelined'):
+            server.received = 0
+            subprocess.check_call([sys.executable, __file__, '--run', mode,
+                                   path, str(server.server_address[1]),
+                                   str(chunk_size)])
+        server.shutdown()
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--run']:
+        run(sys.argv[2], sys.argv[3], int(sys.argv[4]), int(sys.argv[5]))
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 2048,
+             int(sys.argv[2]) * MIB if len(sys.argv) > 2 else 64 * MIB)
@@ -0,0 +1,534 @@
+"""Asyncio flavour of :class:`mwklient.client.Site`.
+
+An `AsyncSite` exposes the same methods as `Site`, but the ones talking to
+the API are coroutines, so a single process can keep hundreds of requests in
+flight. It requires the optional `aiohttp` package.
+
+    >>> import asyncio
+    >>> from mwklient.asyncsite import AsyncSite
+    >>> async def main():
+    ...     async with AsyncSite('en.wikipedia.org') as site:
+    ...         page = await site.pages['Main Page']
+    ...         return await page.atext()
+    >>> text = asyncio.get_event_loop().run_until_complete(main())
+"""
+import asyncio
+import logging
+import time
+import six
+from six import text_type
+import requests
+from requests.auth import HTTPBasicAuth
+
+import mwklient.errors as errors
+import mwklient.image
+import mwklient.listing as listing
+import mwklient.stream
+from mwklient.client import Site
+from mwklient.util import batched, read_in_chunks
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+LOG = logging.getLogger(__name__)
+
+
+class AsyncPageList(listing.PageList):
+    """A `PageList` whose lookups are coroutines:
+
+        >>> page = await site.pages['Main Page']
+    """
+
+    async def get(self, name, info=()):
+        full_page_name, namespace = self.resolve(name)
+        cls = listing.page_class(namespace)
+        if not info:
+            info = await self.site.page_info(
+                full_page_name, imageinfo=cls is mwklient.image.Image)
+        return cls(self.site, full_page_name, info)
+
+
+class AsyncSite(Site):
+    """A MediaWiki site accessed through asyncio.
+
+    It accepts the same arguments as `Site` (except `pool` and the OAuth
+    ones), plus an optional `aiohttp.ClientSession` and the maximum number of
+    simultaneous connections. The site must be initialized from a coroutine,
+    either with ``await site.connect()`` or by using it as an asynchronous
+    context manager:
+
+        >>> async with AsyncSite('en.wikipedia.org') as site:
+        ...     async for page in site.allpages(limit=50):
+        ...         print(page.name)
+
+    Lists are iterated with ``async for``, and the asynchronous variants of
+    the page methods are prefixed with `a` (`Page.atext()`, `Page.aedit()`,
+    `Page.aredirects_to()`); the blocking ones raise TypeError. `texts()`,
+    `ask()` and `stream_api()` return asynchronous iterators. `bulk_edit()`,
+    `partitioned()` and `resume_upload()`, which rely on threads or on
+    blocking calls, are not available.
+
+    With a `siteinfo_cache`, the site information is read from the snapshot
+    when there is one, but the user information is still loaded when the
+    site is initialized.
+    """
+
+    def __init__(self, host, session=None, connections=100, do_init=True,
+                 **kwargs):
+        if aiohttp is None:
+            raise RuntimeError('AsyncSite requires the aiohttp package')
+        if kwargs.get('consumer_token') is not None:
+            raise RuntimeError('OAuth is not supported by AsyncSite')
+        if kwargs.get('userinfo_refresh', 'always') != 'always':
+            # The user state would have to be refreshed synchronously
+            raise RuntimeError('AsyncSite always refreshes the user info')
+        if kwargs.get('response_cache') is not None:
+            raise RuntimeError('The response cache is not supported by '
+                               'AsyncSite')
+        if kwargs.get('lag_control') is not None:
+            # It blocks the thread; `connections` limits the concurrency
+            raise RuntimeError('The lag controller is not supported by '
+                               'AsyncSite')
+
+        super(AsyncSite, self).__init__(host, do_init=False, **kwargs)
+        self.do_init = do_init
+        self.session = session
+        self.connections = connections
+
+        self.pages = AsyncPageList(self)
+        self.categories = AsyncPageList(self, namespace=14)
+        self.images = AsyncPageList(self, namespace=6)
+        self.Pages = self.pages
+        self.Categories = self.categories
+        self.Images = self.images
+
+    def __repr__(self):
+        return "<AsyncSite object '%s%s'>" % (self.host, self.path)
+
+    async def __aenter__(self):
+        if self.do_init and not self.initialized:
+            await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def connect(self):
+        """Initialize the site, as `Site()` does when `do_init` is True."""
+        try:
+            await self.site_init()
+        except errors.APIError as e:
+            self._site_init_failed(e)
+
+    async def close(self):
+        """Close the underlying HTTP session."""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _session(self):
+        if self.session is None:
+            auth = self.connection.auth
+            if isinstance(auth, HTTPBasicAuth):
+                auth = aiohttp.BasicAuth(auth.username, auth.password)
+            headers = dict(self.connection.headers)
+            headers.pop('Connection', None)
+            self.session = aiohttp.ClientSession(
+                auth=auth, headers=headers,
+                connector=aiohttp.TCPConnector(limit=self.connections),
+                timeout=aiohttp.ClientTimeout(total=self.requests['timeout']))
+        return self.session
+
+    async def site_init(self):
+        if self.initialized:
+            info = await self.get('query', meta='userinfo',
+                                  uiprop='groups|rights')
+            self._set_userinfo(info['query']['userinfo'])
+            self.tokens = {}
+            return
+
+        snapshot = None
+        if self.siteinfo_cache is not None:
+            snapshot = self.siteinfo_cache.get(self._script_url('api'))
+        if snapshot is not None:
+            # The user information cannot be loaded later, from the blocking
+            # properties reading it
+            info = await self.get('query', meta='userinfo',
+                                  uiprop='groups|rights', retry_on_error=False)
+            self._set_siteinfo(snapshot)
+            self._set_userinfo(info['query']['userinfo'])
+        else:
+            meta = await self.get('query', meta='siteinfo|userinfo',
+                                  siprop='general|namespaces',
+                                  uiprop='groups|rights', retry_on_error=False)
+            self._siteinfo_loaded(meta['query'])
+        self.initialized = True
+
+    def ensure_user_state(self):
+        # The user state is refreshed by every query of an AsyncSite
+        pass
+
+    async def get(self, action, *args, **kwargs):
+        return await self.api(action, 'GET', *args, **kwargs)
+
+    async def post(self, action, *args, **kwargs):
+        return await self.api(action, 'POST', *args, **kwargs)
+
+    async def api(self, action, http_method='POST', *args, **kwargs):
+        kwargs = self._api_kwargs(action, *args, **kwargs)
+        sleeper = self.sleepers.make(('api', dict(kwargs, action=action)))
+
+        while True:
+            info = await self.raw_api(action, http_method, **kwargs)
+            if not info:
+                info = {}
+            if self._check_api_result(info):
+                return info
+            await asyncio.sleep(sleeper.next_timeout())
+
+    @staticmethod
+    def _form_fields(data):
+        # aiohttp does not drop None values and only accepts strings
+        return [(k, text_type(v)) for k, v in six.iteritems(data)
+                if v is not None]
+
+    def _form_data(self, data, files):
+        form = aiohttp.FormData(self._form_fields(data))
+        for name, value in six.iteritems(files):
+            filename = name
+            if isinstance(value, tuple):
+                filename, value = value[:2]
+            form.add_field(name, value, filename=filename)
+        return form
+
+    async def raw_call(self, script, data, files=None, retry_on_error=True,
+                       http_method='POST', stream=False):
+        """Asynchronous version of `Site.raw_call()`, sharing its retry and
+        maxlag policy.
+
+        With `stream` set to True, the `aiohttp.ClientResponse` is returned
+        before its body is read, and must be released by the caller.
+        """
+        headers = self._request_headers()
+        sleeper = self.sleepers.make((script, data))
+        url = self._script_url(script)
+        session = self._session()
+        module = self._module_name(script, data)
+
+        while True:
+            try:
+                args = {'headers': headers}
+                if http_method == 'GET':
+                    args['params'] = self._form_fields(data)
+                elif files:
+                    args['data'] = self._form_data(data, files)
+                else:
+                    args['data'] = self._form_fields(data)
+
+                await asyncio.sleep(self.sleepers.gate.remaining())
+                start = time.perf_counter()
+                try:
+                    response = await session.request(http_method, url,
+                                                     **args)
+                except aiohttp.ClientConnectionError:
+                    self.metrics.record(
+                        module, requests=1, errors=1,
+                        http_time=time.perf_counter() - start)
+                    raise
+                if stream and response.status == 200:
+                    # Left for the AsyncAPIStream to read and count
+                    text = u''
+                    bytes_in = 0
+                else:
+                    async with response:
+                        text = await response.text()
+                        bytes_in = len(await response.read())
+                self.metrics.record(module, requests=1,
+                                    http_time=time.perf_counter() - start,
+                                    bytes_in=bytes_in)
+
+                def raise_for_status():
+                    if response.status >= 400:
+                        raise requests.exceptions.HTTPError(
+                            '%s Error: %s for url: %s' % (
+                                response.status, response.reason, url))
+
+                try:
+                    wait_time = self._check_response(
+                        response.status, response.headers, text,
+                        retry_on_error, raise_for_status)
+                except Exception:
+                    response.release()
+                    raise
+                if wait_time is None:
+                    return response if stream else text
+                response.release()
+                if wait_time:
+                    self.sleepers.gate.close(wait_time)
+                await asyncio.sleep(sleeper.next_timeout(wait_time))
+
+            except aiohttp.ClientConnectionError:
+                if not retry_on_error:
+                    raise
+                LOG.warning('Connection error. Retrying in a moment.')
+                await asyncio.sleep(sleeper.next_timeout())
+
+    async def raw_api(self, action, http_method='POST', *args, **kwargs):
+        """Send a call to the API."""
+        try:
+            retry_on_error = kwargs.pop('retry_on_error')
+        except KeyError:
+            retry_on_error = True
+        kwargs['action'] = action
+        kwargs['format'] = 'json'
+        kwargs.setdefault('maxlag', self.max_lag)
+        data = self._query_string(*args, **kwargs)
+        res = await self.raw_call('api', data, retry_on_error=retry_on_error,
+                                  http_method=http_method)
+        return self._decode_api_response(res)
+
+    def stream_api(self, action, member, http_method='GET', *args,
+                   **kwargs):
+        """Same as `Site.stream_api()`, but the returned
+        `mwklient.stream.AsyncAPIStream` is iterated with ``async for``."""
+        kwargs = self._api_kwargs(action, *args, **kwargs)
+        return mwklient.stream.AsyncAPIStream(self, action, member,
+                                              http_method, **kwargs)
+
+    async def raw_index(self, action, http_method='POST', *args, **kwargs):
+        """Sends a call to index.php rather than the API."""
+        kwargs['action'] = action
+        kwargs['maxlag'] = self.max_lag
+        data = self._query_string(*args, **kwargs)
+        return await self.raw_call('index', data, http_method=http_method)
+
+    def clear_cookies(self, name_part):
+        if self.session is not None:
+            self.session.cookie_jar.clear(lambda c: name_part in c.key)
+
+    async def page_info(self, name, imageinfo=False):
+        """Return the page info of the page `name` (a title or a page id), as
+        used to construct `Page` objects."""
+        kwargs = {'prop': 'info', 'inprop': 'protection'}
+        if imageinfo:
+            kwargs['prop'] = 'info|imageinfo'
+            kwargs['iiprop'] = ('timestamp|user|comment|url|size|sha1|'
+                                'metadata|archivename')
+        if isinstance(name, int):
+            kwargs['pageids'] = name
+        else:
+            kwargs['titles'] = name
+        info = await self.get('query', **kwargs)
+        return six.next(six.itervalues(info['query']['pages']))
+
+    async def login(self, username=None, password=None, cookies=None,
+                    domain=None):
+        if username and password:
+            self.credentials = (username, password, domain)
+        if cookies:
+            self._session().cookie_jar.update_cookies(cookies)
+
+        if self.credentials:
+            sleeper = self.sleepers.make()
+            kwargs = self._login_kwargs()
+
+            try:
+                kwargs['lgtoken'] = await self.get_token('login')
+            except (errors.APIError, KeyError):
+                LOG.debug(
+                    'Failed to get login token, MediaWiki is older than 1.27.')
+
+            while True:
+                login = await self.post('login', **kwargs)
+                wait_time = self._check_login(login, kwargs)
+                if wait_time is None:
+                    break
+                if wait_time:
+                    await asyncio.sleep(sleeper.next_timeout(wait_time))
+
+        await self.site_init()
+
+    async def email(self, user, text, subject, cc=False):
+        """Asynchronous version of `Site.email()`."""
+        token = await self.get_token('email')
+        try:
+            return await self.post('emailuser', target=user, subject=subject,
+                                   text=text, ccme=cc, token=token)
+        except errors.APIError as err:
+            raise self._email_error(user, err)
+
+    async def get_token(self, type_t, force=False, title=None):
+        type_t = self._token_type(type_t)
+
+        if self.tokens.get(type_t, '0') == '0' or force:
+            if self.version is None or self.version[:2] >= (1, 24):
+                info = await self.raw_api(
+                    'query', 'GET', meta='tokens', type=type_t)
+                self._check_api_result(info)
+                self.tokens[type_t] = info['query']['tokens']['%stoken' %
+                                                              type_t]
+            else:
+                if title is None:
+                    title = 'Test'
+                info = await self.post('query', titles=title,
+                                       prop='info', intoken=type_t)
+                for i in six.itervalues(info['query']['pages']):
+                    if i['title'] == title:
+                        self.tokens[type_t] = i['%stoken' % type_t]
+
+        return self.tokens[type_t]
+
+    async def _upload_request(self, params, files):
+        sleeper = self.sleepers.make()
+        while True:
+            data = await self.raw_call('api', params, files)
+            info = self._decode_api_response(data)
+            if not info:
+                info = {}
+            if self._check_api_result(info, kwargs=params):
+                return info.get('upload', {})
+            await asyncio.sleep(sleeper.next_timeout())
+
+    async def upload(self, file=None, filename=None, description='',
+                     ignore=False, url=None, filekey=None, comment=None):
+        """Asynchronous version of `Site.upload()`."""
+        self._check_upload_args(file, filename, filekey, url)
+
+        image = await self.images.get(filename)
+        if not image.can('upload'):
+            raise errors.InsufficientPermission(filename)
+
+        comment, text = self._upload_comment(description, comment)
+
+        if file:
+            if not hasattr(file, 'read'):
+                file = open(file, 'rb')
+
+            if self._needs_chunk_upload(file):
+                return await self.chunk_upload(file, filename, ignore,
+                                               comment, text)
+
+        token = await self.get_token('edit', title=image.name)
+        predata = self._upload_params(filename, comment, text, ignore, url,
+                                      filekey, token)
+        response = await self._upload_request(predata,
+                                              self._upload_files(file))
+        if file:
+            file.close()
+        return response
+
+    async def chunk_upload(self, file, filename, ignorewarnings, comment,
+                           text):
+        """Asynchronous version of `Site.chunk_upload()`."""
+        content_size = file.seek(0, 2)
+        file.seek(0)
+
+        token = await self.get_token('edit', title=filename)
+        params = self._chunk_upload_params(filename, content_size,
+                                           ignorewarnings, token)
+
+        offset = 0
+        for chunk in read_in_chunks(file, self.chunk_size):
+            response = await self._upload_request(params, {'chunk': chunk})
+
+            offset += chunk.tell()
+            chunk.close()
+            LOG.debug('%s: Uploaded %d of %d bytes',
+                      filename, offset, content_size)
+            if not self._chunk_uploaded(params, response):
+                file.close()
+                return response
+            if response['result'] == 'Success':
+                file.close()
+                break
+        return await self.post('upload', **self._chunk_commit_params(
+            params, comment, text))
+
+    def bulk_edit(self, *args, **kwargs):
+        raise TypeError('bulk_edit() is not available on an AsyncSite: '
+                        'gather Page.aedit() calls instead')
+
+    def partitioned(self, *args, **kwargs):
+        raise TypeError('partitioned() is not available on an AsyncSite')
+
+    def resume_upload(self, *args, **kwargs):
+        raise TypeError('resume_upload() is not available on an AsyncSite')
+
+    async def parse(self, text=None, title=None, page=None, prop=None,
+                    redirects=False, mobileformat=False, maxage=None):
+        """Asynchronous version of `Site.parse()`."""
+        kwargs = self._parse_kwargs(text, title, page, prop, redirects,
+                                    mobileformat, maxage)
+        if text is None:
+            result = await self.get('parse', **kwargs)
+        else:
+            result = await self.post('parse', **kwargs)
+        return result['parse']
+
+    async def revisions(self, revids,
+                        prop='ids|timestamp|flags|comment|user'):
+        kwargs = {
+            'prop': 'revisions',
+            'rvprop': prop,
+            'revids': '|'.join(map(text_type, revids))
+        }
+        return self._revisions_from(await self.get('query', **kwargs))
+
+    async def expandtemplates(self, text, title=None, generatexml=False):
+        kwargs = {}
+        if title is None:
+            kwargs['title'] = title
+        if generatexml:
+            kwargs['generatexml'] = '1'
+
+        result = await self.get('expandtemplates', text=text, **kwargs)
+        return self._expanded_text(result, generatexml)
+
+    async def texts(self, pages, slot='main', stream=False):
+        """Asynchronous version of `Site.texts()`, iterated with
+        ``async for``."""
+        for batch in batched(pages, self.titles_limit):
+            known, kwargs = self._texts_query(batch, slot)
+            done = set()
+            while True:
+                if stream and mwklient.stream.available():
+                    infos = self.stream_api('query', 'query.pages', 'GET',
+                                            **kwargs)
+                    async for info in infos:
+                        text = self._page_text(info, known, done, slot)
+                        if text is not None:
+                            yield text
+                    data = infos.result
+                else:
+                    data = await self.get('query', **kwargs)
+                    for info in six.itervalues(data.get('query', {})
+                                               .get('pages', {})):
+                        text = self._page_text(info, known, done, slot)
+                        if text is not None:
+                            yield text
+
+                if not data.get('continue'):
+                    break
+                kwargs.update(data['continue'])
+
+    async def ask(self, query, title=None):
+        """Asynchronous version of `Site.ask()`, iterated with
+        ``async for``."""
+        kwargs = {}
+        if title is None:
+            kwargs['title'] = title
+
+        sleeper = self.sleepers.make()
+        offset = 0
+        while offset is not None:
+            results = await self.raw_api(
+                'ask', 'GET', query=u'{query}|offset={offset}'.format(
+                    query=query, offset=offset), **kwargs)
+            if not self._check_api_result(results):
+                await asyncio.sleep(sleeper.next_timeout())
+                continue
+            offset = results.get('query-continue-offset')
+            for answer in self._ask_answers(results):
+                yield answer
@@ -0,0 +1,154 @@
+"""Concurrent edits of many pages, within the rate limits of the site.
+
+    >>> edits = ((title, new_text(title), 'Bot: cleanup') for title in titles)
+    >>> for res in site.bulk_edit(edits, concurrency=8):
+    ...     if res.error is not None:
+    ...         print(res.page, res.error)
+"""
+from collections import deque, namedtuple
+import concurrent.futures
+import logging
+import threading
+import time
+import six
+
+import mwklient.errors as errors
+from mwklient.throttle import TokenBucket
+
+LOG = logging.getLogger(__name__)
+
+# The outcome of one edit: `result` is the 'edit' member of the response,
+# or None if the edit failed with the exception `error`
+EditResult = namedtuple('EditResult', ['page', 'result', 'error'])
+
+
+class BulkEditor():
+    """Run edits concurrently, sharing one token and a rate limit.
+
+    Args:
+        site (Site): The site to edit
+        concurrency (int): The maximum number of edits in flight
+        rate (float): The number of edits allowed every `per` seconds. If
+            None, it is read from the rate limits of the current user
+            (``uiprop=ratelimits``), no limit applying if there is none.
+        per (float): See `rate`
+        burst (int): The number of edits that may be sent at once
+        max_retries (int): How many times an edit is retried after a
+            `ratelimited` error
+
+    Each time the API answers with a `ratelimited` error, the rate is lowered
+    (halved, or derived from the edits that succeeded during the last `per`
+    seconds when there was no limit) and the edit is retried.
+    """
+
+    def __init__(self, site, concurrency=4, rate=None, per=60.0, burst=1,
+                 max_retries=5):
+        self.site = site
+        self.concurrency = concurrency
+        self.per = per
+        self.max_retries = max_retries
+        if rate is None:
+            rate, per = self.user_ratelimit()
+        self.bucket = TokenBucket(rate, per, burst=burst)
+        self.lock = threading.Lock()
+        self.successes = deque()
+        self.slowed_down = 0
+
+    def user_ratelimit(self):
+        """Return the (hits, seconds) edit rate limit of the current user,
+        the most restrictive one if several apply, or (None, `per`)."""
+        info = self.site.get('query', meta='userinfo', uiprop='ratelimits')
+        userinfo = info.get('query', {}).get('userinfo', {})
+        limits = userinfo.get('ratelimits', {})
+        best = (None, self.per)
+        for limit in six.itervalues(limits.get('edit', {})):
+            rate = (limit['hits'], limit['seconds'])
+            if best[0] is None or (rate[0] / float(rate[1])
+                                   < best[0] / float(best[1])):
+                best = rate
+        return best
+
+    def ratelimited(self, started):
+        """Lower the rate after a `ratelimited` error, for an edit sent at
+        `started` (monotonic time)."""
+        with self.lock:
+            if started < self.slowed_down:
+                # Sent before the last slow down, which may be enough
+                return
+            self.slowed_down = time.monotonic()
+            if self.bucket.rate:
+                rate = self.bucket.rate * self.per / self.bucket.per / 2.0
+            else:
+                # There must be a limit about the number of edits that went
+                # through lately
+                self._forget_successes()
+                rate = len(self.successes) * 0.9
+            rate = max(rate, 1)
+        LOG.warning('Rate limited, slowing down to %.1f edits per %ds',
+                    rate, self.per)
+        self.bucket.set_rate(rate, self.per)
+        self.bucket.pause(self.bucket.interval)
+
+    def _forget_successes(self):
+        threshold = time.monotonic() - self.per
+        while self.successes and self.successes[0] < threshold:
+            self.successes.popleft()
+
+    def edit(self, page, text, summary, **kwargs):
+        """Edit a single page, waiting for the rate limit and retrying after
+        `ratelimited` errors.
+
+        Returns:
+            An `EditResult`.
+        """
+        try:
+            if isinstance(page, six.string_types):
+                page = self.site.pages[page]
+            for attempt in six.moves.range(self.max_retries + 1):
+                self.bucket.acquire()
+                started = time.monotonic()
+                try:
+                    result = page.edit(text, summary, **kwargs)
+                except errors.APIError as err:
+                    if (err.code != 'ratelimited'
+                            or attempt == self.max_retries):
+                        raise
+                    self.ratelimited(started)
+                else:
+                    with self.lock:
+                        self.successes.append(time.monotonic())
+                        self._forget_successes()
+                    return EditResult(page, result, None)
+        except Exception as err:  # pylint: disable=broad-except
+            return EditResult(page, None, err)
+
+    def run(self, edits, **kwargs):
+        """Run the edits described by `edits`, an iterable of
+        (page, text, summary) tuples, where page is a `Page` or a title.
+        The other arguments are passed to `Page.edit()`.
+
+        The edits are read from `edits` as the previous ones complete, so it
+        can be a generator of any length.
+
+        Returns:
+            A generator of `EditResult`, in the order the edits complete.
+        """
+        # Fetch the token once, before the workers need it
+        self.site.get_token('csrf')
+
+        edits = iter(edits)
+        with concurrent.futures.ThreadPoolExecutor(
+                self.concurrency) as executor:
+            pending = set()
+            while True:
+                for page, text, summary in edits:
+                    pending.add(executor.submit(self.edit, page, text,
+                                                summary, **kwargs))
+                    if len(pending) >= 2 * self.concurrency:
+                        break
+                if not pending:
+                    return
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
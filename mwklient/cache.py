@@ -0,0 +1,388 @@
+"""Caches sparing requests to the site.
+
+A `SiteinfoCache` keeps on-disk snapshots of the site information, so that a
+`Site` can start without querying the API:
+
+    >>> from mwklient.cache import SiteinfoCache
+    >>> cache = SiteinfoCache('/var/cache/mwklient', ttl=3600)
+    >>> site = mwklient.Site('en.wikipedia.org', siteinfo_cache=cache)
+
+A `MemoryCache` or a `DiskCache` keeps the responses to GET requests, which
+are reused while they are fresh and revalidated with conditional requests
+afterwards:
+
+    >>> from mwklient.cache import MemoryCache
+    >>> site = mwklient.Site('en.wikipedia.org', response_cache=MemoryCache())
+
+A `ContentCache` keeps the contents of revisions, shared by all the pages of
+a site.
+"""
+from collections import OrderedDict
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from mwklient.util import parse_timestamp
+
+LOG = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def write_json(path, obj):
+    """Write `obj` as JSON to `path`, atomically replacing the file, and
+    creating its directory if needed.
+
+    Returns:
+        The size of the file, in bytes.
+    """
+    directory = os.path.dirname(path) or os.curdir
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as tmp:
+            json.dump(obj, tmp)
+            size = tmp.tell()
+        os.replace(tmp_path, path)
+    except (IOError, OSError):
+        os.remove(tmp_path)
+        raise
+    return size
+
+
+def cache_control(headers):
+    """Return the directives of the Cache-Control header as a dict."""
+    directives = {}
+    for directive in headers.get('cache-control', '').split(','):
+        name, _, value = directive.strip().partition('=')
+        if name:
+            directives[name.lower()] = value.strip('"')
+    return directives
+
+
+def is_error(headers, text):
+    """Whether a response is an API error, which is never stored."""
+    return ('mediawiki-api-error' in headers
+            or text.lstrip()[:9] == '{"error":')
+
+
+def response_entry(headers, text, now=None):
+    """Return the cache entry of a response with the given headers and body,
+    or None if it must not be stored: an API error, a response marked
+    ``no-store``, or one that is already stale and cannot be revalidated.
+
+    An entry is a dict holding the body ('text'), the validators ('etag',
+    'last_modified') and the wall clock time until which the response is
+    fresh ('expires').
+    """
+    directives = cache_control(headers)
+    if 'no-store' in directives or is_error(headers, text):
+        return None
+    entry = {
+        'text': text,
+        'etag': headers.get('etag'),
+        'last_modified': headers.get('last-modified'),
+        'expires': freshness_deadline(headers, directives, now),
+    }
+    if (entry['etag'] is None and entry['last_modified'] is None
+            and entry['expires'] <= (now or time.time())):
+        # It could never be used
+        return None
+    return entry
+
+
+def freshness_deadline(headers, directives=None, now=None):
+    """Return the time until which a response may be used without being
+    revalidated, from its max-age and Age headers."""
+    if now is None:
+        now = time.time()
+    if directives is None:
+        directives = cache_control(headers)
+    if 'no-cache' in directives:
+        return now
+    try:
+        max_age = int(directives.get('max-age', 0))
+        age = int(headers.get('age', 0))
+    except ValueError:
+        return now
+    return now + max(max_age - age, 0)
+
+
+def conditional_headers(entry):
+    """Return the headers revalidating the cache entry `entry`."""
+    headers = {}
+    if entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+
+class MemoryCache():
+    """A least recently used cache of responses, kept in memory.
+
+    Args:
+        max_size (int): The maximum total size of the cached bodies, in
+            characters. The least recently used ones are evicted beyond it.
+    """
+
+    def __init__(self, max_size=32 * 1024 * 1024):
+        self.max_size = max_size
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return '<MemoryCache object, %d entries>' % len(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """Return the entry stored for `key`, or None."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        """Store `entry` for `key`, evicting the least recently used entries
+        if needed."""
+        size = len(entry['text'])
+        with self.lock:
+            self._pop(key)
+            if size > self.max_size:
+                return
+            self.entries[key] = entry
+            self.size += size
+            while self.size > self.max_size:
+                self._pop(next(iter(self.entries)))
+
+    def delete(self, key):
+        """Remove the entry of `key`, if any."""
+        with self.lock:
+            self._pop(key)
+
+    def _pop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry['text'])
+
+
+class DiskCache():
+    """A cache of responses stored as JSON files in a directory, which can be
+    shared by several processes.
+
+    Args:
+        directory (str): Where the responses are stored, created if needed.
+            Defaults to ~/.cache/mwklient/responses.
+        max_size (int): The maximum total size of the files, in bytes. The
+            least recently used ones are removed beyond it.
+    """
+
+    def __init__(self, directory=None, max_size=256 * 1024 * 1024):
+        if directory is None:
+            directory = os.path.join(os.path.expanduser('~'), '.cache',
+                                     'mwklient', 'responses')
+        self.directory = directory
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.size = sum(size for _, _, size in self._files())
+
+    def __repr__(self):
+        return "<DiskCache object '%s'>" % self.directory
+
+    def path(self, key):
+        """Return the path of the file of `key`."""
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest + '.json')
+
+    def _files(self):
+        """Yield the (last use, path, size) of the cached responses."""
+        try:
+            names = os.listdir(self.directory)
+        except (IOError, OSError):
+            return
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except (IOError, OSError):
+                continue
+            yield stat.st_mtime, path, stat.st_size
+
+    def get(self, key):
+        """Return the entry stored for `key`, or None."""
+        path = self.path(key)
+        try:
+            with open(path) as fd:
+                stored = json.load(fd)
+            # The modification time tells the least recently used files
+            os.utime(path, None)
+        except (IOError, OSError, ValueError):
+            return None
+        if stored.get('key') != key:
+            return None
+        return stored['entry']
+
+    def set(self, key, entry):
+        """Store `entry` for `key`, removing the least recently used files
+        if needed. Failures are logged and otherwise ignored."""
+        path = self.path(key)
+        with self.lock:
+            self._remove(path)
+            try:
+                self.size += write_json(path, {'key': key, 'entry': entry})
+            except (IOError, OSError) as err:
+                LOG.warning('Could not store the response: %s', err)
+                return
+            if self.size > self.max_size:
+                self._evict()
+
+    def delete(self, key):
+        """Remove the entry of `key`, if any."""
+        with self.lock:
+            self._remove(self.path(key))
+
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except (IOError, OSError):
+            return
+        self.size -= size
+
+    def _evict(self):
+        # Other processes may have added files, so recount them
+        files = sorted(self._files())
+        self.size = sum(size for _, _, size in files)
+        for _, path, _ in files:
+            if self.size <= self.max_size * 0.9:
+                break
+            self._remove(path)
+
+
+class ContentCache():
+    """A cache of page contents, shared by the pages of a site, keyed by
+    revision ID, slot, section and template expansion.
+
+    Revisions never change, so the entries are only evicted for space, by
+    `store`: a `MemoryCache` of `max_size` characters by default, or e.g. a
+    `DiskCache` to keep the contents between runs:
+
+        >>> cache = ContentCache(store=DiskCache('/var/cache/mwklient/text'))
+        >>> site = mwklient.Site('en.wikipedia.org', content_cache=cache)
+
+    The numbers of lookups that found an entry and that did not are counted
+    in `hits` and `misses`.
+    """
+
+    def __init__(self, max_size=16 * 1024 * 1024, store=None):
+        if store is None:
+            store = MemoryCache(max_size)
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return '<ContentCache object, %d hits, %d misses>' % (self.hits,
+                                                              self.misses)
+
+    @staticmethod
+    def key(revid, slot='main', section=None, expandtemplates=False):
+        return 'rev:{}:{}:{}:{}'.format(revid, slot, section,
+                                        int(bool(expandtemplates)))
+
+    def get(self, revid, slot='main', section=None, expandtemplates=False):
+        """Return the (text, timestamp) of a revision, or None."""
+        entry = self.store.get(self.key(revid, slot, section,
+                                        expandtemplates))
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        timestamp = entry['timestamp']
+        if timestamp is not None:
+            timestamp = parse_timestamp(timestamp)
+        return entry['text'], timestamp
+
+    def set(self, revid, slot, section, expandtemplates, text, timestamp):
+        """Store the text of a revision, and its timestamp (a
+        `time.struct_time`)."""
+        if isinstance(timestamp, time.struct_time):
+            timestamp = time.strftime(TIMESTAMP_FORMAT, timestamp)
+        self.store.set(self.key(revid, slot, section, expandtemplates),
+                       {'text': text, 'timestamp': timestamp})
+
+
+class SiteinfoCache():
+    """A directory of site information snapshots (the 'general' and
+    'namespaces' members of the siteinfo), one JSON file per site.
+
+    Args:
+        directory (str): Where the snapshots are stored, created if needed.
+            Defaults to ~/.cache/mwklient.
+        ttl (int): Number of seconds after which a snapshot is ignored.
+    """
+
+    def __init__(self, directory=None, ttl=86400):
+        if directory is None:
+            directory = os.path.join(os.path.expanduser('~'), '.cache',
+                                     'mwklient')
+        self.directory = directory
+        self.ttl = ttl
+
+    def __repr__(self):
+        return "<SiteinfoCache object '%s'>" % self.directory
+
+    def path(self, key):
+        """Return the path of the snapshot of `key`."""
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest + '.json')
+
+    def get(self, key):
+        """Return the snapshot stored for `key`, or None if there is none or
+        if it is older than `ttl`."""
+        try:
+            with open(self.path(key)) as fd:
+                snapshot = json.load(fd)
+        except (IOError, OSError, ValueError):
+            return None
+
+        if snapshot.get('key') != key:
+            return None
+        if time.time() - snapshot.get('time', 0) > self.ttl:
+            return None
+        return snapshot.get('siteinfo')
+
+    def set(self, key, siteinfo):
+        """Store the snapshot `siteinfo` for `key`.
+
+        The file is replaced atomically, so that concurrent processes never
+        read a partial snapshot. Failures are logged and otherwise ignored.
+        """
+        snapshot = {'key': key, 'time': time.time(), 'siteinfo': siteinfo}
+        try:
+            write_json(self.path(key), snapshot)
+        except (IOError, OSError) as err:
+            LOG.warning('Could not store the siteinfo snapshot: %s', err)
+
+    def delete(self, key):
+        """Remove the snapshot of `key`, if any."""
+        try:
+            os.remove(self.path(key))
+        except (IOError, OSError):
+            pass
@@ -1,24 +1,35 @@
 # encoding=utf-8
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
 import logging
+import threading
+import time
+import warnings
 import six
 from six import text_type
+from six.moves.urllib.parse import urlencode
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth, AuthBase
+from requests.structures import CaseInsensitiveDict
 from requests_oauthlib import OAuth1
 
+import mwklient.bulk
+import mwklient.cache
+import mwklient.coalesce
+import mwklient.metrics
 import mwklient.errors as errors
 import mwklient.listing as listing
+import mwklient.page
+import mwklient.partition
+import mwklient.upload
+import mwklient.stream
+import mwklient.sleep
 from mwklient.sleep import Sleepers
-from mwklient.util import parse_timestamp, read_in_chunks
+from mwklient.util import parse_timestamp, batched
 from mwklient.util import version_tuple_from_generator
+from mwklient.util import get_json_decoder
 
 
-try:
-    import json
-except ImportError:
-    import simplejson as json
-
 try:
     import gzip
 except ImportError:
@@ -31,6 +42,13 @@ LOG = logging.getLogger(__name__)
 USER_AGENT = 'mwklient/{} ({})'.format(__version__,
                                        'https://github.com/lrusso96/mwklient')
 
+# The API actions that never change anything, see `Site.coalesce`
+READ_ACTIONS = {'query', 'parse', 'expandtemplates', 'compare', 'opensearch',
+                'paraminfo', 'help'}
+
+# The state of the current user, updated from the responses to queries
+UserState = namedtuple('UserState', ['blocked', 'hasmsg', 'logged_in'])
+
 
 class Site():
     """A MediaWiki site identified by its hostname.
@@ -49,6 +67,74 @@ class Site():
     >>> site = Site('vim.wikia.com', path='/')
     >>> site = Site('sourceforge.net', path='/apps/mediawiki/mwknt')
 
+    The API responses are decoded into plain dicts by the standard `json`
+    module (into OrderedDict objects before Python 3.7). Another decoder can
+    be given with `json_decoder`, either by name ('json', 'ordered',
+    'orjson', 'ujson' or 'auto') or as a function, see
+    `mwklient.util.get_json_decoder()`:
+
+    >>> site = Site('en.wikipedia.org', json_decoder='auto')
+
+    A site can be shared by several threads. `pool_size` is the maximum
+    number of connections kept open to the server, and should be at least the
+    number of threads. Tokens are only fetched once when several threads
+    need them at the same time, and the user state (`blocked`, `hasmsg`,
+    `logged_in`) is replaced as a whole by each response that carries it, see
+    `user_state`. Lists and their iterators must not be shared.
+
+    Every query also asks for the state of the current user (`blocked`,
+    `hasmsg`, `logged_in`). For read-heavy workloads, `userinfo_refresh`
+    can be set to a number of seconds, to only ask for it once in a while,
+    or to 'writes', to only ask for it before edits, moves, deletions and
+    uploads, when the known state is older than `userinfo_max_age` seconds
+    (60 by default). Single calls can force or skip it with the
+    `refresh_userinfo` argument of `api()`, `get()` and `post()`.
+
+    With a `mwklient.cache.SiteinfoCache` as `siteinfo_cache`, the site
+    starts from a snapshot of the site information when one is available,
+    without querying the API. The snapshot and the user information are
+    then loaded together the first time the user information (`rights`,
+    `groups` or `username`) is needed, e.g. before the first edit.
+
+    With a `mwklient.cache.MemoryCache` or a `mwklient.cache.DiskCache` as
+    `response_cache`, the responses to GET requests are kept while they are
+    fresh according to their Cache-Control header, and revalidated with
+    conditional requests when they carry an ETag or a Last-Modified header.
+    POST requests, requests involving tokens or the user information, and
+    API errors bypass the cache. api.php responses are only fresh when asked
+    for with a `maxage` parameter, and queries only leave the user
+    information out with `userinfo_refresh` set to 'writes' or to a number
+    of seconds: without both, the cache spares nothing.
+
+    When several threads make the same read-only API call at the same time
+    (a query, parse, expandtemplates... without token), only one request is
+    sent, and its decoded response is shared by all of them: it must not be
+    modified. `flights.calls` and `flights.saved` count the calls and the
+    requests spared. Set `coalesce` to False to disable this.
+
+    Failed requests are retried up to `max_retries` times, waiting
+    `retry_timeout` seconds more at each retry, or as long as the `backoff`
+    policy says (see `mwklient.sleep.ExponentialBackoff` and
+    `mwklient.sleep.DecorrelatedJitter`). With a `deadline`, an operation
+    never retries for more than that many seconds. When the server reports
+    a database lag, every thread using the site waits before its next
+    request; sites sharing a `mwklient.sleep.BackoffGate` as `backoff_gate`
+    wait together.
+
+    Every request carries `max_lag`, so that the server refuses it while its
+    replication lag is higher (None does not send it). A
+    `mwklient.throttle.LagController` as `lag_control` adapts the number of
+    concurrent requests and their pacing to the lag reported.
+
+    The requests are counted and timed by module in `metrics`, a
+    `mwklient.metrics.Metrics` that can be shared by several sites, see
+    `metrics.snapshot()`.
+
+    The contents read by `Page.text()` are kept in `content_cache`, by
+    revision, so that all the pages of the site share them. It is a
+    `mwklient.cache.ContentCache` of 16 MiB by default, and can be disabled
+    with False.
+
     """
     api_limit = 500
 
@@ -58,18 +144,44 @@ class Site():
                  max_lag=3, compress=True, force_login=True, do_init=True,
                  httpauth=None, reqs=None, consumer_token=None,
                  consumer_secret=None, access_token=None, access_secret=None,
-                 client_certificate=None, custom_headers=None, scheme='https'):
+                 client_certificate=None, custom_headers=None, scheme='https',
+                 json_decoder=None, siteinfo_cache=None, pool_size=10,
+                 userinfo_refresh='always', response_cache=None,
+                 content_cache=None, coalesce=True, backoff=None,
+                 deadline=None, backoff_gate=None, lag_control=None,
+                 metrics=None):
         # Setup member variables
         self.host = host
         self.path = path
         self.ext = ext
         self.credentials = None
         self.compress = compress
-        self.max_lag = text_type(max_lag)
+        self.max_lag = None if max_lag is None else text_type(max_lag)
+        self.lag_control = lag_control
         self.force_login = force_login
-        self.logged_in = False
         self.requests = reqs or {}
         self.scheme = scheme
+        self.decode_json = get_json_decoder(json_decoder)
+        self.siteinfo_cache = siteinfo_cache
+        self.response_cache = response_cache
+        if content_cache is None:
+            content_cache = mwklient.cache.ContentCache()
+        # The contents of revisions, shared by the pages (False disables it)
+        self.content_cache = content_cache or None
+        self.coalesce = coalesce
+        self.flights = mwklient.coalesce.SingleFlight()
+        if (userinfo_refresh not in {'always', 'writes'}
+                and not isinstance(userinfo_refresh, (int, float))):
+            raise RuntimeError(
+                'userinfo_refresh must be "always", "writes" or a number')
+        self.userinfo_refresh = userinfo_refresh
+        if response_cache is not None and userinfo_refresh == 'always':
+            LOG.warning('The queries ask for the user information, and '
+                        'bypass the response cache, unless userinfo_refresh '
+                        'is "writes" or a number of seconds')
+        self.userinfo_max_age = 60
+        # Monotonic time of the last update of the user state
+        self.userinfo_time = None
         if 'timeout' not in self.requests:
             self.requests['timeout'] = 30  # seconds
 
@@ -84,15 +196,27 @@ class Site():
             raise RuntimeError(
                 'Authentication is not a tuple or an instance of AuthBase')
 
-        self.sleepers = Sleepers(max_retries, retry_timeout, wait_callback)
+        self.metrics = metrics or mwklient.metrics.Metrics()
+        self.wait_callback = wait_callback
+        self.sleepers = Sleepers(max_retries, retry_timeout, self._on_retry,
+                                 backoff=backoff, deadline=deadline,
+                                 gate=backoff_gate)
 
         # Site properties
-        self.blocked = False    # Whether current user is blocked
-        self.hasmsg = False  # Whether current user has new messages
-        self.groups = []    # Groups current user belongs to
-        self.rights = []    # Rights current user has
+        self.user_state = UserState(blocked=False, hasmsg=False,
+                                    logged_in=False)
+        self._state_lock = threading.Lock()
+        self._token_lock = threading.RLock()
+        self._siteinfo_lock = threading.RLock()
+        self._username = None
+        self._groups = []
+        self._rights = []
         self.tokens = {}    # Edit tokens of the current user
         self.version = None
+        self.site = None    # The general site information
+        # Whether the site was initialized from a snapshot, and the user
+        # information is still to be loaded
+        self.from_snapshot = False
 
         self.namespaces = self.default_namespaces
         self.writeapi = False
@@ -113,6 +237,11 @@ class Site():
 
             if custom_headers:
                 self.connection.headers.update(custom_headers)
+
+            adapter = HTTPAdapter(pool_connections=pool_size,
+                                  pool_maxsize=pool_size)
+            self.connection.mount('https://', adapter)
+            self.connection.mount('http://', adapter)
         else:
             self.connection = pool
 
@@ -131,38 +260,83 @@ class Site():
 
         # Upload chunk size in bytes
         self.chunk_size = 1048576
+        # Largest chunk of a pipelined upload: PHP refuses files larger than
+        # upload_max_filesize, 2 MiB by default
+        self.max_chunk_size = 2097152
+        # Maximum number of status polls of an asynchronous upload
+        self.max_upload_polls = 120
 
         if do_init:
             try:
                 self.site_init()
             except errors.APIError as e:
-                if e.args[0] == 'mwoauth-invalid-authorization':
-                    raise errors.OAuthAuthorizationError(self, e.code, e.info)
+                self._site_init_failed(e)
 
-                # Private wiki, do init after login
-                if e.args[0] not in {u'unknown_action', u'readapidenied'}:
-                    raise
+    def _site_init_failed(self, e):
+        if e.args[0] == 'mwoauth-invalid-authorization':
+            raise errors.OAuthAuthorizationError(self, e.code, e.info)
+
+        # Private wiki, do init after login
+        if e.args[0] not in {u'unknown_action', u'readapidenied'}:
+            raise e
 
     def site_init(self):
 
         if self.initialized:
-            info = self.get('query', meta='userinfo', uiprop='groups|rights')
-            userinfo = info['query']['userinfo']
-            self.username = userinfo['name']
-            self.groups = userinfo.get('groups', [])
-            self.rights = userinfo.get('rights', [])
+            if self.from_snapshot:
+                self._load_siteinfo()
+            else:
+                info = self.get('query', meta='userinfo',
+                                uiprop='groups|rights')
+                self._set_userinfo(info['query']['userinfo'])
             self.tokens = {}
             return
 
+        snapshot = None
+        if self.siteinfo_cache is not None:
+            snapshot = self.siteinfo_cache.get(self._script_url('api'))
+        if snapshot is not None:
+            self._set_siteinfo(snapshot)
+            self.from_snapshot = True
+        else:
+            self._load_siteinfo(retry_on_error=False)
+        self.initialized = True
+
+    def _load_siteinfo(self, **kwargs):
+        """Query the site and user information, and store the site
+        information in the snapshot cache, if any."""
         meta = self.get('query', meta='siteinfo|userinfo',
                         siprop='general|namespaces', uiprop='groups|rights',
-                        retry_on_error=False)
-
+                        **kwargs)
+        self._siteinfo_loaded(meta['query'])
+
+    def _siteinfo_loaded(self, query):
+        """Set the site and user information loaded by `_load_siteinfo()`,
+        and store the site information in the snapshot cache, if any."""
+        self.from_snapshot = False
+        self._set_siteinfo(query)
+        self._set_userinfo(query['userinfo'])
+        if self.siteinfo_cache is not None:
+            self.siteinfo_cache.set(self._script_url('api'), {
+                'general': query['general'],
+                'namespaces': query['namespaces'],
+            })
+
+    def _revalidate(self):
+        """Replace the snapshot the site was initialized from by the actual
+        site information, loading the user information along."""
+        if self.from_snapshot:
+            with self._siteinfo_lock:
+                # Another thread may have done it in the meantime
+                if self.from_snapshot:
+                    self._load_siteinfo()
+
+    def _set_siteinfo(self, meta):
         # Extract site info
-        self.site = meta['query']['general']
+        self.site = meta['general']
         self.namespaces = {
             namespace['id']: namespace.get('*', '')
-            for namespace in six.itervalues(meta['query']['namespaces'])
+            for namespace in six.itervalues(meta['namespaces'])
         }
         self.writeapi = 'writeapi' in self.site
 
@@ -172,12 +346,73 @@ class Site():
         # Require MediaWiki version >= 1.16
         self.require(1, 16)
 
-        # User info
-        userinfo = meta['query']['userinfo']
-        self.username = userinfo['name']
-        self.groups = userinfo.get('groups', [])
-        self.rights = userinfo.get('rights', [])
-        self.initialized = True
+    def _set_userinfo(self, userinfo):
+        with self._state_lock:
+            self._username = userinfo['name']
+            self._groups = userinfo.get('groups', [])
+            self._rights = userinfo.get('rights', [])
+
+    def _update_user_state(self, **changes):
+        with self._state_lock:
+            self.user_state = self.user_state._replace(**changes)
+
+    @property
+    def blocked(self):
+        """False, or a (blocked by, reason) tuple if the current user is
+        blocked."""
+        return self.user_state.blocked
+
+    @blocked.setter
+    def blocked(self, blocked):
+        self._update_user_state(blocked=blocked)
+
+    @property
+    def hasmsg(self):
+        """Whether the current user has new messages."""
+        return self.user_state.hasmsg
+
+    @hasmsg.setter
+    def hasmsg(self, hasmsg):
+        self._update_user_state(hasmsg=hasmsg)
+
+    @property
+    def logged_in(self):
+        """Whether the current user is logged in."""
+        return self.user_state.logged_in
+
+    @logged_in.setter
+    def logged_in(self, logged_in):
+        self._update_user_state(logged_in=logged_in)
+
+    @property
+    def username(self):
+        """Name of the current user."""
+        self._revalidate()
+        return self._username
+
+    @username.setter
+    def username(self, username):
+        self._username = username
+
+    @property
+    def groups(self):
+        """Groups the current user belongs to."""
+        self._revalidate()
+        return self._groups
+
+    @groups.setter
+    def groups(self, groups):
+        self._groups = groups
+
+    @property
+    def rights(self):
+        """Rights the current user has."""
+        self._revalidate()
+        return self._rights
+
+    @rights.setter
+    def rights(self, rights):
+        self._rights = rights
 
     default_namespaces = {
         0: u'', 1: u'Talk', 2: u'User', 3: u'User talk', 4: u'Project',
@@ -190,6 +425,14 @@ class Site():
     def __repr__(self):
         return "<Site object '%s%s'>" % (self.host, self.path)
 
+    @property
+    def titles_limit(self):
+        """The maximum number of titles or ids accepted by a single query:
+        50, or 500 for users with the `apihighlimits` right."""
+        if 'apihighlimits' in self.rights:
+            return 500
+        return 50
+
     def get(self, action, *args, **kwargs):
         """Perform a generic API call using GET.
 
@@ -235,44 +478,141 @@ class Site():
         Returns:
             The raw response from the API call, as a dictionary.
         """
+        kwargs = self._api_kwargs(action, *args, **kwargs)
+        sleeper = self.sleepers.make(('api', dict(kwargs, action=action)))
+
+        while True:
+            info = self.raw_api(action, http_method, **kwargs)
+            if not info:
+                info = {}
+            if self.handle_api_result(info, sleeper=sleeper):
+                return info
+
+    def stream_api(self, action, member, http_method='GET', *args,
+                   **kwargs):
+        """Perform an API call, yielding the items of one member of the
+        response while it is being downloaded.
+
+        This keeps the memory usage flat for large responses (page contents,
+        lists fetched with high limits) and hands over the first items
+        sooner. It requires the `ijson` package.
+
+        Example:
+            >>> stream = site.stream_api('query', 'query.pages',
+            ...                          titles='Oslo|Copenhagen',
+            ...                          prop='revisions', rvprop='content')
+            >>> for page in stream:
+            ...     print(page['title'])
+            >>> 'batchcomplete' in stream.result
+            True
+
+        Args:
+            action (str): The API action
+            member (str): The dotted path to the array or object of the
+                response whose items are yielded, '*' standing for any key
+            http_method (str): The HTTP method, defaults to 'GET'
+
+        Returns:
+            An iterable `mwklient.stream.APIStream`. Once the iteration is
+            over, its `result` attribute holds the rest of the response.
+        """
+        kwargs = self._api_kwargs(action, *args, **kwargs)
+        return mwklient.stream.APIStream(self, action, member, http_method,
+                                         **kwargs)
+
+    def _api_kwargs(self, action, *args, **kwargs):
+        """Return the parameters `api()` sends for `action`.
+
+        Queries always use new style continuation and, depending on
+        `userinfo_refresh` or on the `refresh_userinfo` argument, piggy-back
+        the user info needed to keep `blocked`, `hasmsg` and `logged_in`
+        fresh. Callers reading ``query.userinfo`` from the response must ask
+        for ``meta='userinfo'`` themselves.
+        """
         kwargs.update(args)
+        refresh = kwargs.pop('refresh_userinfo', None)
 
         if action == 'query' and 'continue' not in kwargs:
             kwargs['continue'] = ''
-        if action == 'query':
+        if action != 'query':
+            return kwargs
+
+        meta = kwargs.get('meta', '').split('|')
+        if refresh is None:
+            refresh = self._userinfo_due()
+        if refresh and 'userinfo' not in meta:
             if 'meta' in kwargs:
                 kwargs['meta'] += '|userinfo'
             else:
                 kwargs['meta'] = 'userinfo'
-            if 'uiprop' in kwargs:
-                kwargs['uiprop'] += '|blockinfo|hasmsg'
-            else:
-                kwargs['uiprop'] = 'blockinfo|hasmsg'
+        elif 'userinfo' not in meta:
+            return kwargs
 
-        sleeper = self.sleepers.make()
+        if 'uiprop' in kwargs:
+            kwargs['uiprop'] += '|blockinfo|hasmsg'
+        else:
+            kwargs['uiprop'] = 'blockinfo|hasmsg'
+        return kwargs
+
+    def _userinfo_due(self):
+        """Whether the next query should piggy-back the user info."""
+        if self.userinfo_refresh == 'always':
+            return True
+        if self.userinfo_refresh == 'writes':
+            return False
+        return (self.userinfo_time is None or time.monotonic()
+                - self.userinfo_time >= self.userinfo_refresh)
 
-        while True:
-            info = self.raw_api(action, http_method, **kwargs)
-            if not info:
-                info = {}
-            if self.handle_api_result(info, sleeper=sleeper):
-                return info
+    def ensure_user_state(self):
+        """Refresh `blocked`, `hasmsg` and `logged_in` before a write, unless
+        they are recent enough for `userinfo_refresh`."""
+        if self.userinfo_refresh == 'always':
+            return
+        if self.userinfo_refresh == 'writes':
+            max_age = self.userinfo_max_age
+        else:
+            max_age = self.userinfo_refresh
+        if (self.userinfo_time is None
+                or time.monotonic() - self.userinfo_time >= max_age):
+            self.get('query', meta='userinfo')
 
     def handle_api_result(self, info, kwargs=None, sleeper=None):
+        """Update the user state from an API response and check it for errors.
+
+        Returns:
+            True if the response can be used, False if the request should be
+            retried (after the sleeper has waited).
+
+        Raises:
+            APIError: The API returned a non-recoverable error.
+        """
         if sleeper is None:
             sleeper = self.sleepers.make()
 
+        if self._check_api_result(info, kwargs):
+            return True
+        sleeper.sleep()
+        return False
+
+    def _check_api_result(self, info, kwargs=None):
+        """Same as `handle_api_result()`, but never sleeps: it is up to the
+        caller to wait before retrying when False is returned."""
         try:
             userinfo = info['query']['userinfo']
         except KeyError:
-            userinfo = ()
-        if 'blockedby' in userinfo:
-            self.blocked = (userinfo['blockedby'],
-                            userinfo.get('blockreason', u''))
-        else:
-            self.blocked = False
-        self.hasmsg = 'messages' in userinfo
-        self.logged_in = 'anon' not in userinfo
+            userinfo = None
+        if userinfo is not None:
+            if 'blockedby' in userinfo:
+                blocked = (userinfo['blockedby'],
+                           userinfo.get('blockreason', u''))
+            else:
+                blocked = False
+            # A single assignment, so that other threads never see the
+            # state of different responses mixed up
+            self.user_state = UserState(blocked=blocked,
+                                        hasmsg='messages' in userinfo,
+                                        logged_in='anon' not in userinfo)
+            self.userinfo_time = time.monotonic()
         if 'warnings' in info:
             for _, warning in info['warnings'].items():
                 if '*' in warning:
@@ -282,7 +622,6 @@ class Site():
             error_code = info['error'].get('code')
             if error_code in {u'internal_api_error_DBConnectionError',
                               u'internal_api_error_DBQueryError'}:
-                sleeper.sleep()
                 return False
 
             # cope with https://phabricator.wikimedia.org/T106066
@@ -293,7 +632,6 @@ class Site():
                 LOG.warning(
                     'retrying due to nonce error '
                     'https://phabricator.wikimedia.org/T106066')
-                sleeper.sleep()
                 return False
 
             if 'query' in info['error']:
@@ -317,8 +655,62 @@ class Site():
             kwargs) if k in {'wpEditToken', 'token'}]
         return OrderedDict(qs1 + qs2)
 
+    def _request_headers(self):
+        headers = {}
+        if self.compress and gzip:
+            headers['Accept-Encoding'] = 'gzip'
+        return headers
+
+    def _script_url(self, script):
+        scheme = self.scheme
+        host = self.host
+        if isinstance(host, (list, tuple)):
+            msg = 'Specifying host as tuple is deprecated: use scheme arg.'
+            warnings.warn(msg, DeprecationWarning)  # noqa
+            scheme, host = host
+
+        return '{scheme}://{host}{path}{script}{ext}'.format(
+            scheme=scheme, host=host, path=self.path, script=script,
+            ext=self.ext)
+
+    @staticmethod
+    def _check_response(status_code, headers, text, retry_on_error,
+                        raise_for_status):
+        """Decide what to do with an HTTP response.
+
+        This holds the maxlag and retry policy of `raw_call()`, independently
+        of the HTTP client that produced the response.
+
+        Args:
+            status_code (int): The HTTP status code
+            headers (dict): The (case insensitive) response headers
+            text (str): The response body, only used for logging
+            retry_on_error (bool): Retry on 5XX responses
+            raise_for_status (callable): Raises the HTTP error of the response
+
+        Returns:
+            None if the response body can be used, otherwise the minimum
+            number of seconds to wait before retrying.
+        """
+        if headers.get('x-database-lag'):
+            wait_time = int(headers.get('retry-after'))
+            LOG.warning(
+                'Database lag exceeds max lag. Waiting for %d seconds',
+                wait_time)
+            return wait_time
+        if status_code == 200:
+            return None
+        if status_code < 500 or status_code > 599:
+            raise_for_status()
+        elif not retry_on_error:
+            raise_for_status()
+        else:
+            msg = 'Received %s response: %s. Retrying in a moment.'
+            LOG.warning(msg, status_code, text)
+        return 0
+
     def raw_call(self, script, data, files=None, retry_on_error=True,
-                 http_method='POST'):
+                 http_method='POST', stream=False):
         """
         Perform a generic request and return the raw text.
 
@@ -336,25 +728,44 @@ class Site():
             files (dict): Files to upload
             retry_on_error (bool): Retry on connection error
             http_method (str): The HTTP method, defaults to 'POST'
+            stream (bool): Do not read the response body
+
+        GET requests go through the `response_cache` of the site, if any.
 
         Returns:
-            The raw text response.
+            The raw text response, or the `requests.Response` whose body has
+            not been read yet if `stream` is True.
         """
-        headers = {}
-        if self.compress and gzip:
-            headers['Accept-Encoding'] = 'gzip'
+        module = self._module_name(script, data)
+        with self.metrics.span('raw_call', module=module,
+                               method=http_method):
+            return self._raw_call(script, data, files, retry_on_error,
+                                  http_method, stream, module)
+
+    def _raw_call(self, script, data, files, retry_on_error, http_method,
+                  stream, module):
+        headers = self._request_headers()
         sleeper = self.sleepers.make((script, data))
-
-        scheme = self.scheme
-        host = self.host
-        if isinstance(host, (list, tuple)):
-            msg = 'Specifying host as tuple is deprecated: use scheme arg.'
-            warnings.warn(msg, DeprecationWarning)  # noqa
-            scheme, host = host
-
-        url = '{scheme}://{host}{path}{script}{ext}'.format(
-            scheme=scheme, host=host, path=self.path, script=script,
-            ext=self.ext)
+        url = self._script_url(script)
+
+        body = None
+        if files and mwklient.upload.has_buffers(files):
+            # Sent without copying the buffers
+            body = mwklient.upload.MultipartBody(data, files)
+            headers['Content-Type'] = body.content_type
+            files = None
+        # The streams to rewind before sending them again
+        streams = mwklient.upload.positions(files)
+
+        cache_key = entry = None
+        if http_method == 'GET' and not files and not stream:
+            cache_key = self._cache_key(url, data)
+        if cache_key is not None:
+            entry = self.response_cache.get(cache_key)
+            if entry is not None:
+                if entry['expires'] > time.time():
+                    return entry['text']
+                headers.update(mwklient.cache.conditional_headers(entry))
 
         while True:
             try:
@@ -363,27 +774,38 @@ class Site():
                     args[k] = v
                 if http_method == 'GET':
                     args['params'] = data
+                elif body is not None:
+                    args['data'] = body
                 else:
                     args['data'] = data
-
-                stream = self.connection.request(http_method, url, **args)
-
-                if stream.headers.get('x-database-lag'):
-                    wait_time = int(stream.headers.get('retry-after'))
-                    LOG.warning(
-                        'Database lag exceeds max lag. Waiting for %d seconds',
-                        wait_time)
-                    sleeper.sleep(wait_time)
-                elif stream.status_code == 200:
-                    return stream.text
-                elif stream.status_code < 500 or stream.status_code > 599:
-                    stream.raise_for_status()
+                if stream:
+                    args['stream'] = True
+
+                mwklient.upload.rewind(streams)
+                self.sleepers.gate.wait()
+                response = self._send(http_method, url, args, module)
+
+                if response.status_code == 304 and entry is not None:
+                    return self._revalidated(cache_key, entry,
+                                             response.headers)
+                if stream and response.status_code == 200:
+                    text = u''  # Left for the caller to read
                 else:
-                    if not retry_on_error:
-                        stream.raise_for_status()
-                    msg = 'Received %s response: %s. Retrying in a moment.'
-                    LOG.warning(msg, stream.status_code, stream.text)
-                    sleeper.sleep()
+                    text = response.text
+                wait_time = self._check_response(
+                    response.status_code, response.headers, text,
+                    retry_on_error, response.raise_for_status)
+                if wait_time is None:
+                    if cache_key is not None:
+                        self._store_response(cache_key, response.headers,
+                                             text)
+                    return response if stream else text
+                response.close()
+                if wait_time:
+                    # Only the database lag asks for a wait: pause the other
+                    # threads as well
+                    self.sleepers.gate.close(wait_time)
+                sleeper.sleep(wait_time)
 
             except requests.exceptions.ConnectionError:
                 # In the event of a network problem
@@ -394,6 +816,103 @@ class Site():
                 LOG.warning('Connection error. Retrying in a moment.')
                 sleeper.sleep()
 
+    def _send(self, http_method, url, args, module):
+        """Send a request, within the limits of `lag_control` if any, and
+        record it in the metrics of `module`."""
+        lag_control = self.lag_control
+        if lag_control is not None:
+            lag_control.acquire()
+        response = lag = retry_after = None
+        start = time.perf_counter()
+        try:
+            response = self.connection.request(http_method, url, **args)
+            lag = response.headers.get('x-database-lag')
+            retry_after = response.headers.get('retry-after')
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            if response is None:
+                self.metrics.record(module, requests=1, errors=1,
+                                    http_time=elapsed)
+            else:
+                # The body of a stream is counted by the APIStream reading it
+                self.metrics.record(
+                    module, requests=1, http_time=elapsed,
+                    bytes_out=self._request_size(response.request),
+                    bytes_in=0 if args.get('stream') else len(
+                        response.content))
+            if lag_control is not None:
+                lag_control.release(lag, response is None, retry_after)
+
+    @staticmethod
+    def _request_size(request):
+        """Return the size of the body of a prepared request, or of its URL
+        if it has none."""
+        body = request.body
+        if body is None:
+            return len(request.url)
+        try:
+            return len(body)
+        except TypeError:
+            # A stream
+            return 0
+
+    @staticmethod
+    def _module_name(script, data):
+        """Return the name under which a call is recorded in the metrics."""
+        if script == 'api':
+            return mwklient.metrics.module_name(data)
+        return script
+
+    def _on_retry(self, sleeper, retries, args):
+        """Record a retry in the metrics, then call the `wait_callback`."""
+        module = 'other'
+        if isinstance(args, tuple) and len(args) == 2:
+            module = self._module_name(*args)
+        self.metrics.record(module, retries=1, sleep_time=sleeper.previous)
+        self.wait_callback(sleeper, retries, args)
+
+    def _cache_key(self, url, data):
+        """Return the key of a GET request in the response cache, or None if
+        its response must not be cached.
+
+        Requests carrying a token, fetching tokens or fetching the user
+        information are never cached, and the key depends on the user, so
+        that the responses of other users are never reused.
+        """
+        if self.response_cache is None or not isinstance(data, dict):
+            return None
+        for name, value in six.iteritems(data):
+            if 'token' in name.lower():
+                return None
+            if name == 'meta' and ('token' in text_type(value)
+                                   or 'userinfo' in text_type(value)):
+                return None
+        params = sorted((text_type(k), text_type(v))
+                        for k, v in six.iteritems(data))
+        return u'{} {} {}'.format(self._username, url,
+                                  urlencode(params))
+
+    def _store_response(self, cache_key, headers, text):
+        entry = mwklient.cache.response_entry(headers, text)
+        if entry is None:
+            self.response_cache.delete(cache_key)
+        else:
+            self.response_cache.set(cache_key, entry)
+
+    def _revalidated(self, cache_key, entry, headers):
+        """Refresh a cache entry after a 304 response, and return its
+        text."""
+        # A 304 response may omit the validators, which are kept then
+        merged = CaseInsensitiveDict()
+        if entry['etag'] is not None:
+            merged['etag'] = entry['etag']
+        if entry['last_modified'] is not None:
+            merged['last-modified'] = entry['last_modified']
+        merged.update(headers)
+        self._store_response(cache_key, merged, entry['text'])
+        return entry['text']
+
     def raw_api(self, action, http_method='POST', *args, **kwargs):
         """Send a call to the API."""
         try:
@@ -402,12 +921,40 @@ class Site():
             retry_on_error = True
         kwargs['action'] = action
         kwargs['format'] = 'json'
+        kwargs.setdefault('maxlag', self.max_lag)
         data = self._query_string(*args, **kwargs)
-        res = self.raw_call('api', data, retry_on_error=retry_on_error,
-                            http_method=http_method)
 
+        def call():
+            module = mwklient.metrics.module_name(data)
+            with self.metrics.span('raw_api', module=module,
+                                   method=http_method):
+                res = self.raw_call('api', data,
+                                    retry_on_error=retry_on_error,
+                                    http_method=http_method)
+                start = time.perf_counter()
+                info = self._decode_api_response(res)
+                self.metrics.record(
+                    module, decode_time=time.perf_counter() - start)
+                return info
+
+        if not self.coalesce or not self._read_only(action, data):
+            return call()
+        key = (http_method, retry_on_error, self._username,
+               tuple(sorted((text_type(k), text_type(v))
+                            for k, v in six.iteritems(data))))
+        return self.flights.do(key, call)
+
+    @staticmethod
+    def _read_only(action, data):
+        """Whether an API call only reads, so that identical calls can share
+        their response."""
+        if action not in READ_ACTIONS:
+            return False
+        return not any('token' in key.lower() for key in data)
+
+    def _decode_api_response(self, res):
         try:
-            return json.loads(res, object_pairs_hook=OrderedDict)
+            return self.decode_json(res)
         except ValueError:
             if res.startswith('MediaWiki API is not enabled for this site.'):
                 raise errors.APIDisabledError
@@ -420,6 +967,13 @@ class Site():
         data = self._query_string(*args, **kwargs)
         return self.raw_call('index', data, http_method=http_method)
 
+    def clear_cookies(self, name_part):
+        """Forget the session cookies whose name contains `name_part`."""
+        for cookie in self.connection.cookies:
+            if name_part in cookie.name:
+                self.connection.cookies.clear(
+                    cookie.domain, cookie.path, cookie.name)
+
     def require(self, major, minor, revision=None, raise_error=True):
         if self.version is None:
             if raise_error is None:
@@ -473,12 +1027,17 @@ class Site():
             info = self.post('emailuser', target=user, subject=subject,
                              text=text, ccme=cc, token=token)
         except errors.APIError as err:
-            if err.args[0] == u'noemail':
-                raise errors.NoSpecifiedEmail(user, err.args[1])
-            raise errors.EmailError(*err.args)
+            raise self._email_error(user, err)
 
         return info
 
+    @staticmethod
+    def _email_error(user, err):
+        """Return the exception raised by `email()` for an API error."""
+        if err.args[0] == u'noemail':
+            return errors.NoSpecifiedEmail(user, err.args[1])
+        return errors.EmailError(*err.args)
+
     def login(self, username=None, password=None, cookies=None, domain=None):
         """
         Login to the wiki using a username and password. The method returns
@@ -513,12 +1072,7 @@ class Site():
 
         if self.credentials:
             sleeper = self.sleepers.make()
-            kwargs = {
-                'lgname': self.credentials[0],
-                'lgpassword': self.credentials[1]
-            }
-            if self.credentials[2]:
-                kwargs['lgdomain'] = self.credentials[2]
+            kwargs = self._login_kwargs()
 
             # Try to login using the scheme for MW 1.27+. If the wiki is read
             # protected, it is not possible to get the wiki version upfront
@@ -532,21 +1086,41 @@ class Site():
 
             while True:
                 login = self.post('login', **kwargs)
-
-                if login['login']['result'] == 'Success':
+                wait_time = self._check_login(login, kwargs)
+                if wait_time is None:
                     break
-                elif login['login']['result'] == 'NeedToken':
-                    kwargs['lgtoken'] = login['login']['token']
-                elif login['login']['result'] == 'Throttled':
-                    sleeper.sleep(int(login['login'].get('wait', 5)))
-                else:
-                    raise errors.LoginError(self, login['login']['result'],
-                                            login['login']['reason'])
+                if wait_time:
+                    sleeper.sleep(wait_time)
 
         self.site_init()
 
-    def get_token(self, type_t, force=False, title=None):
+    def _login_kwargs(self):
+        kwargs = {
+            'lgname': self.credentials[0],
+            'lgpassword': self.credentials[1]
+        }
+        if self.credentials[2]:
+            kwargs['lgdomain'] = self.credentials[2]
+        return kwargs
 
+    def _check_login(self, login, kwargs):
+        """Check the response to a login request.
+
+        Returns:
+            None if the login succeeded, otherwise the number of seconds to
+            wait before sending the (updated) `kwargs` again.
+        """
+        if login['login']['result'] == 'Success':
+            return None
+        if login['login']['result'] == 'NeedToken':
+            kwargs['lgtoken'] = login['login']['token']
+            return 0
+        if login['login']['result'] == 'Throttled':
+            return int(login['login'].get('wait', 5))
+        raise errors.LoginError(self, login['login']['result'],
+                                login['login']['reason'])
+
+    def _token_type(self, type_t):
         if self.version is None or self.version[:2] >= (1, 24):
             # The 'csrf' (cross-site request forgery) token introduced in 1.24
             # replaces the majority of older tokens, like edittoken and
@@ -554,43 +1128,124 @@ class Site():
             if type_t not in {'watch', 'patrol', 'rollback', 'userrights',
                               'login'}:
                 type_t = 'csrf'
+        return type_t
 
-        if type_t not in self.tokens:
-            self.tokens[type_t] = '0'
+    def get_token(self, type_t, force=False, title=None):
 
-        if self.tokens.get(type_t, '0') == '0' or force:
+        type_t = self._token_type(type_t)
 
-            if self.version is None or self.version[:2] >= (1, 24):
-                # We use raw_api() rather than api() because api() is adding
-                # "userinfo" to the query and this raises a readapideniederror
-                # if the wiki is read protected and we're trying to fetch a
-                # login token.
-                # fix v0.0.2: type parameter must passed, with value type_t
-                info = self.raw_api(
-                    'query', 'GET', meta='tokens', type=type_t)
+        token = self.tokens.get(type_t, '0')
+        if token != '0' and not force:
+            return token
 
-                self.handle_api_result(info)
+        # Only one thread fetches the token, the others wait for it
+        with self._token_lock:
+            current = self.tokens.setdefault(type_t, '0')
+            if current != '0' and (not force or current != token):
+                return current
+            self._fetch_token(type_t, title)
 
-                # Note that for read protected wikis, we don't know the version
-                # when fetching the login token. If it's < 1.27, the request
-                # below will raise a KeyError that we should catch.
-                self.tokens[type_t] = info['query']['tokens']['%stoken' %
-                                                              type_t]
+        return self.tokens[type_t]
 
-            else:
-                if title is None:
-                    # Some dummy title was needed to get a token prior to 1.24
-                    title = 'Test'
-                info = self.post('query', titles=title,
-                                 prop='info', intoken=type_t)
-                for i in six.itervalues(info['query']['pages']):
-                    if i['title'] == title:
-                        self.tokens[type_t] = i['%stoken' % type_t]
+    def _fetch_token(self, type_t, title=None):
+        """Query a token of type `type_t` and store it in `tokens`."""
+        if self.version is None or self.version[:2] >= (1, 24):
+            # We use raw_api() rather than api() because api() is adding
+            # "userinfo" to the query and this raises a readapideniederror
+            # if the wiki is read protected and we're trying to fetch a
+            # login token.
+            # fix v0.0.2: type parameter must passed, with value type_t
+            info = self.raw_api(
+                'query', 'GET', meta='tokens', type=type_t)
+
+            self.handle_api_result(info)
+
+            # Note that for read protected wikis, we don't know the version
+            # when fetching the login token. If it's < 1.27, the request
+            # below will raise a KeyError that we should catch.
+            self.tokens[type_t] = info['query']['tokens']['%stoken' %
+                                                          type_t]
 
-        return self.tokens[type_t]
+        else:
+            if title is None:
+                # Some dummy title was needed to get a token prior to 1.24
+                title = 'Test'
+            info = self.post('query', titles=title,
+                             prop='info', intoken=type_t)
+            for i in six.itervalues(info['query']['pages']):
+                if i['title'] == title:
+                    self.tokens[type_t] = i['%stoken' % type_t]
+
+    def bulk_edit(self, edits, concurrency=4, rate=None, per=60.0, burst=1,
+                  max_retries=5, **kwargs):
+        """Edit many pages concurrently, within the rate limit of the user.
+
+        Example:
+            >>> edits = ((title, 'New text', 'Summary') for title in titles)
+            >>> for res in site.bulk_edit(edits, concurrency=8):
+            ...     if res.error is not None:
+            ...         print(res.page, res.error)
+
+        Args:
+            edits (iterable): (page, text, summary) tuples, where page is a
+                `Page` or a title
+            concurrency (int): The maximum number of edits in flight
+            rate (float): The number of edits allowed every `per` seconds,
+                by default the rate limit of the user. It is lowered on
+                `ratelimited` errors, after which the edit is retried.
+            per (float): See `rate`
+            burst (int): The number of edits that may be sent at once
+            max_retries (int): How many times an edit is retried after a
+                `ratelimited` error
+
+        All other arguments are passed to `Page.edit()`.
+
+        Returns:
+            A generator of `mwklient.bulk.EditResult` (page, result, error)
+            tuples, in the order the edits complete.
+        """
+        editor = mwklient.bulk.BulkEditor(self, concurrency, rate, per, burst,
+                                          max_retries)
+        return editor.run(edits, **kwargs)
+
+    def partitioned(self, method, partitions=8, workers=None, boundaries=None,
+                    split='sample', ordered=True, **kwargs):
+        """Enumerate `allpages()`, `allimages()`, `alllinks()`,
+        `allcategories()` or `allusers()` concurrently, split into ranges of
+        titles listed by separate workers.
+
+        Example:
+            >>> titles = site.partitioned('allpages', partitions=16,
+            ...                           namespace='0', generator=False)
+
+        Args:
+            method (str): The name of the list, e.g. 'allpages'
+            partitions (int): The number of ranges
+            workers (int): The number of ranges listed at the same time,
+                defaults to `partitions`. `pool_size` should be at least as
+                large.
+            boundaries (list): The titles splitting the ranges, without
+                namespace prefix, by default chosen according to `split`
+            split (str): 'sample' to split a sample of random titles
+                (``list=random``) into parts of the same size, or 'prefix'
+                to split the titles by their first letter
+            ordered (bool): Yield the items in alphabetical order (the later
+                ranges being kept in memory until their turn), or as soon as
+                they are loaded
+
+        All other arguments are passed to the list method.
+
+        Returns:
+            A `mwklient.partition.PartitionedList`, yielding the items of the
+            list.
+        """
+        return mwklient.partition.PartitionedList(
+            self, method, partitions, workers, boundaries, split, ordered,
+            **kwargs)
 
     def upload(self, file=None, filename=None, description='', ignore=False,
-               url=None, filekey=None, comment=None):
+               url=None, filekey=None, comment=None, state=None,
+               pipelined=False):
         """Upload a file to the site.
 
         Note that one of `file`, `filekey` and `url` must be specified, but not
@@ -607,6 +1262,10 @@ class Site():
                            stashed temporarily.
             comment (str): Upload comment. Also used as the initial page text
                            for new files if `description` is not specified.
+            state (str): Path of a file where the progress of a chunked
+                         upload is saved, see `resume_upload()`.
+            pipelined (bool): Pipeline a chunked upload, see
+                              `chunk_upload()`.
 
         Example:
 
@@ -621,41 +1280,74 @@ class Site():
             requests.exceptions.HTTPError
         """
 
-        if not filename:
-            raise TypeError('filename must be specified')
-
-        if len([x for x in [file, filekey, url] if x is not None]) != 1:
-            raise TypeError(
-                "exactly one of 'file', 'filekey' and 'url' must be specified")
+        self._check_upload_args(file, filename, filekey, url)
+        self.ensure_user_state()
 
         image = self.Images[filename]
         if not image.can('upload'):
             raise errors.InsufficientPermission(filename)
 
-        if not comment:
-            comment = description
-            text = None
-        else:
-            comment = comment
-            text = description
+        comment, text = self._upload_comment(description, comment)
 
-        if file:
-            if not hasattr(file, 'read'):
+        buffer = None
+        if file is not None:
+            buffer = mwklient.upload.as_buffer(file)
+            if buffer is None and not hasattr(file, 'read'):
                 file = open(file, 'rb')
 
-            content_size = file.seek(0, 2)
-            file.seek(0)
+            if self._needs_chunk_upload(file):
+                return self.chunk_upload(file, filename, ignore, comment, text,
+                                         state=state, pipelined=pipelined)
 
-            if self.version[:2] >= (1, 20) and content_size > self.chunk_size:
-                return self.chunk_upload(file, filename, ignore, comment, text)
+        predata = self._upload_params(filename, comment, text, ignore, url,
+                                      filekey, image.__get_token__('edit'))
+        postdata = predata
+        files = self._upload_files(file if buffer is None else buffer)
 
+        sleeper = self.sleepers.make()
+        while True:
+            data = self.raw_call('api', postdata, files)
+            info = self._decode_api_response(data)
+            if not info:
+                info = {}
+            if self.handle_api_result(info, kwargs=predata, sleeper=sleeper):
+                response = info.get('upload', {})
+                break
+        if buffer is not None:
+            buffer.release()
+        elif file:
+            file.close()
+        return response
+
+    @staticmethod
+    def _check_upload_args(file, filename, filekey, url):
+        if not filename:
+            raise TypeError('filename must be specified')
+
+        if len([x for x in [file, filekey, url] if x is not None]) != 1:
+            raise TypeError(
+                "exactly one of 'file', 'filekey' and 'url' must be specified")
+
+    @staticmethod
+    def _upload_comment(description, comment):
+        """Return the (comment, text) pair to send for an upload."""
+        if not comment:
+            return description, None
+        return comment, description
+
+    def _needs_chunk_upload(self, file):
+        content_size = mwklient.upload.content_size(file)
+        return self.version[:2] >= (1, 20) and content_size > self.chunk_size
+
+    def _upload_params(self, filename, comment, text, ignore, url, filekey,
+                       token):
         predata = {
             'action': 'upload',
             'format': 'json',
             'filename': filename,
             'comment': comment,
             'text': text,
-            'token': image.__get_token__('edit'),
+            'token': token,
         }
 
         if ignore:
@@ -670,47 +1362,217 @@ class Site():
             predata['sessionkey'] = filekey
         else:
             predata['filekey'] = filekey
+        return predata
 
-        postdata = predata
-        files = None
-        if file:
-
-            # Workaround for https://github.com/mwclient/mwclient/issues/65
-            # ----------------------------------------------------------------
-            # Since the filename in Content-Disposition is not interpreted,
-            # we can send some ascii-only dummy name rather than the real
-            # filename, which might contain non-ascii.
-            files = {'file': ('fake-filename', file)}
-
-        sleeper = self.sleepers.make()
-        while True:
-            data = self.raw_call('api', postdata, files)
-            info = json.loads(data)
-            if not info:
-                info = {}
-            if self.handle_api_result(info, kwargs=predata, sleeper=sleeper):
-                response = info.get('upload', {})
-                break
-        if file:
-            file.close()
-        return response
-
-    def chunk_upload(self, file, filename, ignorewarnings, comment, text):
+    @staticmethod
+    def _upload_files(file):
+        if not file:
+            return None
+
+        # Workaround for https://github.com/mwclient/mwclient/issues/65
+        # ----------------------------------------------------------------
+        # Since the filename in Content-Disposition is not interpreted,
+        # we can send some ascii-only dummy name rather than the real
+        # filename, which might contain non-ascii.
+        return {'file': ('fake-filename', file)}
+
+    def chunk_upload(self, file, filename, ignorewarnings, comment, text,
+                     state=None, pipelined=False):
         """Upload a file to the site in chunks.
 
         This method is called by `Site.upload` if you are connecting to a newer
         MediaWiki installation, so it's normally not necessary to call this
         method directly.
 
+        The chunks are sent as memoryviews: slices of `file` if it supports
+        the buffer protocol (e.g. a `mmap.mmap`), or of a buffer they are
+        read into, reused from one chunk to the next.
+
         Args:
-            file (file-like object): File object or stream to upload.
+            file (file-like object): File object, stream or buffer to upload.
             params (dict): Dict containing upload parameters.
+            state (str): The path of a file where the progress of the upload
+                is saved after each chunk, to resume it with
+                `resume_upload()` if it is interrupted.
+            pipelined (bool): Read the next chunk while sending one, tune
+                the size of the chunks from the throughput (starting from
+                `chunk_size`, up to `max_chunk_size` or `chunk_size` if
+                larger, see `mwklient.upload.ChunkSizeTuner`), and let
+                the server assemble and publish the file asynchronously
+                (``async=1``), polling it for the result.
         """
         image = self.Images[filename]
+        content_size = mwklient.upload.content_size(file)
+
+        params = self._chunk_upload_params(filename, content_size,
+                                           ignorewarnings,
+                                           image.__get_token__('edit'))
+        progress = None
+        if state is not None:
+            progress = mwklient.upload.UploadState(
+                state, filename, content_size,
+                mwklient.upload.file_sha1(file),
+                ignorewarnings=ignorewarnings, comment=comment, text=text)
+            progress.save()
+        return self._upload_chunks(file, params, comment, text, progress,
+                                   pipelined)
+
+    def resume_upload(self, file, state, pipelined=False):
+        """Resume a chunked upload interrupted, possibly in another process.
+
+        The server is asked how much of the file it received, with
+        ``checkstatus``, and only the rest is sent.
+
+        Example:
 
-        content_size = file.seek(0, 2)
-        file.seek(0)
+            >>> try:
+            ...     site.upload(open('video.webm', 'rb'), 'Video.webm',
+            ...                 state='video.upload.json')
+            ... except requests.exceptions.ConnectionError:
+            ...     site.resume_upload(open('video.webm', 'rb'),
+            ...                        'video.upload.json')
 
+        Args:
+            file: The file given to `upload()`, as a path, a stream or a
+                buffer
+            state (str): The path of the state of the upload
+            pipelined (bool): See `chunk_upload()`
+
+        Returns:
+            JSON result from the API.
+
+        Raises:
+            errors.UploadStateError: The state is invalid, or the file is
+                not the one whose upload was started.
+            errors.APIError: The server no longer has the upload, e.g. its
+                stash expired.
+        """
+        if mwklient.upload.as_buffer(file) is None and not hasattr(
+                file, 'read'):
+            file = open(file, 'rb')
+        progress = mwklient.upload.UploadState.load(state)
+        progress.check(file)
+        self.ensure_user_state()
+
+        image = self.Images[progress.filename]
+        params = self._chunk_upload_params(
+            progress.filename, progress.filesize, progress.ignorewarnings,
+            image.__get_token__('edit'))
+        if progress.filekey is not None:
+            status = self.post('upload', checkstatus=1,
+                               filekey=progress.filekey,
+                               token=params['token'])['upload']
+            LOG.debug('%s: Status of the upload: %s', progress.filename,
+                      status)
+            if status.get('result') == 'Poll':
+                # The chunks are being assembled
+                status = self._poll_upload(progress.filekey, params['token'])
+            params['filekey'] = progress.filekey
+            if status.get('result') == 'Success':
+                params['offset'] = progress.filesize
+            else:
+                params['offset'] = int(status.get('offset', progress.offset))
+        return self._upload_chunks(file, params, progress.comment,
+                                   progress.text, progress, pipelined)
+
+    def _upload_chunks(self, file, params, comment, text, progress=None,
+                       pipelined=False):
+        """Send the chunks of `file` from `params['offset']`, then publish
+        the stashed file, saving the progress to `progress` if any."""
+        filename = params['filename']
+        content_size = params['filesize']
+        reader = mwklient.upload.ChunkReader(file, int(params['offset']),
+                                             prefetch=pipelined)
+        if pipelined:
+            tuner = mwklient.upload.ChunkSizeTuner(
+                self.chunk_size, maximum=self._max_chunk_size())
+            chunks = reader.chunks(lambda: tuner.size)
+            params['async'] = 1
+        else:
+            tuner = None
+            chunks = reader.chunks(lambda: self.chunk_size)
+
+        sleeper = self.sleepers.make()
+        try:
+            for chunk in chunks:
+                start = time.perf_counter()
+                while True:
+                    data = self.raw_call('api', params,
+                                         files={'chunk': chunk})
+                    info = self._decode_api_response(data)
+                    if self.handle_api_result(info, kwargs=params,
+                                              sleeper=sleeper):
+                        response = info.get('upload', {})
+                        break
+
+                size = chunk.nbytes
+                reader.sent(chunk)
+                if tuner is not None:
+                    tuner.observe(size, time.perf_counter() - start)
+                LOG.debug('%s: Uploaded %d of %d bytes',
+                          filename, reader.offset, content_size)
+                if response.get('result') == 'Poll':
+                    # The last chunk was queued for assembly
+                    response = self._poll_upload(response['filekey'],
+                                                 params['token'])
+                if not self._chunk_uploaded(params, response):
+                    # Some kind or error or warning occured. In any case, we
+                    # do not get the parameters we need to continue, so we
+                    # should return the response now.
+                    return response
+                if progress is not None:
+                    progress.update(params['filekey'], reader.offset)
+                if response['result'] == 'Success':
+                    break
+        finally:
+            chunks.close()
+            reader.close()
+        response = self.post('upload', **self._chunk_commit_params(
+            params, comment, text))
+        if response.get('upload', {}).get('result') == 'Poll':
+            # Published by a job of the server
+            response = {'upload': self._poll_upload(params['filekey'],
+                                                    params['token'])}
+        if progress is not None:
+            progress.remove()
+        return response
+
+    def _max_chunk_size(self):
+        """Return the largest chunk a pipelined upload may send, within the
+        maximum upload size of the site."""
+        size = max(self.chunk_size, self.max_chunk_size)
+        limit = (self.site or {}).get('maxuploadsize')
+        if limit:
+            size = min(size, int(limit))
+        return size
+
+    def _poll_upload(self, filekey, token):
+        """Wait for the server to process an upload queued with ``async=1``,
+        and return its status once done.
+
+        The polls are spaced from 0.5 up to 10 seconds, at most
+        `max_upload_polls` times and within the deadline of the site.
+
+        Raises:
+            MaximumRetriesExceeded: The upload was still being processed
+                after the last poll.
+            DeadlineExceeded: It would not be over before the deadline.
+        """
+        sleeper = mwklient.sleep.Sleeper(
+            ('upload', {'filekey': filekey}), self.max_upload_polls, 0,
+            lambda *x: None,
+            backoff=mwklient.sleep.ExponentialBackoff(0.5, 10, jitter=False),
+            deadline=self.sleepers.deadline)
+        while True:
+            sleeper.sleep()
+            status = self.post('upload', checkstatus=1, filekey=filekey,
+                               token=token)['upload']
+            if status.get('result') != 'Poll':
+                return status
+            LOG.debug('%s: Upload stage: %s', filekey, status.get('stage'))
+
+    @staticmethod
+    def _chunk_upload_params(filename, content_size, ignorewarnings, token):
         params = {
             'action': 'upload',
             'format': 'json',
@@ -718,48 +1580,59 @@ class Site():
             'offset': 0,
             'filename': filename,
             'filesize': content_size,
-            'token': image.get_token('edit'),
+            'token': token,
         }
         if ignorewarnings:
             params['ignorewarnings'] = 'true'
+        return params
 
-        sleeper = self.sleepers.make()
-        offset = 0
-        for chunk in read_in_chunks(file, self.chunk_size):
-            while True:
-                data = self.raw_call('api', params, files={'chunk': chunk})
-                info = json.loads(data)
-                if self.handle_api_result(info, kwargs=params,
-                                          sleeper=sleeper):
-                    response = info.get('upload', {})
-                    break
+    @staticmethod
+    def _chunk_uploaded(params, response):
+        """Update `params` after a chunk has been sent.
 
-            offset += chunk.tell()
-            chunk.close()
-            LOG.debug('%s: Uploaded %d of %d bytes',
-                      filename, offset, content_size)
+        Returns:
+            False if the upload cannot go on, True otherwise.
+        """
+        if response['result'] == 'Continue':
             params['filekey'] = response['filekey']
-            if response['result'] == 'Continue':
-                params['offset'] = response['offset']
-            elif response['result'] == 'Success':
-                file.close()
-                break
-            else:
-                # Some kind or error or warning occured. In any case, we do not
-                # get the parameters we need to continue, so we should return
-                # the response now.
-                file.close()
-                return response
+            params['offset'] = response['offset']
+            return True
+        if response['result'] == 'Success':
+            params['filekey'] = response['filekey']
+            return True
+        return False
+
+    @staticmethod
+    def _chunk_commit_params(params, comment, text):
         par = {}
         for k in params:
             if k not in ['action', 'stash', 'offset']:
                 par[k] = params[k]
         par['comment'] = comment
         par['text'] = text
-        return self.post('upload', **par)
+        return par
 
     def parse(self, text=None, title=None, page=None, prop=None,
-              redirects=False, mobileformat=False):
+              redirects=False, mobileformat=False, maxage=None):
+        """Parse wikitext, or the current revision of a page.
+
+        Pages are parsed with a GET request, which the `response_cache` of
+        the site keeps for `maxage` seconds if given; wikitext, which can be
+        long, is sent with a POST request.
+
+        API doc: https://www.mediawiki.org/wiki/API:Parsing_wikitext
+        """
+        kwargs = self._parse_kwargs(text, title, page, prop, redirects,
+                                    mobileformat, maxage)
+        if text is None:
+            result = self.get('parse', **kwargs)
+        else:
+            result = self.post('parse', **kwargs)
+        return result['parse']
+
+    @staticmethod
+    def _parse_kwargs(text, title, page, prop, redirects, mobileformat,
+                      maxage):
         kwargs = {}
         if text is not None:
             kwargs['text'] = text
@@ -773,8 +1646,9 @@ class Site():
             kwargs['redirects'] = '1'
         if mobileformat:
             kwargs['mobileformat'] = '1'
-        result = self.post('parse', **kwargs)
-        return result['parse']
+        if maxage is not None:
+            kwargs['maxage'] = maxage
+        return kwargs
 
     # def block(self): TODO?
     # def unblock: TODO?
@@ -965,10 +1839,10 @@ class Site():
         """List recent changes to the wiki, à la Special:Recentchanges.
         """
         kwargs = dict(listing.List.generate_kwargs('rc', start=start, end=end,
-                                                   direc=direc,
+                                                   dir=direc,
                                                    namespace=namespace,
                                                    prop=prop, show=show,
-                                                   type_t=type_t,
+                                                   type=type_t,
                                                    toponly='1' if toponly else
                                                    None))
         return listing.List(self, 'recentchanges', 'rc', limit=limit, **kwargs)
@@ -998,18 +1872,109 @@ class Site():
             'rvprop': prop,
             'revids': '|'.join(map(text_type, revids))
         }
+        return self._revisions_from(self.get('query', **kwargs))
 
+    @staticmethod
+    def _revisions_from(result):
         revisions = []
-        pages = self.get('query', **kwargs).get('query',
-                                                {}).get('pages', {}).values()
+        pages = result.get('query', {}).get('pages', {}).values()
         for page in pages:
             for revision in page.get('revisions', ()):
-                revision['pageid'] = page.get('pageid')
-                revision['pagetitle'] = page.get('title')
-                revision['timestamp'] = parse_timestamp(revision['timestamp'])
-                revisions.append(revision)
+                # The response may be shared, see `Site.coalesce`
+                revisions.append(dict(
+                    revision, pageid=page.get('pageid'),
+                    pagetitle=page.get('title'),
+                    timestamp=parse_timestamp(revision['timestamp'])))
         return revisions
 
+    def texts(self, pages, slot='main', stream=False):
+        """Get the current wikitext of many pages, packing them into as few
+        queries as possible (see `titles_limit`).
+
+        The text is also cached by the pages, so a later call to
+        `Page.text()` will not query the API again.
+
+        Example:
+            >>> for page, text in site.texts(['Foo', 'Bar']):
+            ...     print(page.name, len(text))
+
+        Args:
+            pages (iterable): Page objects or page titles
+            slot (str): The content slot (Mediawiki >= 1.32) to retrieve
+                content from.
+            stream (bool): Yield the texts while each response is being
+                downloaded (see `stream_api()`), if ijson is installed.
+
+        Returns:
+            A generator of (page, text) tuples, in no particular order. Pages
+            that do not exist have an empty text.
+        """
+        for batch in batched(pages, self.titles_limit):
+            known, kwargs = self._texts_query(batch, slot)
+            done = set()
+            while True:
+                if stream and mwklient.stream.available():
+                    infos = self.stream_api('query', 'query.pages', 'GET',
+                                            **kwargs)
+                else:
+                    data = self.get('query', **kwargs)
+                    infos = six.itervalues(data.get('query', {})
+                                           .get('pages', {}))
+                for info in infos:
+                    text = self._page_text(info, known, done, slot)
+                    if text is not None:
+                        yield text
+
+                if isinstance(infos, mwklient.stream.APIStream):
+                    data = infos.result
+                if not data.get('continue'):
+                    break
+                kwargs.update(data['continue'])
+
+    def _texts_query(self, batch, slot):
+        """Return the pages of `batch` given as `Page` objects, by title, and
+        the arguments of the query of `texts()` for the whole batch."""
+        known = {}
+        titles = []
+        for page in batch:
+            if isinstance(page, mwklient.page.Page):
+                known[page.name] = page
+                titles.append(page.name)
+            else:
+                titles.append(self.pages.resolve(page)[0])
+
+        kwargs = {
+            'prop': 'info|revisions',
+            'inprop': 'protection',
+            'rvprop': 'content|timestamp|ids',
+            'titles': '|'.join(titles),
+        }
+        if self.version is None or self.version[:2] >= (1, 32):
+            kwargs['rvslots'] = slot
+        return known, kwargs
+
+    def _page_text(self, info, known, done, slot):
+        """Return the (page, text) tuple of a page of a response to the query
+        of `texts()`, or None if it is not there yet or was already seen."""
+        title = info.get('title')
+        if title in done:
+            return None
+        if title not in known:
+            known[title] = self.pages._page_from_info(info)
+        page = known[title]
+
+        # When the content is too large, the server leaves out the revisions
+        # of some pages until the next request.
+        if 'revisions' in info:
+            rev = info['revisions'][0]
+            rev = dict(rev, timestamp=parse_timestamp(rev['timestamp']))
+            done.add(title)
+            return page, page._cache_revision(rev, slot)
+        if 'missing' in info or 'invalid' in info:
+            done.add(title)
+            return page, u''
+        return None
+
     def search(self, search, namespace='0', what=None, redirects=False,
                limit=None):
         """Perform a full text search.
@@ -1101,7 +2066,10 @@ class Site():
             kwargs['generatexml'] = '1'
 
         result = self.get('expandtemplates', text=text, **kwargs)
+        return self._expanded_text(result, generatexml)
 
+    @staticmethod
+    def _expanded_text(result, generatexml):
         if generatexml:
             return result['expandtemplates']['*'], result['parsetree']['*']
         return result['expandtemplates']['*']
@@ -1138,13 +2106,15 @@ class Site():
                                    http_method='GET', **kwargs)
             self.handle_api_result(results)  # raises APIError on error
             offset = results.get('query-continue-offset')
-            answers = results['query'].get('results', [])
-
-            if isinstance(answers, dict):
-                # In older versions of Semantic MediaWiki, at least until 2.3.0
-                # a list was returned. In newer versions an object is returned
-                # with the page title as key.
-                answers = [answer for answer in answers.values()]
-
-            for answer in answers:
+            for answer in self._ask_answers(results):
                 yield answer
+
+    @staticmethod
+    def _ask_answers(results):
+        answers = results['query'].get('results', [])
+        if isinstance(answers, dict):
+            # In older versions of Semantic MediaWiki, at least until 2.3.0
+            # a list was returned. In newer versions an object is returned
+            # with the page title as key.
+            answers = [answer for answer in answers.values()]
+        return answers
@@ -0,0 +1,63 @@
+"""Coalescing of identical calls made at the same time by several threads."""
+import threading
+
+
+class Flight():
+    """A call in progress, whose outcome is shared by its callers."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight():
+    """Run a function once for all the callers asking for the same key at
+    the same time: the first caller runs it, and the others wait for its
+    result (or exception) instead of running it again.
+
+        >>> flights = SingleFlight()
+        >>> info = flights.do(('query', title), lambda: fetch(title))
+
+    `calls` counts the calls to `do()`, and `saved` those that shared the
+    result of another call.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.calls = 0
+        self.saved = 0
+
+    def __repr__(self):
+        return '<SingleFlight object, %d calls, %d saved>' % (
+            self.calls, self.saved)
+
+    def do(self, key, function):
+        """Return the result of `function()`, shared with the calls of the
+        same `key` in progress."""
+        with self.lock:
+            self.calls += 1
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+            else:
+                self.saved += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = function()
+        except Exception as err:
+            flight.error = err
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+        return flight.result
@@ -0,0 +1,558 @@
+"""Read-only access to the pages of a MediaWiki XML dump, without the API.
+
+    >>> from mwklient.dump import DumpSite
+    >>> site = DumpSite('enwiki-20190901-pages-articles-multistream.xml.bz2')
+    >>> site.pages['Python (programming language)'].text()
+    >>> for title in site.allpages(prefix='Py', generator=False):
+    ...     print(title)
+
+The first time a dump is opened, an index of its pages is written next to
+it (see `DumpIndex`). It is memory-mapped afterwards, so that looking a page
+up only reads the part of the dump holding it: one of the bz2 streams of 100
+pages of a multistream dump (*-multistream.xml.bz2), or the page itself in
+an uncompressed dump (*.xml). The index of a multistream dump is built from
+its companion *-multistream-index.txt.bz2 file when there is one, without
+decompressing the dump.
+
+Dumps compressed as a single bz2 stream (*-pages-articles.xml.bz2) are read
+as a stream of lines, like uncompressed ones, without ever holding more than
+a page in memory, but as bz2 has no random access, each lookup then
+decompresses the dump from its start (or from the previous lookup) up to the
+page.
+"""
+import bz2
+import logging
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+import xml.etree.ElementTree as ElementTree
+from xml.sax.saxutils import unescape
+import six
+
+import mwklient.page
+from mwklient.util import parse_timestamp, version_tuple_from_generator
+
+LOG = logging.getLogger(__name__)
+
+CHUNK_SIZE = 65536
+
+# Format of the index files: a header, the records sorted by namespace and
+# title, then the UTF-8 encoded titles (without the namespace prefix)
+MAGIC = b'MWKIDX01'
+# Magic, number of records, size and modification time of the dump
+HEADER = struct.Struct('<8sQQd')
+# Namespace, title length, title position, offset of the page data
+RECORD = struct.Struct('<iIQQ')
+
+TITLE_RE = re.compile(br'<title>(.*?)</title>')
+NS_RE = re.compile(br'<ns>(-?\d+)</ns>')
+
+# Entities escaped in the titles of a dump
+ENTITIES = {'&quot;': '"', '&#039;': "'"}
+
+
+class DumpIndex():
+    """The index of the pages of a dump, memory-mapped: titles sorted by
+    namespace, each with the offset of the data holding the page.
+
+    Args:
+        path (str): The path of the index file, see `build()`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fd:
+            self.map = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.dump_size, self.dump_mtime = (
+            HEADER.unpack_from(self.map))
+        if magic != MAGIC:
+            raise RuntimeError('%s is not a dump index' % path)
+
+    def __repr__(self):
+        return "<DumpIndex object '%s', %d pages>" % (self.path, self.count)
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self.map.close()
+
+    @staticmethod
+    def build(path, entries, dump_size=0, dump_mtime=0.0):
+        """Write the index of `entries`, an iterable of (namespace, title,
+        offset) tuples, to `path`, atomically replacing the file."""
+        entries = sorted((ns, title.encode('utf-8'), offset)
+                         for ns, title, offset in entries)
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(HEADER.pack(MAGIC, len(entries), dump_size,
+                                      dump_mtime))
+                position = HEADER.size + RECORD.size * len(entries)
+                for ns, title, offset in entries:
+                    tmp.write(RECORD.pack(ns, len(title), position, offset))
+                    position += len(title)
+                for _, title, _ in entries:
+                    tmp.write(title)
+            os.replace(tmp_path, path)
+        except (IOError, OSError):
+            os.remove(tmp_path)
+            raise
+
+    def entry(self, i):
+        """Return the (namespace, title as bytes, offset) of record `i`."""
+        ns, length, position, offset = RECORD.unpack_from(
+            self.map, HEADER.size + RECORD.size * i)
+        return ns, self.map[position:position + length], offset
+
+    def _bisect(self, ns, title):
+        """Return the index of the first record not lower than (ns, title),
+        `title` being UTF-8 encoded."""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.entry(middle)[:2] < (ns, title):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def find(self, ns, title):
+        """Return the offset of the data of page `title` of namespace `ns`,
+        or None if it is not in the dump."""
+        title = title.encode('utf-8')
+        i = self._bisect(ns, title)
+        if i < self.count:
+            entry = self.entry(i)
+            if entry[:2] == (ns, title):
+                return entry[2]
+        return None
+
+    def titles(self, ns, start=None, end=None, prefix=None):
+        """Yield the (title, offset) of the pages of namespace `ns`, in
+        order, from `start` up to `end` (inclusive) and starting with
+        `prefix` if given."""
+        first = max(start or u'', prefix or u'').encode('utf-8')
+        prefix = (prefix or u'').encode('utf-8')
+        end = end.encode('utf-8') if end is not None else None
+        for i in six.moves.range(self._bisect(ns, first), self.count):
+            entry_ns, title, offset = self.entry(i)
+            if entry_ns != ns or not title.startswith(prefix):
+                return
+            if end is not None and title > end:
+                return
+            yield title.decode('utf-8'), offset
+
+
+def iter_streams(fileobj, offset=0):
+    """Yield the (offset, data) of the bz2 streams of `fileobj`, starting at
+    `offset`."""
+    fileobj.seek(offset)
+    decompressor = bz2.BZ2Decompressor()
+    parts = []
+    while True:
+        chunk = fileobj.read(CHUNK_SIZE)
+        if not chunk:
+            if parts:
+                yield offset, b''.join(parts)
+            return
+        while chunk:
+            parts.append(decompressor.decompress(chunk))
+            if not decompressor.eof:
+                break
+            chunk = decompressor.unused_data
+            yield offset, b''.join(parts)
+            offset = fileobj.tell() - len(chunk)
+            decompressor = bz2.BZ2Decompressor()
+            parts = []
+
+
+def is_multistream(path):
+    """Whether the bz2 compressed dump at `path` is a multistream one, whose
+    first stream holds the header of the dump only."""
+    decompressor = bz2.BZ2Decompressor()
+    tail = b''
+    with open(path, 'rb') as fileobj:
+        while not decompressor.eof:
+            chunk = fileobj.read(CHUNK_SIZE)
+            if not chunk:
+                return False
+            data = tail + decompressor.decompress(chunk)
+            if b'<page>' in data:
+                return False
+            tail = data[-len(b'<page>'):]
+    return True
+
+
+def read_stream(fileobj, offset):
+    """Return the decompressed data of the bz2 stream at `offset`."""
+    for _, data in iter_streams(fileobj, offset):
+        return data
+    return b''
+
+
+def parse_siteinfo(data):
+    """Return the 'general' and 'namespaces' site information of the
+    <siteinfo> element of a dump header, as `Site` has them."""
+    start = data.find(b'<siteinfo>')
+    end = data.find(b'</siteinfo>')
+    if start < 0 or end < 0:
+        raise RuntimeError('The dump has no site information')
+    element = ElementTree.fromstring(data[start:end + len(b'</siteinfo>')])
+    general = {child.tag: child.text or u'' for child in element
+               if child.tag != 'namespaces'}
+    namespaces = {}
+    for namespace in element.iter('namespace'):
+        namespaces[int(namespace.get('key'))] = {
+            '*': namespace.text or u'',
+            'case': namespace.get('case'),
+        }
+    return general, namespaces
+
+
+class DumpSite():
+    """A read-only site over a local XML dump, offering the reading methods
+    of `Site`: `pages[...]`, `allpages()` and, on the pages,
+    `Page.text()` and `Page.revisions()`. Anything needing the API raises
+    NotImplementedError.
+
+    Args:
+        path (str): The path of the dump, an uncompressed XML file or a
+            bz2 compressed one, preferably a multistream dump.
+        index_path (str): The path of the index, built if it does not exist
+            or if the dump has changed. Defaults to the path of the dump
+            with the '.mwkidx' extension appended.
+    """
+
+    rights = ['read']
+    content_cache = None
+
+    def __init__(self, path, index_path=None):
+        self.path = path
+        self.compressed = path.endswith('.bz2')
+        self.multistream = self.compressed and is_multistream(path)
+        self.index_path = index_path or path + '.mwkidx'
+        self.fileobj = self._open_xml()
+        self.lock = threading.Lock()
+        # The last block of pages read, as (offset, {title: element})
+        self._block = (None, {})
+
+        self.site, namespaces = parse_siteinfo(self._header())
+        self.host = self.site.get('base', path)
+        self.version = version_tuple_from_generator(
+            self.site.get('generator', 'MediaWiki 0'))
+        self.namespaces = {ns: info['*']
+                           for ns, info in six.iteritems(namespaces)}
+        self._cases = {ns: info['case']
+                       for ns, info in six.iteritems(namespaces)}
+        self._namespace_ids = {name.lower(): ns
+                               for ns, name in six.iteritems(self.namespaces)}
+
+        stat = os.stat(path)
+        index = None
+        if os.path.exists(self.index_path):
+            index = DumpIndex(self.index_path)
+            if (index.dump_size, index.dump_mtime) != (stat.st_size,
+                                                       stat.st_mtime):
+                LOG.info('%s has changed, rebuilding its index', path)
+                index.close()
+                index = None
+        if index is None:
+            DumpIndex.build(self.index_path, self._index_entries(),
+                            stat.st_size, stat.st_mtime)
+            index = DumpIndex(self.index_path)
+        self.index = index
+
+        self.pages = DumpPageList(self)
+
+    def __repr__(self):
+        return "<DumpSite object '%s'>" % self.path
+
+    def close(self):
+        self.index.close()
+        self.fileobj.close()
+
+    def api(self, *args, **kwargs):
+        raise NotImplementedError('%r is read-only and has no API' % self)
+
+    get = post = raw_api = raw_index = api
+
+    def _open_xml(self):
+        """Open the dump as a stream of XML, or as the bz2 streams of a
+        multistream dump."""
+        if self.compressed and not self.multistream:
+            return bz2.BZ2File(self.path)
+        return open(self.path, 'rb')
+
+    def _header(self):
+        """Return the beginning of the dump, up to the end of the
+        <siteinfo> element."""
+        if self.compressed:
+            fileobj = bz2.BZ2File(self.path)
+        else:
+            fileobj = open(self.path, 'rb')
+        with fileobj:
+            data = b''
+            while b'</siteinfo>' not in data:
+                chunk = fileobj.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                data += chunk
+        return data
+
+    def split_title(self, title):
+        """Return the namespace and the normalized title without the
+        namespace prefix of the full page title `title`."""
+        title = title.replace(u'_', u' ').strip().lstrip(u':')
+        ns = 0
+        prefix, colon, rest = title.partition(u':')
+        if colon and prefix.strip().lower() in self._namespace_ids:
+            ns = self._namespace_ids[prefix.strip().lower()]
+            title = rest.strip()
+        if self._cases.get(ns) == 'first-letter' and title:
+            title = title[0].upper() + title[1:]
+        return ns, title
+
+    def full_title(self, ns, title):
+        if ns == 0:
+            return title
+        return u'%s:%s' % (self.namespaces.get(ns, ns), title)
+
+    def _index_entries(self):
+        """Yield the (namespace, title without prefix, offset) of the pages
+        of the dump."""
+        companion = None
+        if self.path.endswith('.xml.bz2'):
+            companion = self.path[:-len('.xml.bz2')] + '-index.txt.bz2'
+        if companion and os.path.exists(companion):
+            LOG.info('Indexing %s from %s', self.path, companion)
+            with bz2.BZ2File(companion) as lines:
+                for line in lines:
+                    offset, _, title = line.decode('utf-8').rstrip(
+                        u'\n').split(u':', 2)
+                    ns, title = self.split_title(title)
+                    yield ns, title, int(offset)
+            return
+
+        LOG.info('Indexing %s', self.path)
+        if self.multistream:
+            with open(self.path, 'rb') as fileobj:
+                for offset, data in iter_streams(fileobj):
+                    titles = TITLE_RE.findall(data)
+                    for title, ns in zip(titles, NS_RE.findall(data)):
+                        yield (int(ns), self._split_dump_title(title)[1],
+                               offset)
+            return
+
+        # The offsets of a single stream dump are those of its decompressed
+        # data, as BZ2File.seek() takes them
+        with self._open_xml() as fileobj:
+            offset = page_offset = 0
+            title = None
+            for line in fileobj:
+                stripped = line.strip()
+                if stripped == b'<page>':
+                    page_offset = offset
+                elif stripped.startswith(b'<title>'):
+                    title = TITLE_RE.search(stripped).group(1)
+                elif stripped.startswith(b'<ns>') and title is not None:
+                    yield (int(NS_RE.search(stripped).group(1)),
+                           self._split_dump_title(title)[1], page_offset)
+                    title = None
+                offset += len(line)
+
+    def _split_dump_title(self, title):
+        return self.split_title(unescape(title.decode('utf-8'), ENTITIES))
+
+    def page_element(self, ns, title):
+        """Return the <page> element of a page, or None if it is not in the
+        dump."""
+        offset = self.index.find(ns, title)
+        if offset is None:
+            return None
+        full_title = self.full_title(ns, title)
+        with self.lock:
+            if self._block[0] != offset:
+                self._block = (offset, self._read_block(offset))
+            return self._block[1].get(full_title)
+
+    def _read_block(self, offset):
+        """Return the pages of the block of the dump at `offset`, as a dict
+        of <page> elements by title."""
+        if self.multistream:
+            data = read_stream(self.fileobj, offset)
+        else:
+            self.fileobj.seek(offset)
+            lines = []
+            for line in self.fileobj:
+                lines.append(line)
+                if line.strip() == b'</page>':
+                    break
+            data = b''.join(lines)
+        # Only keep the sequence of <page> elements, without the header and
+        # the end of the <mediawiki> element of a stream
+        start = data.find(b'<page>')
+        data = data[max(start, 0):].replace(b'</mediawiki>', b'')
+        root = ElementTree.fromstring(b'<pages>' + data + b'</pages>')
+        return {page.findtext('title'): page for page in root.iter('page')}
+
+    def allpages(self, start=None, prefix=None, namespace='0', limit=None,
+                 generator=True, end=None):
+        """Retrieve all pages of a namespace of the dump, in alphabetical
+        order, as `DumpPage` objects, or as titles if `generator` is False.
+
+        `limit` is accepted for compatibility with `Site.allpages()`, and
+        ignored.
+        """
+        ns = int(namespace)
+        for title, _ in self.index.titles(ns, start, end, prefix):
+            if generator:
+                yield self.pages.get(self.full_title(ns, title))
+            else:
+                yield self.full_title(ns, title)
+
+
+class DumpPageList():
+    """The pages of a `DumpSite`, by title: ``site.pages[title]``."""
+
+    def __init__(self, site):
+        self.site = site
+
+    def __getitem__(self, name):
+        return self.get(name)
+
+    def get(self, name):
+        ns, title = self.site.split_title(name)
+        element = self.site.page_element(ns, title)
+        return DumpPage(self.site, element,
+                        self.site.full_title(ns, title), ns)
+
+    def __iter__(self):
+        for ns in sorted(self.site.namespaces):
+            for page in self.site.allpages(namespace=ns):
+                yield page
+
+
+def revision_dict(element, prop):
+    """Return a <revision> element as the API returns revisions, with the
+    properties `prop` ('ids|timestamp|...')."""
+    props = set(prop.split('|'))
+    revision = {}
+    if 'ids' in props:
+        revision['revid'] = int(element.findtext('id'))
+        revision['parentid'] = int(element.findtext('parentid') or 0)
+    if 'timestamp' in props:
+        revision['timestamp'] = parse_timestamp(element.findtext('timestamp'))
+    if 'flags' in props and element.find('minor') is not None:
+        revision['minor'] = u''
+    if 'comment' in props:
+        revision['comment'] = element.findtext('comment') or u''
+    if 'user' in props or 'userid' in props:
+        contributor = element.find('contributor')
+        if contributor is not None and contributor.find('ip') is not None:
+            revision['user'] = contributor.findtext('ip')
+            revision['anon'] = u''
+        elif contributor is not None:
+            revision['user'] = contributor.findtext('username') or u''
+            revision['userid'] = int(contributor.findtext('id') or 0)
+    text = element.find('text')
+    if 'size' in props and text is not None:
+        revision['size'] = int(text.get('bytes', 0))
+    if 'sha1' in props:
+        revision['sha1'] = element.findtext('sha1')
+    if 'content' in props:
+        revision['*'] = (text.text or u'') if text is not None else u''
+        revision['contentmodel'] = element.findtext('model')
+    return revision
+
+
+class DumpPage(mwklient.page.Page):
+    """A page of a `DumpSite`.
+
+    Args:
+        site (DumpSite): The site of the page
+        element (Element): The <page> element, or None if the page is not
+            in the dump
+        name (str): The title of the page
+        namespace (int): The namespace of the page
+    """
+
+    def __init__(self, site, element, name, namespace):
+        info = {'title': name, 'ns': namespace}
+        if element is None:
+            info['missing'] = u''
+        else:
+            revisions = element.findall('revision')
+            info['pageid'] = int(element.findtext('id'))
+            info['lastrevid'] = int(revisions[-1].findtext('id'))
+            text = revisions[-1].find('text')
+            if text is not None:
+                info['length'] = int(text.get('bytes', 0))
+            if element.find('redirect') is not None:
+                info['redirect'] = u''
+        self.element = element
+        super(DumpPage, self).__init__(site, name, info)
+
+    def __repr__(self):
+        return "<DumpPage object '%s' for %s>" % (self.name, self.site)
+
+    def text(self, section=None, expandtemplates=False, cache=True,
+             slot='main'):
+        """Get the wikitext of the last revision of the page in the dump.
+
+        `section` and `expandtemplates` are not supported, as they require
+        the parser of the site.
+        """
+        if section is not None or expandtemplates:
+            raise NotImplementedError(
+                'Sections and template expansion need the API')
+        if not self.exists:
+            return u''
+        revision = revision_dict(self.element.findall('revision')[-1],
+                                 'timestamp|content')
+        self.last_rev_time = revision['timestamp']
+        return revision['*']
+
+    def revisions(self, startid=None, endid=None, start=None, end=None,
+                  direc='older', user=None, excludeuser=None, limit=50,
+                  prop='ids|timestamp|flags|comment|user', **kwargs):
+        """List the revisions of the page in the dump, with the arguments
+        of `Page.revisions()`. Only the last revision is included in
+        pages-articles dumps, all of them in pages-meta-history ones.
+
+        Returns:
+            A generator of revisions (dicts).
+        """
+        if self.element is None:
+            return
+        elements = self.element.findall('revision')
+        if direc == 'older':
+            elements.reverse()
+        for element in elements:
+            revid = int(element.findtext('id'))
+            timestamp = element.findtext('timestamp')
+            if direc == 'older':
+                if ((startid is not None and revid > startid)
+                        or (start is not None and timestamp > start)):
+                    continue
+                if ((endid is not None and revid < endid)
+                        or (end is not None and timestamp < end)):
+                    return
+            else:
+                if ((startid is not None and revid < startid)
+                        or (start is not None and timestamp < start)):
+                    continue
+                if ((endid is not None and revid > endid)
+                        or (end is not None and timestamp > end)):
+                    return
+            if user is not None or excludeuser is not None:
+                author = revision_dict(element, 'user').get('user')
+                if user is not None and author != user:
+                    continue
+                if excludeuser is not None and author == excludeuser:
+                    continue
+            yield revision_dict(element, prop)
@@ -14,6 +14,10 @@ class MaximumRetriesExceeded(MwKlientError):
     pass
 
 
+class DeadlineExceeded(MaximumRetriesExceeded):
+    pass
+
+
 class APIError(MwKlientError):
 
     def __init__(self, code, info, kwargs):
@@ -113,3 +117,7 @@ class InvalidResponse(MwKlientError):
 
 class InvalidPageTitle(MwKlientError):
     pass
+
+
+class UploadStateError(MwKlientError):
+    pass
@@ -53,7 +53,8 @@ class ConfiguredSite(client.Site):
             ext=self.config.get('ext', '.php'),
             do_init=not do_login,
             retry_timeout=self.config.get('retry_timeout', 30),
-            max_retries=self.config.get('max_retries', -1),
+            max_retries=self.config.get('max_retries', 0),
+            deadline=self.config.get('deadline'),
         )
 
         if do_login:
@@ -83,7 +84,8 @@ class ConfiguredPool(list):
                                     pool=self.pool, do_init=not do_login,
                                     retry_timeout=site.get(
                                         'retry_timeout', 30),
-                                    max_retries=site.get('max_retries', -1)))
+                                    max_retries=site.get('max_retries', 0),
+                                    deadline=site.get('deadline')))
             if do_login:
                 self[-1].login(site['username'], site['password'])
             self[-1].config = site
@@ -1,8 +1,26 @@
+import threading
+import weakref
 import six
 from six import text_type
-from mwklient.util import parse_timestamp
+from six.moves.urllib.parse import urlencode
+from mwklient.util import parse_timestamp, batched, TimestampedItem
 import mwklient.page
 import mwklient.image
+import mwklient.stream
+import mwklient.metrics
+
+# Batches of titles whose encoding is longer than this are sent by POST, since
+# servers and proxies may refuse longer URLs
+MAX_GET_LENGTH = 2000
+
+
+def page_class(namespace):
+    """Return the class used for pages of the given namespace: one of
+    Category, Image or Page (default)."""
+    return {
+        14: Category,
+        6: mwklient.image.Image,
+    }.get(namespace, mwklient.page.Page)
 
 
 class List():
@@ -12,10 +30,45 @@ class List():
     This is a class providing lazy iteration.  This means that the
     content is loaded in chunks as long as the response hints at
     continuing content.
+
+    With `prefetch` set to N > 0, the chunks are loaded by a worker thread
+    while the previous ones are being consumed, keeping at most N chunks
+    loaded ahead of the one being consumed. The attribute can also be set
+    after the list has been created, as long as the iteration has not
+    started. The worker stops after the last chunk, when `max_items` is
+    reached, when `close()` is called, or when the list is garbage
+    collected after its iteration was abandoned.
+
+    `limit` is the number of items requested per chunk, 'max' by default:
+    the API then picks the highest limit of the module for the current user
+    at each request, which is lower for page contents.
+
+    With `lazy_timestamps` set to True, the 'timestamp' of the yielded items
+    is only parsed when it is read (see `mwklient.util.TimestampedItem`).
+
+    With `stream` set to True, the items are yielded while each chunk is
+    being downloaded (see `Site.stream_api()`) instead of once it has been
+    entirely loaded. This requires the `ijson` package, and is ignored
+    without it or when `prefetch` is set.
+
+    The position in the list can be saved with `state()`, as plain JSON
+    data, and restored in a new list with `resume()`. `checkpoint`, if set,
+    is called with the state after each chunk has been loaded, when all the
+    items of the previous chunks have been consumed:
+
+        >>> pages = site.allpages(generator=False)
+        >>> pages.checkpoint = lambda state: save(json.dumps(state))
+        >>> ...
+        >>> pages = site.allpages(generator=False).resume(json.loads(saved))
+
+    A resumed list loads again the chunk it was in, and skips the items of
+    that chunk that had been consumed.
     """
 
     def __init__(self, site, list_name, prefix, limit=None,
-                 return_values=None, max_items=None, *args, **kwargs):
+                 return_values=None, max_items=None, prefetch=0,
+                 lazy_timestamps=False, stream=False, checkpoint=None,
+                 *args, **kwargs):
         # NOTE: Fix limit
         self.site = site
         self.list_name = list_name
@@ -26,7 +79,7 @@ class List():
         self.args = kwargs
 
         if not limit:
-            limit = site.api_limit
+            limit = 'max'
         self.args[self.prefix + 'limit'] = text_type(limit)
         self.count = 0
         self.max_items = max_items
@@ -34,13 +87,78 @@ class List():
         self.last = False
         self.result_member = list_name
         self.return_values = return_values
+        self.prefetch = prefetch
+        self._chunks = None
+        self._stopped = None
+        self.lazy_timestamps = lazy_timestamps
+        self.stream = stream
+        self.checkpoint = checkpoint
+        # The arguments that loaded the current chunk, the number of its
+        # items consumed, and the number of items to skip after a resume
+        self._chunk_args = None
+        self._consumed = 0
+        self._skip = 0
+        self._done = False
 
     def __iter__(self):
         return self
 
+    def state(self):
+        """Return the position in the list, as a dict of plain JSON data to
+        be given to `resume()`."""
+        args = self.args if self._chunk_args is None else self._chunk_args
+        return {
+            'list_name': self.list_name,
+            'args': dict(args),
+            'consumed': self._consumed + self._skip,
+            'count': self.count,
+            'done': self._done,
+        }
+
+    def resume(self, state):
+        """Restore the position saved by `state()`, before the iteration
+        starts.
+
+        Returns:
+            The list itself.
+        """
+        if state['list_name'] != self.list_name:
+            raise RuntimeError('Cannot resume a list of %s from a list of %s'
+                               % (self.list_name, state['list_name']))
+        self.args = dict(state['args'])
+        self._chunk_args = None
+        self._skip = state['consumed']
+        self.count = state['count']
+        self._done = self.last = state['done']
+        return self
+
+    def _next_raw(self):
+        """Return the next raw item of the current chunk, skipping the
+        items consumed before a resume."""
+        while True:
+            item = six.next(self._iter)
+            if item is None:
+                continue
+            self._consumed += 1
+            if not self._skip:
+                return item
+            self._skip -= 1
+
+    def _chunk_loaded(self, chunk_args):
+        self._chunk_args = chunk_args
+        self._consumed = 0
+        if self.checkpoint is not None:
+            self.checkpoint(self.state())
+
+    def close(self):
+        """Stop the worker thread prefetching the chunks, if any."""
+        if self._stopped is not None:
+            self._stopped.set()
+
     def __next__(self):
         if self.max_items is not None:
             if self.count >= self.max_items:
+                self.close()
                 raise StopIteration
 
         # For filered lists, we might have to do several requests
@@ -48,17 +166,49 @@ class List():
         # See: https://github.com/mwclient/mwclient/issues/194
         while True:
             try:
-                item = six.next(self._iter)
-                if item is not None:
-                    break
+                item = self._next_raw()
+                break
             except StopIteration:
                 if self.last:
+                    self._done = True
                     raise
                 self.load_chunk()
 
+        return self.make_item(item)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        """Asynchronous iteration, for lists of an `AsyncSite`."""
+        if self.max_items is not None:
+            if self.count >= self.max_items:
+                self.close()
+                raise StopAsyncIteration
+
+        while True:
+            try:
+                item = self._next_raw()
+                break
+            except StopIteration:
+                if self.last:
+                    self._done = True
+                    raise StopAsyncIteration
+                await self.aload_chunk()
+
+        return self.make_item(item)
+
+    def make_item(self, item):
+        """Turn a raw item of the API response into the value yielded by the
+        list."""
         self.count += 1
         if 'timestamp' in item:
-            item['timestamp'] = parse_timestamp(item['timestamp'])
+            if self.lazy_timestamps:
+                item = TimestampedItem(item)
+            else:
+                # The response may be shared, see `Site.coalesce`
+                item = dict(item)
+                item['timestamp'] = parse_timestamp(item['timestamp'])
 
         if isinstance(self, GeneratorList):
             return item
@@ -83,20 +233,145 @@ class List():
         style continuation).
 
         Else, set `self.last` to True.
+
+        Then `self.checkpoint` is called, if set.
+        """
+        module = self._module_name()
+        with self.site.metrics.span('load_chunk', module=module):
+            if self.prefetch:
+                chunk_args = self._load_prefetched_chunk()
+            elif self.stream and mwklient.stream.available():
+                chunk_args = dict(self.args)
+                self._iter = self._streamed_chunk()
+            else:
+                chunk_args = dict(self.args)
+                data = self.site.get('query', *self.chunk_args())
+                if not data:
+                    # Non existent page
+                    raise StopIteration
+                self.handle_chunk(data)
+        self.site.metrics.record(module, chunks=1)
+        self._chunk_loaded(chunk_args)
+
+    def _load_prefetched_chunk(self):
+        """Take the next chunk loaded by the worker thread.
+
+        Returns:
+            The arguments that loaded it.
         """
-        data = self.site.get(
-            'query', (self.generator, self.list_name),
-            *[(text_type(k), v) for k, v in six.iteritems(self.args)]
-        )
+        if self._chunks is None:
+            self._chunks = six.moves.queue.Queue()
+            self._free_slots = threading.BoundedSemaphore(self.prefetch)
+            self._stopped = threading.Event()
+            # Stops the worker once the list is abandoned
+            weakref.finalize(self, self._stopped.set)
+            worker = threading.Thread(
+                target=self._prefetch_chunks,
+                args=(weakref.ref(self), self._chunks, self._free_slots,
+                      self._stopped))
+            worker.daemon = True
+            worker.start()
+
+        data, last, err, chunk_args = self._chunks.get()
+        self._free_slots.release()
+        if err is not None:
+            raise err
         if not data:
             # Non existent page
             raise StopIteration
+        if 'query' in data:
+            self.set_iter(data)
+        self.last = last
+        return chunk_args
+
+    @staticmethod
+    def _prefetch_chunks(ref, chunks, free_slots, stopped):
+        """Load the chunks ahead of the consumer (runs in a worker thread),
+        until the last one or until `stopped` is set.
 
+        The list is only referenced weakly (`ref`) while waiting for a free
+        slot, so that an abandoned list can be garbage collected.
+        """
+        try:
+            while True:
+                while not free_slots.acquire(timeout=0.1):
+                    if stopped.is_set():
+                        return
+                lst = ref()
+                if lst is None or stopped.is_set():
+                    return
+                chunk_args = dict(lst.args)
+                data = lst.site.get('query', *lst.chunk_args())
+                last = not data or not lst.continue_from(data)
+                del lst
+                chunks.put((data, last, None, chunk_args))
+                if last:
+                    return
+        except Exception as err:  # pylint: disable=broad-except
+            # Raised in the consumer thread instead
+            chunks.put((None, True, err, None))
+
+    def _streamed_chunk(self):
+        """Yield the items of the next chunk while it is being downloaded,
+        then apply its continuation."""
+        stream = self.site.stream_api('query', self.stream_member(), 'GET',
+                                      *self.chunk_args())
+        for item in stream:
+            yield item
+        if not self.continue_from(stream.result):
+            self.last = True
+
+    def stream_member(self):
+        """Return the path to the items of a chunk, for
+        `Site.stream_api()`."""
+        return 'query.' + self.result_member
+
+    async def aload_chunk(self):
+        """Asynchronous version of `load_chunk()`, for lists of an
+        `AsyncSite`."""
+        chunk_args = dict(self.args)
+        data = await self.site.get('query', *self.chunk_args())
+        try:
+            if not data:
+                # Non existent page
+                raise StopIteration
+            self.handle_chunk(data)
+        except StopIteration:
+            # A coroutine must not let StopIteration escape
+            self._iter = iter(six.moves.range(0))
+            self.last = True
+            return
+        self.site.metrics.record(self._module_name(), chunks=1)
+        self._chunk_loaded(chunk_args)
+
+    def _module_name(self):
+        """Return the name under which the list is recorded in the metrics
+        of the site."""
+        return mwklient.metrics.module_name({'action': 'query',
+                                             self.generator: self.list_name})
+
+    def chunk_args(self):
+        """Return the query arguments used to load the next chunk."""
+        return [(self.generator, self.list_name)] + [
+            (text_type(k), v) for k, v in six.iteritems(self.args)]
+
+    def handle_chunk(self, data):
+        """Update the iterator and the continuation arguments with a chunk
+        returned by the API."""
         # Process response if not empty.
         # See: https://github.com/mwclient/mwclient/issues/194
         if 'query' in data:
             self.set_iter(data)
 
+        if not self.continue_from(data):
+            self.last = True
+
+    def continue_from(self, data):
+        """Add the continuation of the API response `data` to `self.args`.
+
+        Returns:
+            False if `data` is the last chunk, True otherwise.
+        """
         if data.get('continue'):
             # New style continuation, added in MediaWiki 1.21
             self.args.update(data['continue'])
@@ -106,7 +381,8 @@ class List():
             self.args.update(data['query-continue'][self.list_name])
 
         else:
-            self.last = True
+            return False
+        return True
 
     def set_iter(self, data):
         """Set `self._iter` to the API response `data`."""
@@ -144,6 +420,9 @@ class NestedList(List):
     def set_iter(self, data):
         self._iter = iter(data['query'][self.result_member][self.nested_param])
 
+    def stream_member(self):
+        return 'query.{}.{}'.format(self.result_member, self.nested_param)
+
 
 class GeneratorList(List):
     """Lazy-loaded list of Page, Image or Category objects
@@ -167,20 +446,16 @@ class GeneratorList(List):
         self.result_member = 'pages'
         self.page_class = mwklient.page.Page
 
-    def __next__(self):
-        info = super(GeneratorList, self).__next__()
-        if info['ns'] == 14:
-            return Category(self.site, u'', info)
-        if info['ns'] == 6:
-            return mwklient.image.Image(self.site, u'', info)
-        return mwklient.page.Page(self.site, u'', info)
+    def make_item(self, item):
+        info = super(GeneratorList, self).make_item(item)
+        return page_class(info['ns'])(self.site, u'', info)
 
-    def load_chunk(self):
+    def chunk_args(self):
         # Put this here so that the constructor does not fail
         # on uninitialized sites
         iiprop = 'timestamp|user|comment|url|size|sha1|metadata|archivename'
         self.args['iiprop'] = iiprop
-        return super(GeneratorList, self).load_chunk()
+        return super(GeneratorList, self).chunk_args()
 
 
 class Category(mwklient.page.Page, GeneratorList):
@@ -239,6 +514,76 @@ class PageList(GeneratorList):
         Returns:
             One of Category, Image or Page (default), according to namespace.
         """
+        full_page_name, namespace = self.resolve(name)
+        return page_class(namespace)(self.site, full_page_name, info)
+
+    def fetch_many(self, names, redirects=False):
+        """Load many pages at once, packing their titles into as few queries
+        as possible (see `Site.titles_limit`).
+
+        Pages are yielded as soon as the batch holding them has been
+        received, in the same order as `names`. Titles are normalized by the
+        API, so e.g. 'foo bar' yields the page 'Foo bar'. Batches too long to
+        fit in a URL (see `MAX_GET_LENGTH`) are sent by POST.
+
+        Args:
+            names (iterable): The names of the pages, as accepted by `get()`
+            redirects (bool): Yield the targets of redirect pages instead of
+                the redirects themselves.
+
+        Returns:
+            A generator of Category, Image or Page objects.
+        """
+        titles = (self.resolve(name)[0] for name in names)
+        kwargs = {}
+        if redirects:
+            kwargs['redirects'] = ''
+        for batch in batched(titles, self.site.titles_limit):
+            query = self._fetch_batch(titles='|'.join(batch), **kwargs)
+            pages = {info['title']: info
+                     for info in six.itervalues(query.get('pages', {}))}
+            aliases = {}
+            for alias in query.get('normalized', []):
+                aliases[alias['from']] = alias['to']
+            for alias in query.get('redirects', []):
+                aliases[alias['from']] = alias['to']
+            for title in batch:
+                # A title can be normalized, then resolved as a redirect
+                seen = set()
+                while title not in pages and title in aliases:
+                    if title in seen:
+                        # A redirect loop
+                        break
+                    seen.add(title)
+                    title = aliases[title]
+                if title in pages:
+                    yield self._page_from_info(pages[title])
+
+    def fetch_many_ids(self, pageids):
+        """Same as `fetch_many()`, but the pages are given by their ids."""
+        for batch in batched(pageids, self.site.titles_limit):
+            query = self._fetch_batch(
+                pageids='|'.join(text_type(pageid) for pageid in batch))
+            pages = query.get('pages', {})
+            for pageid in batch:
+                if text_type(pageid) in pages:
+                    yield self._page_from_info(pages[text_type(pageid)])
+
+    def _fetch_batch(self, **kwargs):
+        iiprop = 'timestamp|user|comment|url|size|sha1|metadata|archivename'
+        if len(urlencode(kwargs)) > MAX_GET_LENGTH:
+            call = self.site.post
+        else:
+            call = self.site.get
+        return call('query', prop='info|imageinfo', inprop='protection',
+                    iiprop=iiprop, **kwargs).get('query', {})
+
+    def _page_from_info(self, info):
+        return page_class(info.get('ns', 0))(self.site, info.get('title', u''),
+                                             info)
+
+    def resolve(self, name):
+        """Return the full page name and the namespace of the page `name`."""
         if self.namespace != 0:
             full_page_name = u"{namespace}:{name}".format(
                 namespace=self.site.namespaces[self.namespace],
@@ -252,13 +597,7 @@ class PageList(GeneratorList):
             except AttributeError:
                 # raised when `namespace` doesn't have a `startswith` attribute
                 namespace = 0
-
-        cls = {
-            14: Category,
-            6: mwklient.image.Image,
-        }.get(namespace, mwklient.page.Page)
-
-        return cls(self.site, full_page_name, info)
+        return full_page_name, namespace
 
     def guess_namespace(self, name):
         """Guess the namespace from name
@@ -302,6 +641,9 @@ class PageProperty(List):
                 return
         raise StopIteration
 
+    def stream_member(self):
+        return 'query.pages.*.' + self.list_name
+
 
 class PagePropertyGenerator(GeneratorList):
 
@@ -314,7 +656,7 @@ class PagePropertyGenerator(GeneratorList):
 
 class RevisionsIterator(PageProperty):
 
-    def load_chunk(self):
+    def chunk_args(self):
         if 'rvstartid' in self.args and 'rvstart' in self.args:
             del self.args['rvstart']
-        return super(RevisionsIterator, self).load_chunk()
+        return super(RevisionsIterator, self).chunk_args()
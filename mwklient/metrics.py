@@ -0,0 +1,138 @@
+"""Counters and timings of the requests sent to a site, by API module.
+
+    >>> site.metrics.snapshot()['query+allpages']
+    {'requests': 12, 'errors': 0, 'bytes_out': 1380, 'bytes_in': 482113,
+     'http_time': 3.52, 'decode_time': 0.08, 'retries': 1,
+     'sleep_time': 5.0, 'chunks': 12}
+
+Callbacks, and tracers following the OpenTelemetry API, can also be told
+about every HTTP request (`raw_call`), API call (`raw_api`) and chunk of a
+list (`load_chunk`).
+"""
+import contextlib
+import logging
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+
+COUNTERS = ('requests', 'errors', 'bytes_out', 'bytes_in', 'http_time',
+            'decode_time', 'retries', 'sleep_time', 'chunks')
+
+
+def module_name(data):
+    """Return the name of the module called with the parameters `data`: its
+    action, followed for queries by their submodules, as in
+    'query+allpages' or 'query+info|revisions'."""
+    action = data.get('action') or ''
+    if action != 'query':
+        return action
+    modules = [data[key] for key in ('generator', 'list', 'prop', 'meta')
+               if data.get(key)]
+    return '+'.join([action] + modules)
+
+
+class Metrics():
+    """The metrics of a site, shared by its threads.
+
+    For each module, `snapshot()` gives:
+
+    - requests: the number of HTTP requests sent, retries included
+    - errors: the number of requests that got no response
+    - bytes_out, bytes_in: the size of the request bodies (or URLs) and of
+      the response bodies
+    - http_time: the seconds spent waiting for the responses
+    - decode_time: the seconds spent decoding the JSON responses
+    - retries, sleep_time: the number of retries and the seconds slept
+      before them
+    - chunks: the number of chunks loaded by lists
+
+    Hooks are called at the end of each span, with its name ('raw_call',
+    'raw_api' or 'load_chunk'), its attributes, its duration in seconds and
+    the exception it raised, if any:
+
+        >>> def slow(name, attributes, duration, error):
+        ...     if duration > 10:
+        ...         print(name, attributes['module'], duration)
+        >>> site.metrics.add_hook(slow)
+
+    With a `tracer` such as ``opentelemetry.trace.get_tracer('mwklient')``,
+    every span is traced as well, named after the span ('mwklient.raw_call').
+    """
+
+    def __init__(self, tracer=None):
+        self.lock = threading.Lock()
+        self.modules = {}
+        self.hooks = []
+        self.tracer = tracer
+
+    def __repr__(self):
+        return '<Metrics object for %d modules>' % len(self.modules)
+
+    def record(self, module, **values):
+        """Add `values` to the counters of `module`."""
+        with self.lock:
+            counters = self.modules.get(module)
+            if counters is None:
+                counters = self.modules[module] = dict.fromkeys(COUNTERS, 0)
+            for name, value in values.items():
+                counters[name] += value
+
+    def snapshot(self):
+        """Return a copy of the counters, by module."""
+        with self.lock:
+            return {module: dict(counters)
+                    for module, counters in self.modules.items()}
+
+    def total(self):
+        """Return the sum of the counters of all the modules."""
+        total = dict.fromkeys(COUNTERS, 0)
+        for counters in self.snapshot().values():
+            for name, value in counters.items():
+                total[name] += value
+        return total
+
+    def reset(self):
+        """Set all the counters back to zero."""
+        with self.lock:
+            self.modules = {}
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+        """Time the block, and report it to the hooks and the tracer.
+
+        Yields:
+            The attributes of the span, to which the block can add some.
+        """
+        if not self.hooks and self.tracer is None:
+            yield attributes
+            return
+
+        with contextlib.ExitStack() as stack:
+            span = None
+            if self.tracer is not None:
+                span = stack.enter_context(self.tracer.start_as_current_span(
+                    'mwklient.' + name, attributes=dict(attributes)))
+            error = None
+            start = time.perf_counter()
+            try:
+                yield attributes
+            except Exception as err:
+                error = err
+                raise
+            finally:
+                duration = time.perf_counter() - start
+                if span is not None:
+                    for key, value in attributes.items():
+                        span.set_attribute(key, value)
+                for hook in list(self.hooks):
+                    try:
+                        hook(name, attributes, duration, error)
+                    except Exception:  # pylint: disable=broad-except
+                        LOG.exception('Metrics hook %r failed', hook)
@@ -0,0 +1,233 @@
+"""A local copy of the pages of a site, kept up to date from the recent
+changes.
+
+    >>> from mwklient.mirror import Mirror
+    >>> mirror = Mirror(site, 'wiki.sqlite', namespaces=(0, 10))
+    >>> mirror.seed()         # Once: download every page
+    >>> mirror.update()       # Later: only the pages changed since
+    >>> mirror.text('Main Page')
+"""
+import logging
+import sqlite3
+import time
+import six
+from six import text_type
+
+from mwklient.util import batched
+
+LOG = logging.getLogger(__name__)
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS pages (
+    title TEXT PRIMARY KEY,
+    pageid INTEGER,
+    namespace INTEGER,
+    revid INTEGER,
+    timestamp TEXT,
+    redirect INTEGER,
+    text TEXT
+);
+CREATE INDEX IF NOT EXISTS pages_namespace ON pages (namespace, title);
+CREATE TABLE IF NOT EXISTS state (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+# The page columns returned by `Mirror.page()`
+COLUMNS = ('title', 'pageid', 'namespace', 'revid', 'timestamp', 'redirect',
+           'text')
+
+
+class Mirror():
+    """The current wikitext and metadata of the pages of some namespaces of
+    a site, stored in an SQLite database.
+
+    `seed()` downloads every page, and `update()` then refetches only the
+    pages changed since the last update (or the seed), as listed by the
+    recent changes. Both can be interrupted and called again: the position
+    in the recent changes (`watermark`) is saved after each batch of pages.
+
+    Args:
+        site (Site): The site to mirror
+        path (str): The path of the database, created if needed
+        namespaces (iterable): The numbers of the namespaces to mirror.
+            Defaults to those of the last seed, or to the main namespace.
+        slot (str): The content slot to mirror
+    """
+
+    def __init__(self, site, path, namespaces=None, slot='main'):
+        self.site = site
+        self.path = path
+        self.slot = slot
+        self.db = sqlite3.connect(path)
+        with self.db:
+            self.db.executescript(SCHEMA)
+        if namespaces is None:
+            stored = self._get_state('namespaces')
+            namespaces = stored.split('|') if stored else (0,)
+        self.namespaces = sorted(int(ns) for ns in namespaces)
+
+    def __repr__(self):
+        return "<Mirror object '%s' of %s>" % (self.path, self.site)
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
+
+    def __contains__(self, title):
+        return self.db.execute('SELECT 1 FROM pages WHERE title = ?',
+                               (title,)).fetchone() is not None
+
+    def close(self):
+        self.db.close()
+
+    def _get_state(self, name):
+        row = self.db.execute('SELECT value FROM state WHERE name = ?',
+                              (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, name, value):
+        self.db.execute('INSERT OR REPLACE INTO state VALUES (?, ?)',
+                        (name, value))
+
+    @property
+    def watermark(self):
+        """The (timestamp, rcid) of the last recent change applied, or None
+        if the mirror has not been seeded."""
+        timestamp = self._get_state('rc_timestamp')
+        if timestamp is None:
+            return None
+        return timestamp, int(self._get_state('rc_id'))
+
+    def _set_watermark(self, timestamp, rcid):
+        self._set_state('rc_timestamp', timestamp)
+        self._set_state('rc_id', text_type(rcid))
+
+    def page(self, title):
+        """Return the mirrored page `title` as a dict (see `COLUMNS`), or
+        None if it is not in the mirror."""
+        row = self.db.execute(
+            'SELECT %s FROM pages WHERE title = ?' % ', '.join(COLUMNS),
+            (title,)).fetchone()
+        return dict(zip(COLUMNS, row)) if row else None
+
+    def text(self, title):
+        """Return the mirrored text of page `title`, or None if it is not in
+        the mirror."""
+        row = self.db.execute('SELECT text FROM pages WHERE title = ?',
+                              (title,)).fetchone()
+        return row[0] if row else None
+
+    def titles(self, namespace=None):
+        """Return a generator of the mirrored titles, in alphabetical order,
+        of all the namespaces or of `namespace` only."""
+        if namespace is None:
+            cursor = self.db.execute('SELECT title FROM pages ORDER BY title')
+        else:
+            cursor = self.db.execute(
+                'SELECT title FROM pages WHERE namespace = ? ORDER BY title',
+                (namespace,))
+        return (row[0] for row in cursor)
+
+    def _last_change(self):
+        """Return the (timestamp, rcid) of the last recent change of the
+        site."""
+        result = self.site.get('query', list='recentchanges',
+                               rcprop='timestamp|ids', rclimit=1)
+        changes = result['query']['recentchanges']
+        if not changes:
+            return time.strftime(TIMESTAMP_FORMAT, time.gmtime()), 0
+        return changes[0]['timestamp'], changes[0]['rcid']
+
+    def seed(self):
+        """Download all the pages of the mirrored namespaces, replacing the
+        content of the mirror.
+
+        Returns:
+            The number of pages stored.
+        """
+        # Changes made while seeding are applied again by the next update
+        timestamp, rcid = self._last_change()
+        with self.db:
+            self.db.execute('DELETE FROM pages')
+            self._set_state('namespaces',
+                            '|'.join(text_type(ns) for ns in self.namespaces))
+            self.db.execute("DELETE FROM state WHERE name LIKE 'rc_%'")
+
+        count = 0
+        for namespace in self.namespaces:
+            titles = self.site.allpages(namespace=text_type(namespace),
+                                        generator=False)
+            for batch in batched(titles, self.site.titles_limit):
+                count += self._fetch(batch)
+        with self.db:
+            self._set_watermark(timestamp, rcid)
+        LOG.info('Seeded %s with %d pages', self.path, count)
+        return count
+
+    def _changes(self):
+        """Yield the (title, timestamp, rcid) of the changes not applied
+        yet, oldest first, several times for moves (the old title and the
+        new one)."""
+        if self.watermark is None:
+            raise RuntimeError('The mirror must be seeded first')
+        start, last_rcid = self.watermark
+        changes = self.site.recentchanges(
+            start=start, direc='newer',
+            namespace='|'.join(text_type(ns) for ns in self.namespaces),
+            prop='title|timestamp|ids|loginfo', type_t='edit|new|log')
+        for change in changes:
+            timestamp = change['timestamp']
+            if not isinstance(timestamp, six.string_types):
+                timestamp = time.strftime(TIMESTAMP_FORMAT, timestamp)
+            if timestamp == start and change['rcid'] <= last_rcid:
+                # Already applied by the previous update
+                continue
+            yield change['title'], timestamp, change['rcid']
+            params = change.get('logparams')
+            if isinstance(params, dict) and 'target_title' in params:
+                yield params['target_title'], timestamp, change['rcid']
+
+    def update(self):
+        """Refetch the pages changed since the last update, in batches.
+
+        Returns:
+            The number of pages refetched, or removed from the mirror
+            because they were deleted or moved out of its namespaces.
+        """
+        count = 0
+        for batch in batched(self._changes(), self.site.titles_limit):
+            titles = list(set(title for title, _, _ in batch))
+            count += self._fetch(titles, last_change=batch[-1][1:])
+        return count
+
+    def _fetch(self, titles, last_change=None):
+        """Download the current text of the pages `titles` and store them,
+        along with the (timestamp, rcid) of the last change applied.
+
+        Returns:
+            The number of pages stored or removed.
+        """
+        rows = []
+        removed = []
+        for page, text in self.site.texts(titles, slot=self.slot):
+            if page.exists and page.namespace in self.namespaces:
+                timestamp = None
+                if page.last_rev_time:
+                    timestamp = time.strftime(TIMESTAMP_FORMAT,
+                                              page.last_rev_time)
+                rows.append((page.name, page.pageid, page.namespace,
+                             page.revision, timestamp, int(page.redirect),
+                             text))
+            else:
+                removed.append((page.name,))
+        with self.db:
+            self.db.executemany(
+                'INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)',
+                rows)
+            self.db.executemany('DELETE FROM pages WHERE title = ?', removed)
+            if last_change is not None:
+                self._set_watermark(*last_change)
+        return len(rows) + len(removed)
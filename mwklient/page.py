@@ -1,3 +1,4 @@
+import inspect
 import six
 from mwklient.util import parse_timestamp, strip_namespace
 import mwklient.listing
@@ -72,14 +73,38 @@ class Page(READ.Mixin, EDIT.Mixin, LINK.Mixin, HAZARD.Mixin):
     def redirects_to(self):
         """ Returns the redirect target page, or None if the page is not a
         redirect page."""
+        self._check_sync('aredirects_to')
         info = self.site.get(
-            'query', prop='pageprops', titles=self.name, redirects='')['query']
+            'query', prop='pageprops', titles=self.name, redirects='')
+        target = self._redirect_target(info['query'])
+        if target is None:
+            return None
+        return Page(self.site, target)
+
+    async def aredirects_to(self):
+        """Asynchronous version of `redirects_to()`, for pages of an
+        `AsyncSite`."""
+        info = await self.site.get(
+            'query', prop='pageprops', titles=self.name, redirects='')
+        target = self._redirect_target(info['query'])
+        if target is None:
+            return None
+        return await self.site.pages[target]
+
+    def _redirect_target(self, info):
         if 'redirects' in info:
             for page in info['redirects']:
                 if page['from'] == self.name:
-                    return Page(self.site, page['to'])
+                    return page['to']
         return None
 
+    def _check_sync(self, alternative):
+        """Raise TypeError if the page belongs to an `AsyncSite`, whose API
+        calls are coroutines: `alternative` must be awaited instead."""
+        if inspect.iscoroutinefunction(self.site.get):
+            raise TypeError('Pages of an AsyncSite must use {}()'.format(
+                alternative))
+
     def resolve_redirect(self):
         """ Returns the redirect target page, or the current page if it's not a
         redirect page."""
@@ -146,7 +171,7 @@ class Page(READ.Mixin, EDIT.Mixin, LINK.Mixin, HAZARD.Mixin):
                   expandtemplates=False,
                   section=None,
                   diffto=None,
-                  slots=None, uselang=None):
+                  slots=None, uselang=None, prefetch=0):
         """List revisions of the current page.
 
         API doc: https://www.mediawiki.org/wiki/API:Revisions
@@ -159,7 +184,8 @@ class Page(READ.Mixin, EDIT.Mixin, LINK.Mixin, HAZARD.Mixin):
             direc (str): Direction to list in: 'older' (default) or 'newer'.
             user (str): Only list revisions made by this user.
             excludeuser (str): Exclude revisions made by this user.
-            limit (int): The maximum number of revisions to return per request.
+            limit (int): The maximum number of revisions to return per request,
+                or 'max' for the highest limit allowed.
             prop (str): Which properties to get for each revision,
                 default: 'ids|timestamp|flags|comment|user'
             expandtemplates (bool): Expand templates in rvprop=content output
@@ -172,6 +198,8 @@ class Page(READ.Mixin, EDIT.Mixin, LINK.Mixin, HAZARD.Mixin):
                 content from.
             uselang (str): Language to use for parsed edit comments and other
                            localized messages.
+            prefetch (int): Number of chunks to load ahead in a worker thread
+                            (see `mwklient.listing.List`).
 
         Returns:
             mwklient.listings.List: Revision iterator
@@ -201,4 +229,4 @@ class Page(READ.Mixin, EDIT.Mixin, LINK.Mixin, HAZARD.Mixin):
             kwargs['rvsection'] = section
 
         return mwklient.listing.RevisionsIterator(
-            self, 'revisions', 'rv', limit=limit, **kwargs)
+            self, 'revisions', 'rv', limit=limit, prefetch=prefetch, **kwargs)
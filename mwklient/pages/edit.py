@@ -64,6 +64,7 @@ class Mixin:
         return text
 
     def _check_edit(self):
+        self.site.ensure_user_state()
         if not self.site.logged_in and self.site.force_login:
             raise mwklient.errors.AssertUserFailedError()
         if self.site.blocked:
@@ -89,7 +90,7 @@ class Mixin:
             raise mwklient.errors.AssertUserFailedError()
         raise err
 
-    def _edit(self, summary, minor, bot, section, **kwargs):
+    def _edit_data(self, minor, bot, section, **kwargs):
         self._check_edit()
 
         data = {}
@@ -112,6 +113,31 @@ class Mixin:
 
         if self.site.force_login:
             data['assert'] = 'user'
+        return data
+
+    def _check_edit_result(self, result):
+        if result['edit'].get('result').lower() == 'failure':
+            raise mwklient.errors.EditError(self, result['edit'])
+        return result
+
+    def _edit_done(self, result):
+        # 'newtimestamp' is not included if no change was made
+        if 'newtimestamp' in result['edit'].keys():
+            self.last_rev_time = parse_timestamp(
+                result['edit'].get('newtimestamp'))
+        if 'newrevid' in result['edit']:
+            self.revision = result['edit']['newrevid']
+
+        # Workaround for https://phabricator.wikimedia.org/T211233
+        self.site.clear_cookies('PostEditRevision')
+
+        # clear the page text cache
+        self._textcache = {}
+        return result['edit']
+
+    def _edit(self, summary, minor, bot, section, **kwargs):
+        self._check_sync('aedit')
+        data = self._edit_data(minor, bot, section, **kwargs)
 
         def do_edit():
             result = self.site.post(
@@ -120,9 +146,7 @@ class Mixin:
                 summary=summary,
                 token=self.__get_token__('edit'),
                 **data)
-            if result['edit'].get('result').lower() == 'failure':
-                raise mwklient.errors.EditError(self, result['edit'])
-            return result
+            return self._check_edit_result(result)
 
         try:
             result = do_edit()
@@ -137,20 +161,35 @@ class Mixin:
             else:
                 self.handle_edit_error(err, summary)
 
-        # 'newtimestamp' is not included if no change was made
-        if 'newtimestamp' in result['edit'].keys():
-            self.last_rev_time = parse_timestamp(
-                result['edit'].get('newtimestamp'))
+        return self._edit_done(result)
 
-        # Workaround for https://phabricator.wikimedia.org/T211233
-        for cookie in self.site.connection.cookies:
-            if 'PostEditRevision' in cookie.name:
-                self.site.connection.cookies.clear(
-                    cookie.domain, cookie.path, cookie.name)
+    async def _aedit(self, summary, minor, bot, section, **kwargs):
+        data = self._edit_data(minor, bot, section, **kwargs)
 
-        # clear the page text cache
-        self._textcache = {}
-        return result['edit']
+        async def do_edit():
+            token = await self.site.get_token('edit', title=self.name)
+            result = await self.site.post(
+                'edit',
+                title=self.name,
+                summary=summary,
+                token=token,
+                **data)
+            return self._check_edit_result(result)
+
+        try:
+            result = await do_edit()
+        except mwklient.errors.APIError as err:
+            if err.code == 'badtoken':
+                # Retry, but only once to avoid an infinite loop
+                await self.site.get_token('edit', True, title=self.name)
+                try:
+                    result = await do_edit()
+                except mwklient.errors.APIError as err:
+                    self.handle_edit_error(err, summary)
+            else:
+                self.handle_edit_error(err, summary)
+
+        return self._edit_done(result)
 
     def edit(self, text, summary=u'', minor=False, bot=True,
              section=None, **kwargs):
@@ -159,6 +198,13 @@ class Mixin:
         """
         return self._edit(summary, minor, bot, section, text=text, **kwargs)
 
+    async def aedit(self, text, summary=u'', minor=False, bot=True,
+                    section=None, **kwargs):
+        """Asynchronous version of `edit()`, for pages of an `AsyncSite`.
+        """
+        return await self._aedit(summary, minor, bot, section, text=text,
+                                 **kwargs)
+
     def append(self, text, summary=u'', minor=False, bot=True,
                section=None, **kwargs):
         """Append text to a section or the whole page by performing an edit
@@ -14,6 +14,7 @@ class Mixin:
         InsufficientPermission exception is raised.
 
         """
+        self.site.ensure_user_state()
         if self.cannot('move'):
             raise mwklient.errors.InsufficientPermission(self)
 
@@ -40,6 +41,7 @@ class Mixin:
         InsufficientPermission exception is raised.
 
         """
+        self.site.ensure_user_state()
         if self.cannot('delete'):
             raise mwklient.errors.InsufficientPermission(self)
 
@@ -17,7 +17,11 @@ class Mixin:
         default, results will be cached and if you call text() again
         with the same section and expandtemplates the result will come
         from the cache. The cache is stored on the instance, so it
-        lives as long as the instance does.
+        lives as long as the instance does, and in the `content_cache` of
+        the site under the current revision ID, so that other instances
+        of the same page find it while the page is unchanged. Expanded
+        texts are only kept on the instance, since the templates may change
+        while the page does not.
 
         Args:
             section (int): numbered section or `None` to get the whole page
@@ -26,40 +30,131 @@ class Mixin:
             (default: `False`)
             cache (bool): set to `False` to disable caching (default: `True`)
         """
+        self._check_sync('atext')
+        section, shared, text = self._cached_text(section, expandtemplates,
+                                                  cache, slot)
+        if text is not None:
+            return text
+
+        revs = self.revisions(prop=self._text_prop(shared), limit=1,
+                              section=section, slots=slot)
+        try:
+            rev = next(revs)
+        except StopIteration:
+            rev = None
+        text = self._revision_text(rev, slot)
+        if expandtemplates:
+            # The 'rvexpandtemplates' option was removed in MediaWiki 1.32, so
+            # we have to make an extra API call.
+            # See: https://github.com/mwclient/mwclient/issues/214
+            text = self.site.expandtemplates(text)
+        return self._store_text(rev, text, section, expandtemplates, cache,
+                                shared, slot)
+
+    async def atext(self,
+                    section=None,
+                    expandtemplates=False,
+                    cache=True,
+                    slot='main'):
+        """Asynchronous version of `text()`, for pages of an `AsyncSite`."""
+        section, shared, text = self._cached_text(section, expandtemplates,
+                                                  cache, slot)
+        if text is not None:
+            return text
+
+        revs = self.revisions(prop=self._text_prop(shared), limit=1,
+                              section=section, slots=slot)
+        try:
+            rev = await revs.__anext__()
+        except StopAsyncIteration:
+            rev = None
+        text = self._revision_text(rev, slot)
+        if expandtemplates:
+            text = await self.site.expandtemplates(text)
+        return self._store_text(rev, text, section, expandtemplates, cache,
+                                shared, slot)
+
+    def _cached_text(self, section, expandtemplates, cache, slot):
+        """Check the permissions and look the text up in the caches, before
+        it is fetched by `text()` or `atext()`.
 
+        Returns:
+            A (section, shared, text) tuple: the section as sent to the API,
+            the content cache of the site to store the text in (or None), and
+            the text, or None if it must be fetched.
+        """
         if self.cannot('read'):
             raise mwklient.errors.InsufficientPermission(self)
-        if not self.exists:
-            return u''
         if section is not None:  # can be 0
             section = text_type(section)
+        if not self.exists:
+            return section, None, u''
 
         key = hash((section, expandtemplates))
         if cache and key in self._textcache:
-            return self._textcache[key]
-
-        revs = self.revisions(
-            prop='content|timestamp', limit=1, section=section, slots=slot)
-        try:
-            rev = next(revs)
-            if 'slots' in rev:
-                text = rev['slots'][slot]['*']
-            else:
-                text = rev['*']
-            self.last_rev_time = rev['timestamp']
-        except StopIteration:
-            text = u''
-            self.last_rev_time = None
+            return section, None, self._textcache[key]
+        # The templates may change while the page does not
+        shared = None
+        if cache and not expandtemplates:
+            shared = self._content_cache()
+        if shared is not None:
+            cached = shared.get(self.revision, slot, section, False)
+            if cached is not None:
+                text, self.last_rev_time = cached
+                self.edit_time = time.gmtime()
+                self._textcache[key] = text
+                return section, shared, text
+        return section, shared, None
+
+    def _store_text(self, rev, text, section, expandtemplates, cache, shared,
+                    slot):
+        """Cache the text fetched by `text()` or `atext()`, and return it."""
         if not expandtemplates:
             self.edit_time = time.gmtime()
-        else:
-            # The 'rvexpandtemplates' option was removed in MediaWiki 1.32, so
-            # we have to make an extra API call.
-            # See: https://github.com/mwclient/mwclient/issues/214
-            text = self.site.expandtemplates(text)
-
         if cache:
-            self._textcache[key] = text
+            self._textcache[hash((section, expandtemplates))] = text
+        if shared is not None and rev is not None and 'revid' in rev:
+            shared.set(rev['revid'], slot, section, False, text,
+                       self.last_rev_time)
+        return text
+
+    def _cache_revision(self, rev, slot):
+        """Remember the content of the current revision `rev` as the result
+        of `text()` called without arguments."""
+        text = self._revision_text(rev, slot)
+        self.edit_time = time.gmtime()
+        self._textcache[hash((None, False))] = text
+        shared = self._content_cache()
+        if shared is not None and 'revid' in rev:
+            shared.set(rev['revid'], slot, None, False, text,
+                       self.last_rev_time)
+        return text
+
+    def _content_cache(self):
+        """Return the content cache of the site, or None if there is none or
+        if the current revision of the page is not known."""
+        if not self.revision:
+            return None
+        return self.site.content_cache
+
+    @staticmethod
+    def _text_prop(shared):
+        # The revision ID is needed to store the content in the site cache
+        if shared is None:
+            return 'content|timestamp'
+        return 'content|timestamp|ids'
+
+    def _revision_text(self, rev, slot):
+        """Return the content of the revision `rev` (None if the page has no
+        revisions) and remember its timestamp."""
+        if rev is None:
+            self.last_rev_time = None
+            return u''
+        if 'slots' in rev:
+            text = rev['slots'][slot]['*']
+        else:
+            text = rev['*']
+        self.last_rev_time = rev['timestamp']
         return text
 
     def categories(self, generator=True, show=None):
@@ -0,0 +1,227 @@
+"""Concurrent enumeration of the alphabetical lists of a site (allpages,
+allimages, alllinks, allcategories and allusers), split into ranges of
+titles.
+
+    >>> for title in site.partitioned('allpages', partitions=16,
+    ...                               generator=False):
+    ...     print(title)
+"""
+import concurrent.futures
+import logging
+import threading
+import six
+from six.moves import queue
+
+import mwklient.page
+from mwklient.util import strip_namespace
+
+LOG = logging.getLogger(__name__)
+
+# The lists that can be partitioned, with the namespace of the pages whose
+# titles are sampled to split them, None meaning the 'namespace' argument
+SAMPLED_NAMESPACES = {
+    'allpages': None,
+    'alllinks': None,
+    'allimages': 6,
+    'allcategories': 14,
+    'allusers': 2,
+}
+
+LETTERS = u'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+# Sent by a worker when its range is done
+_DONE = object()
+
+
+def sort_key(title):
+    """Return the key ordering titles as the API does: by their UTF-8 bytes,
+    with underscores instead of spaces."""
+    return title.replace(u' ', u'_')
+
+
+def normalize(title):
+    return title.replace(u'_', u' ')
+
+
+def prefix_boundaries(partitions):
+    """Return `partitions` - 1 boundaries splitting the titles by their
+    first letter."""
+    step = len(LETTERS) / float(partitions)
+    letters = (LETTERS[int(round(i * step))]
+               for i in six.moves.range(1, partitions))
+    return sorted(set(letters), key=sort_key)
+
+
+def quantiles(titles, partitions):
+    """Return at most `partitions` - 1 boundaries splitting the sorted
+    `titles` into parts of the same size."""
+    titles = sorted(set(titles), key=sort_key)
+    if not titles:
+        return []
+    step = len(titles) / float(partitions)
+    boundaries = (titles[int(i * step)]
+                  for i in six.moves.range(1, partitions))
+    return sorted(set(boundaries), key=sort_key)
+
+
+class PartitionedList():
+    """A list split into ranges of titles, enumerated concurrently.
+
+    Each range is listed by its own call to the method of the site, with
+    its bounds as `start` and `end`. The upper bounds of the API are
+    inclusive, so the items equal to the upper bound of a range are dropped,
+    the next range starting with them.
+
+    Args:
+        site (Site): The site to list
+        method (str): The name of the method of `site` listing the items,
+            one of 'allpages', 'allimages', 'alllinks', 'allcategories' or
+            'allusers'
+        partitions (int): The number of ranges
+        workers (int): The number of ranges listed at the same time,
+            defaults to `partitions`. The connection pool of the site should
+            be at least as large.
+        boundaries (list): The titles splitting the ranges, without
+            namespace prefix. By default, they are chosen according to
+            `split`.
+        split (str): 'sample' to choose the boundaries from a sample of the
+            titles returned by ``list=random``, which follows the actual
+            distribution of the titles, or 'prefix' to split the titles by
+            their first letter.
+        ordered (bool): Yield the items in the order of the API, keeping
+            the items of the later ranges while the earlier ones are being
+            listed. Otherwise, they are yielded as soon as they are loaded.
+        kwargs: The arguments of the method. `start` and `end` bound the
+            whole list.
+    """
+
+    def __init__(self, site, method, partitions=8, workers=None,
+                 boundaries=None, split='sample', ordered=True, **kwargs):
+        if method not in SAMPLED_NAMESPACES:
+            raise RuntimeError('%s cannot be partitioned' % method)
+        if split not in {'sample', 'prefix'}:
+            raise RuntimeError('split must be "sample" or "prefix"')
+        self.site = site
+        self.method = method
+        self.partitions = partitions
+        self.workers = workers or partitions
+        self.split = split
+        self.ordered = ordered
+        self.kwargs = kwargs
+        self.namespace = SAMPLED_NAMESPACES[method]
+        if self.namespace is None:
+            self.namespace = int(kwargs.get('namespace', 0))
+        if boundaries is not None:
+            boundaries = sorted((normalize(title) for title in boundaries),
+                                key=sort_key)
+        self.boundaries = boundaries
+
+    def __repr__(self):
+        return "<PartitionedList object '%s' for %s>" % (self.method,
+                                                         self.site)
+
+    def sample_boundaries(self):
+        """Return boundaries splitting a sample of random titles into
+        parts of the same size."""
+        result = self.site.get('query', list='random',
+                               rnnamespace=self.namespace,
+                               rnlimit='max')
+        titles = [self.item_key(page['title'])
+                  for page in result['query']['random']]
+        prefix = self.kwargs.get('prefix')
+        if prefix:
+            titles = [title for title in titles
+                      if title.startswith(normalize(prefix))]
+        return quantiles(titles, self.partitions)
+
+    def ranges(self):
+        """Return the (start, end) bounds of the ranges, None meaning no
+        bound."""
+        boundaries = self.boundaries
+        if boundaries is None:
+            if self.split == 'sample':
+                boundaries = self.sample_boundaries()
+            else:
+                boundaries = prefix_boundaries(self.partitions)
+        start = self.kwargs.get('start')
+        end = self.kwargs.get('end')
+        if start is not None:
+            start = normalize(start)
+            boundaries = [title for title in boundaries
+                          if sort_key(title) > sort_key(start)]
+        if end is not None:
+            end = normalize(end)
+            boundaries = [title for title in boundaries
+                          if sort_key(title) <= sort_key(end)]
+        bounds = [start] + boundaries + [end]
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def item_key(self, item):
+        """Return the title of an item, without namespace prefix, as given
+        to the `start` and `end` arguments."""
+        if isinstance(item, mwklient.page.Page):
+            return item.page_title
+        if isinstance(item, dict):
+            if 'name' in item:
+                return normalize(item['name'])
+            if '*' in item:
+                return normalize(item['*'])
+            item = item['title']
+        if self.namespace != 0:
+            item = strip_namespace(item)
+        return normalize(item)
+
+    def _list_range(self, start, end, last, put, stopped):
+        """List the items of one range, passing them to `put`, until done or
+        `stopped` is set."""
+        kwargs = dict(self.kwargs, start=start, end=end)
+        for item in getattr(self.site, self.method)(**kwargs):
+            if stopped.is_set():
+                return
+            if not last and self.item_key(item) == end:
+                # Listed again as the first item of the next range
+                continue
+            put(item)
+
+    def __iter__(self):
+        ranges = self.ranges()
+        LOG.debug('Listing %s in %d ranges', self.method, len(ranges))
+        stopped = threading.Event()
+        if self.ordered:
+            queues = [queue.Queue() for _ in ranges]
+        else:
+            queues = [queue.Queue(maxsize=1000)] * len(ranges)
+
+        def work(i, start, end):
+            def put(item, err=None):
+                while not stopped.is_set():
+                    try:
+                        queues[i].put((item, err), timeout=0.1)
+                        return
+                    except queue.Full:
+                        pass
+            try:
+                self._list_range(start, end, i == len(ranges) - 1, put,
+                                 stopped)
+                put(_DONE)
+            except Exception as err:  # pylint: disable=broad-except
+                # Raised in the consumer thread instead
+                put(_DONE, err)
+
+        executor = concurrent.futures.ThreadPoolExecutor(self.workers)
+        try:
+            for i, (start, end) in enumerate(ranges):
+                executor.submit(work, i, start, end)
+            for i in six.moves.range(len(ranges)):
+                # In unordered mode, every range shares the same queue, and
+                # one range is done every time a _DONE is received
+                while True:
+                    item, err = queues[i].get()
+                    if err is not None:
+                        raise err
+                    if item is _DONE:
+                        break
+                    yield item
+        finally:
+            stopped.set()
+            executor.shutdown(wait=True)
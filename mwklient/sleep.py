@@ -1,10 +1,88 @@
+import random
+import threading
 import time
 import logging
-from mwklient.errors import MaximumRetriesExceeded
+import warnings
+from mwklient.errors import MaximumRetriesExceeded, DeadlineExceeded
 
 LOG = logging.getLogger(__name__)
 
 
+class LinearBackoff():
+    """Wait `retry_timeout` seconds for each past retry: 0, then
+    `retry_timeout`, 2 * `retry_timeout`..."""
+
+    def __init__(self, retry_timeout):
+        self.retry_timeout = retry_timeout
+
+    def __call__(self, retries, previous):
+        return self.retry_timeout * (retries - 1)
+
+
+class ExponentialBackoff():
+    """Wait `base` seconds, doubled at each retry up to `cap` seconds.
+
+    With `jitter`, the actual time is drawn at random between 0 and this
+    value ("full jitter"), so that clients failing together do not retry
+    together.
+    """
+
+    def __init__(self, base=1, cap=300, jitter=True):
+        self.base = base
+        self.cap = cap
+        self.jitter = jitter
+
+    def __call__(self, retries, previous):
+        timeout = min(self.cap, self.base * 2 ** (retries - 1))
+        if self.jitter:
+            timeout = random.uniform(0, timeout)
+        return timeout
+
+
+class DecorrelatedJitter():
+    """Wait a random time between `base` seconds and three times the previous
+    wait, up to `cap` seconds ("decorrelated jitter")."""
+
+    def __init__(self, base=1, cap=300):
+        self.base = base
+        self.cap = cap
+
+    def __call__(self, retries, previous):
+        return min(self.cap, random.uniform(self.base,
+                                            max(self.base, previous * 3)))
+
+
+class BackoffGate():
+    """A pause shared by several threads, or several sites.
+
+    When a thread learns that the server is overloaded (e.g. from the
+    ``x-database-lag`` header), it closes the gate for the time the server
+    asked for, and the other threads wait for it to reopen before sending
+    their next request, instead of each discovering the lag on its own.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.until = 0.0
+
+    def close(self, seconds):
+        """Keep the gate closed for at least `seconds` seconds."""
+        with self.lock:
+            self.until = max(self.until, time.monotonic() + seconds)
+
+    def remaining(self):
+        """Return the number of seconds before the gate reopens."""
+        return max(0.0, self.until - time.monotonic())
+
+    def wait(self):
+        """Sleep until the gate reopens."""
+        remaining = self.remaining()
+        if remaining > 0:
+            LOG.debug('Waiting %.1f seconds for the backoff gate',
+                      remaining)
+            time.sleep(remaining)
+
+
 class Sleepers():
 
     """
@@ -20,21 +98,46 @@ class Sleepers():
         be created
         using the `make` method.
         >>> sleeper = sleepers.make()
+        The waits can grow exponentially, with some randomness, and
+        operations can be bounded in time:
+        >>> sleepers = Sleepers(None, 5, backoff=DecorrelatedJitter(1, 60),
+        ...                     deadline=600)
     Args:
-        max_retries (int): The maximum number of retries to perform.
+        max_retries (int): The maximum number of retries to perform. None
+        means no limit, which requires a `deadline`. A negative number
+        means no retry, as 0 does, and is deprecated.
         retry_timeout (int): The time to sleep for each past retry.
         callback (Callable[[int, Any], None]): A callable to be called on each
         retry.
+        backoff (callable): The policy giving the time to sleep from the
+        number of retries and the previous time slept, defaults to
+        `LinearBackoff(retry_timeout)`.
+        deadline (float): The maximum number of seconds an operation may
+        spend, retries included.
+        gate (BackoffGate): The pause shared with other sleepers, a new one
+        by default.
     Attributes:
         max_retries (int): The maximum number of retries to perform.
         retry_timeout (int): The time to sleep for each past retry.
         callback (callable): A callable to be called on each retry.
+        backoff (callable): The backoff policy.
+        deadline (float): The maximum duration of an operation.
+        gate (BackoffGate): The pause shared by the sleepers.
     """
 
-    def __init__(self, max_retries, retry_timeout, callback=lambda *x: None):
+    def __init__(self, max_retries, retry_timeout, callback=lambda *x: None,
+                 backoff=None, deadline=None, gate=None):
+        if max_retries is None and deadline is None:
+            raise RuntimeError('Unlimited retries require a deadline')
+        if max_retries is not None and max_retries < 0:
+            warnings.warn('A negative max_retries means no retry, use 0 '
+                          'instead', DeprecationWarning)
         self.max_retries = max_retries
         self.retry_timeout = retry_timeout
         self.callback = callback
+        self.backoff = backoff or LinearBackoff(retry_timeout)
+        self.deadline = deadline
+        self.gate = gate or BackoffGate()
 
     def make(self, args=None):
         """
@@ -45,7 +148,8 @@ class Sleepers():
             Sleeper: A `Sleeper` object.
         """
         return Sleeper(args, self.max_retries, self.retry_timeout,
-                       self.callback)
+                       self.callback, backoff=self.backoff,
+                       deadline=self.deadline, gate=self.gate)
 
 
 class Sleeper():
@@ -54,7 +158,8 @@ class Sleeper():
     retries.
     For each retry, the sleep time increases until the max number of retries
     is reached
-    and a `MaximumRetriesExceeded` is raised. The sleeper object should be
+    and a `MaximumRetriesExceeded` is raised, or until the deadline would be
+    passed and a `DeadlineExceeded` is raised. The sleeper object should be
     discarded
     once the operation is successful.
     Args:
@@ -62,39 +167,80 @@ class Sleeper():
         max_retries (int): The maximum number of retries to perform.
         retry_timeout (int): The time to sleep for each past retry.
         callback (callable, None]): A callable to be called on each retry.
+        backoff (callable): The backoff policy.
+        deadline (float): The maximum number of seconds from the creation of
+        the sleeper.
+        gate (BackoffGate): A pause shared with other sleepers.
     Attributes:
         args (Any): Arguments to be passed to the `callback` callable.
         retries (int): The number of retries that have been performed.
         max_retries (int): The maximum number of retries to perform.
         retry_timeout (int): The time to sleep for each past retry.
         callback (callable): A callable to be called on each retry.
+        backoff (callable): The backoff policy.
+        deadline (float): The maximum duration of the operation.
+        gate (BackoffGate): The pause shared with other sleepers.
+        previous (float): The last time slept.
     """
 
-    def __init__(self, args, max_retries, retry_timeout, callback):
+    def __init__(self, args, max_retries, retry_timeout, callback,
+                 backoff=None, deadline=None, gate=None):
         self.args = args
         self.retries = 0
         self.max_retries = max_retries
         self.retry_timeout = retry_timeout
         self.callback = callback
+        self.backoff = backoff or LinearBackoff(retry_timeout)
+        self.deadline = deadline
+        self.gate = gate
+        self.previous = 0
+        self.start = time.monotonic()
 
-    def sleep(self, min_time=0):
+    def next_timeout(self, min_time=0):
         """
-        Sleeps for a minimum of `min_time` seconds. The actual sleeping time
-        will increase with the number of retries.
+        Registers a new retry and returns how long to wait before it, without
+        actually sleeping. This lets callers that cannot block the current
+        thread (e.g. asyncio code) share the retry accounting.
         Args:
             min_time (int): The minimum sleeping time.
+        Returns:
+            int: The number of seconds to wait.
         Raises:
             MaximumRetriesExceeded: If the number of retries exceeds the
             maximum.
+            DeadlineExceeded: If the operation would not be over before the
+            deadline.
         """
         self.retries += 1
-        if self.retries > self.max_retries:
+        if (self.max_retries is not None
+                and self.retries > self.max_retries):
             raise MaximumRetriesExceeded(self, self.args)
 
-        self.callback(self, self.retries, self.args)
-
-        timeout = self.retry_timeout * (self.retries - 1)
+        timeout = self.backoff(self.retries, self.previous)
         if timeout < min_time:
             timeout = min_time
-        LOG.debug('Sleeping for %d seconds', timeout)
-        time.sleep(timeout)
+        if self.gate is not None:
+            timeout = max(timeout, self.gate.remaining())
+        if (self.deadline is not None and time.monotonic() + timeout
+                - self.start > self.deadline):
+            raise DeadlineExceeded(self, self.args)
+
+        self.previous = timeout
+        self.callback(self, self.retries, self.args)
+
+        LOG.debug('Sleeping for %.1f seconds', timeout)
+        return timeout
+
+    def sleep(self, min_time=0):
+        """
+        Sleeps for a minimum of `min_time` seconds. The actual sleeping time
+        will increase with the number of retries.
+        Args:
+            min_time (int): The minimum sleeping time.
+        Raises:
+            MaximumRetriesExceeded: If the number of retries exceeds the
+            maximum.
+            DeadlineExceeded: If the operation would not be over before the
+            deadline.
+        """
+        time.sleep(self.next_timeout(min_time))
@@ -0,0 +1,244 @@
+"""Incremental parsing of API responses.
+
+An `APIStream` yields the items of one member of an API response (e.g. the
+pages of ``query.pages``) while the response is being downloaded, so that
+large responses are never held in memory as a whole. It requires the
+optional `ijson` package.
+
+    >>> stream = site.stream_api('query', 'query.allpages', list='allpages',
+    ...                          aplimit='max')
+    >>> for page in stream:
+    ...     print(page['title'])
+    >>> stream.result.get('continue')
+
+The `stream_api()` of an `AsyncSite` returns an `AsyncAPIStream`, iterated
+with ``async for``.
+"""
+import asyncio
+import re
+
+import mwklient.errors as errors
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Size of the pieces of the HTTP response fed to the parser
+CHUNK_SIZE = 65536
+
+_CONTAINER_STARTS = {'start_map', 'start_array'}
+_CONTAINER_ENDS = {'end_map', 'end_array'}
+
+
+def available():
+    """Return True if the responses can be streamed (ijson is installed)."""
+    return ijson is not None
+
+
+class ChunkReader():
+    """A read-only file object over an iterable of bytes, as expected by
+    ijson. `size` is the number of bytes read so far."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.size = 0
+
+    def read(self, size=-1):
+        # ijson calls read(0) to find out whether the file is binary
+        if size == 0:
+            return b''
+        chunk = next(self.chunks, b'')
+        self.size += len(chunk)
+        return chunk
+
+
+def member_pattern(member):
+    """Return a regular expression matching the ijson prefixes of `member`,
+    a dotted path in which '*' stands for any key
+    (e.g. 'query.pages.*.revisions').
+    """
+    parts = ('[^.]*' if part == '*' else re.escape(part)
+             for part in member.split('.'))
+    return re.compile(r'\.'.join(parts) + '$')
+
+
+class MemberParser():
+    """Turns the parsing events of a JSON document into the items of the
+    arrays or the values of the objects found at `member`.
+
+    Everything else in the document is fed to `rest`, an
+    `ijson.ObjectBuilder`, in which the member appears as an empty array or
+    object.
+    """
+
+    def __init__(self, member, rest):
+        self.matches = member_pattern(member).match
+        self.rest = rest
+        self.in_member = False
+        self.item = None
+        self.depth = 0
+
+    def feed(self, prefix, event, value):
+        """Handle one event, returning True when it completes an item, which
+        is then in `value`."""
+        item = self.item
+        if item is not None:
+            # Inside an item of the member
+            item.event(event, value)
+            if event in _CONTAINER_STARTS:
+                self.depth += 1
+            elif event in _CONTAINER_ENDS:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.value = item.value
+                    self.item = None
+                    return True
+        elif self.in_member:
+            if event in _CONTAINER_ENDS:
+                self.in_member = False
+                self.rest.event(event, value)
+            elif event != 'map_key':
+                # First event of a new item
+                item = ijson.ObjectBuilder()
+                item.event(event, value)
+                if event not in _CONTAINER_STARTS:
+                    self.value = item.value
+                    return True
+                self.item = item
+                self.depth = 1
+        else:
+            if event in _CONTAINER_STARTS and self.matches(prefix):
+                self.in_member = True
+            self.rest.event(event, value)
+        return False
+
+
+def iter_member(fileobj, member, rest):
+    """Parse the JSON document in `fileobj`, yielding the items of the arrays
+    or the values of the objects found at `member` (see `MemberParser`).
+    """
+    parser = MemberParser(member, rest)
+    for prefix, event, value in ijson.parse(fileobj, use_float=True):
+        if parser.feed(prefix, event, value):
+            yield parser.value
+
+
+async def aiter_member(chunks, member, rest):
+    """Asynchronous version of `iter_member()`, parsing the pieces of a JSON
+    document yielded by the asynchronous iterable `chunks`."""
+    parser = MemberParser(member, rest)
+    events = ijson.sendable_list()
+    coro = ijson.parse_coro(events, use_float=True)
+    done = False
+    while not done:
+        try:
+            chunk = await chunks.__anext__()
+            coro.send(chunk)
+        except StopAsyncIteration:
+            coro.close()
+            done = True
+        for prefix, event, value in events:
+            if parser.feed(prefix, event, value):
+                yield parser.value
+        del events[:]
+
+
+class APIStream():
+    """Iterator over the items of the member `member` of the response to an
+    API call, parsed while the response is being downloaded.
+
+    `member` is a dotted path to an array or an object of the response, such
+    as 'query.allpages' or 'query.pages'; '*' stands for any key. For
+    objects, the values are yielded.
+
+    Once the iteration is over, `result` holds the rest of the response
+    (continuation, warnings, user info…), in which the member is empty. The
+    response is checked for errors, and the call retried if needed, like
+    `Site.api()` does.
+    """
+
+    def __init__(self, site, action, member, http_method='GET', **kwargs):
+        if ijson is None:
+            raise RuntimeError('Streaming API responses requires the ijson '
+                               'package')
+        self.site = site
+        self.member = member
+        self.http_method = http_method
+        self.retry_on_error = kwargs.pop('retry_on_error', True)
+        kwargs['action'] = action
+        kwargs['format'] = 'json'
+        kwargs.setdefault('maxlag', site.max_lag)
+        self.data = site._query_string(**kwargs)
+        self.module = site._module_name('api', self.data)
+        self.result = None
+
+    def __iter__(self):
+        sleeper = self.site.sleepers.make()
+
+        while True:
+            response = self.site.raw_call(
+                'api', self.data, retry_on_error=self.retry_on_error,
+                http_method=self.http_method, stream=True)
+            rest = ijson.ObjectBuilder()
+            chunks = ChunkReader(response.iter_content(CHUNK_SIZE))
+            try:
+                for item in iter_member(chunks, self.member, rest):
+                    yield item
+            except ijson.JSONError as err:
+                raise errors.InvalidResponse(
+                    'Invalid JSON response: {}'.format(err))
+            finally:
+                response.close()
+                # raw_call() left the body to be read here
+                self.site.metrics.record(self.module, bytes_in=chunks.size)
+
+            self.result = getattr(rest, 'value', None) or {}
+            if self.site.handle_api_result(self.result, sleeper=sleeper):
+                return
+
+    def __repr__(self):
+        return "<APIStream object '%s' for %s>" % (self.member, self.site)
+
+
+class AsyncAPIStream(APIStream):
+    """Asynchronous version of `APIStream`, for the `stream_api()` of an
+    `AsyncSite`, iterated with ``async for``."""
+
+    def __iter__(self):
+        raise TypeError('An AsyncAPIStream is iterated with async for')
+
+    def __aiter__(self):
+        return self._items()
+
+    async def _items(self):
+        sleeper = self.site.sleepers.make()
+
+        while True:
+            response = await self.site.raw_call(
+                'api', self.data, retry_on_error=self.retry_on_error,
+                http_method=self.http_method, stream=True)
+            rest = ijson.ObjectBuilder()
+            chunks = self._chunks(response)
+            self.bytes_in = 0
+            try:
+                async for item in aiter_member(chunks, self.member, rest):
+                    yield item
+            except ijson.JSONError as err:
+                raise errors.InvalidResponse(
+                    'Invalid JSON response: {}'.format(err))
+            finally:
+                response.release()
+                self.site.metrics.record(self.module, bytes_in=self.bytes_in)
+
+            self.result = getattr(rest, 'value', None) or {}
+            if self.site._check_api_result(self.result):
+                return
+            await asyncio.sleep(sleeper.next_timeout())
+
+    async def _chunks(self, response):
+        """Yield the pieces of the body of `response`, counting their bytes
+        in `bytes_in`."""
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            self.bytes_in += len(chunk)
+            yield chunk
@@ -0,0 +1,167 @@
+"""Rate limiting of the requests sent to a site."""
+import threading
+import time
+
+
+class TokenBucket():
+    """A thread-safe token bucket, allowing `rate` operations every `per`
+    seconds, with bursts of up to `burst` operations.
+
+    `acquire()` blocks until the caller may proceed. The rate can be changed
+    at any time with `set_rate()`; a rate of None means no limit.
+
+        >>> bucket = TokenBucket(90, per=60)
+        >>> for page in pages:
+        ...     bucket.acquire()
+        ...     page.edit(...)
+    """
+
+    def __init__(self, rate=None, per=1.0, burst=1, clock=time.monotonic,
+                 sleep=time.sleep):
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.rate = None
+        self.per = per
+        self.interval = 0
+        # Theoretical arrival time of the next operation
+        self.tat = clock()
+        self.set_rate(rate, per)
+
+    def __repr__(self):
+        return '<TokenBucket object %s per %ss>' % (self.rate, self.per)
+
+    def set_rate(self, rate, per=None):
+        """Change the number of operations allowed every `per` seconds."""
+        with self.lock:
+            if per is not None:
+                self.per = per
+            self.rate = rate
+            self.interval = float(self.per) / rate if rate else 0
+
+    def pause(self, seconds):
+        """Let no operation proceed for the next `seconds` seconds."""
+        with self.lock:
+            until = self.clock() + seconds
+            self.tat = max(self.tat, until + (self.burst - 1) * self.interval)
+
+    def acquire(self):
+        """Wait until an operation may proceed.
+
+        Returns:
+            The number of seconds waited.
+        """
+        with self.lock:
+            now = self.clock()
+            tat = max(self.tat, now)
+            wait = max(tat - now - (self.burst - 1) * self.interval, 0)
+            self.tat = tat + self.interval
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+
+class LagController():
+    """Adapt the number of concurrent requests, and their pacing, to the
+    replication lag of the server.
+
+    Every request waits for a free slot among `concurrency` and for its turn
+    in a `TokenBucket`. A response reporting a lag (``x-database-lag``)
+    halves the concurrency, down to `min_concurrency`, doubles the
+    interval between requests, from `min_interval` up to `max_interval`
+    seconds, and pauses the requests for the time asked by its
+    ``retry-after`` header, or else for the lag reported. The other lagged
+    responses received during that pause, or within one interval, belong to
+    the same lag event and do not decrease the load again. After
+    `increase_after` responses in a row without lag, one more concurrent
+    request is allowed, up to `max_concurrency`, and the interval shrinks
+    by a quarter, down to no pacing at all.
+
+        >>> site = mwklient.Site('en.wikipedia.org', pool_size=16,
+        ...                      lag_control=LagController(16))
+    """
+
+    def __init__(self, max_concurrency=8, min_concurrency=1,
+                 min_interval=0.1, max_interval=10.0, increase_after=20,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.increase_after = increase_after
+        self.clock = clock
+        self.concurrency = max_concurrency
+        self.interval = 0
+        self.active = 0
+        self.successes = 0
+        # The number of responses that reported a lag, and the last one
+        self.lagged = 0
+        self.lag = None
+        # The end of the last lag event
+        self.lagged_until = None
+        self.condition = threading.Condition()
+        self.bucket = TokenBucket(clock=clock, sleep=sleep)
+
+    def __repr__(self):
+        return '<LagController object %d/%d, %.2fs>' % (
+            self.active, self.concurrency, self.interval)
+
+    def acquire(self):
+        """Wait until a request may be sent."""
+        with self.condition:
+            while self.active >= self.concurrency:
+                self.condition.wait()
+            self.active += 1
+        self.bucket.acquire()
+
+    def release(self, lag=None, failed=False, retry_after=None):
+        """Register the end of a request.
+
+        Args:
+            lag (float): The lag reported by the response, if any
+            failed (bool): Whether the request failed without response
+            retry_after (float): The seconds to wait before the next
+                request, given by the ``retry-after`` header of a lagged
+                response
+        """
+        with self.condition:
+            self.active -= 1
+            if lag is not None:
+                self._lagged(float(lag), retry_after)
+            elif not failed:
+                self.successes += 1
+                if self.successes >= self.increase_after:
+                    self.successes = 0
+                    self.concurrency = min(self.max_concurrency,
+                                           self.concurrency + 1)
+                    self.interval *= 0.75
+                    if self.interval < self.min_interval:
+                        self.interval = 0
+                    self._set_interval()
+            self.condition.notify_all()
+
+    def _lagged(self, lag, retry_after):
+        self.lagged += 1
+        self.lag = lag
+        self.successes = 0
+        now = self.clock()
+        if self.lagged_until is not None and now < self.lagged_until:
+            # Sent before the load was decreased
+            return
+        try:
+            pause = float(retry_after)
+        except (TypeError, ValueError):
+            pause = lag
+        self.concurrency = max(self.min_concurrency, self.concurrency // 2)
+        self.interval = min(self.max_interval,
+                            max(self.interval * 2, self.min_interval))
+        self._set_interval()
+        self.bucket.pause(pause)
+        self.lagged_until = now + max(pause, self.interval)
+
+    def _set_interval(self):
+        if self.interval:
+            self.bucket.set_rate(1, self.interval)
+        else:
+            self.bucket.set_rate(None)
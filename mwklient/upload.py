@@ -0,0 +1,437 @@
+"""Upload request bodies sending the contents of files without copying them.
+
+A file given as a memory-mapped file (`mmap.mmap`), or as any other object
+supporting the buffer protocol (bytes, bytearray, memoryview...), is sent
+by slices of a `memoryview`: the chunks of a chunked upload are never
+copied, from the mapping of the file to the socket.
+
+    >>> with open('video.webm', 'rb') as fd:
+    ...     with mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ) as data:
+    ...         site.upload(data, 'Video.webm', 'A video')
+"""
+import concurrent.futures
+import hashlib
+import json
+import logging
+import mmap
+import os
+import uuid
+from six import text_type
+
+from mwklient.cache import write_json
+from mwklient.errors import UploadStateError
+
+LOG = logging.getLogger(__name__)
+
+CRLF = b'\r\n'
+
+KIB = 1024
+MIB = 1024 * KIB
+
+
+def as_buffer(file):
+    """Return a flat memoryview of `file`, or None if it is a stream or a
+    path rather than an object supporting the buffer protocol."""
+    if isinstance(file, text_type):
+        return None
+    if hasattr(file, 'read') and not isinstance(file, mmap.mmap):
+        return None
+    try:
+        view = memoryview(file)
+    except TypeError:
+        return None
+    if view.ndim != 1 or view.itemsize != 1:
+        view = view.cast('B')
+    return view
+
+
+def drop_pages(view, offset, length):
+    """Let the kernel reclaim the pages of a memory-mapped file once they
+    are sent, so that they do not add up in the memory of the process."""
+    mapping = view.obj
+    if (isinstance(mapping, mmap.mmap) and hasattr(mmap, 'MADV_DONTNEED')
+            and offset % mmap.PAGESIZE == 0):
+        mapping.madvise(mmap.MADV_DONTNEED, offset, length)
+
+
+def read_chunks(stream, chunk_size):
+    """Read a binary stream in chunks of `chunk_size` bytes.
+
+    The chunks are read with `readinto()` into the same buffer, and yielded
+    as memoryviews of it: each chunk must be used before the next one is
+    read.
+    """
+    view = memoryview(bytearray(chunk_size))
+    while True:
+        size = _read_into(stream, view)
+        if not size:
+            return
+        yield view[:size]
+
+
+class ChunkReader():
+    """The chunks of a file given as a stream or as a buffer, from `offset`,
+    as memoryviews.
+
+    The chunks of a buffer are slices of it. Those of a stream are read into
+    a buffer reused from one chunk to the next, or with `prefetch`, into two
+    buffers in turn: the next chunk is read by a worker thread while the
+    previous one is being sent. The pages of a memory-mapped file are
+    prefetched with ``madvise()``, and dropped once sent.
+
+    Args:
+        file: A binary stream or an object supporting the buffer protocol
+        offset (int): The offset of the first chunk
+        prefetch (bool): Read the next chunk ahead
+    """
+
+    def __init__(self, file, offset=0, prefetch=False):
+        self.file = file
+        self.buffer = as_buffer(file)
+        self.offset = offset
+        self.prefetch = prefetch
+        self._buffers = [None, None]
+
+    def __repr__(self):
+        return '<ChunkReader object at offset %d>' % self.offset
+
+    def chunks(self, next_size):
+        """Yield the chunks, each of `next_size()` bytes, until the end of
+        the file. A chunk must be given to `sent()` before the next one is
+        asked for."""
+        if self.buffer is not None:
+            return self._slices(next_size)
+        self.file.seek(self.offset)
+        if self.prefetch:
+            return self._prefetched(next_size)
+        return self._reads(next_size)
+
+    def sent(self, chunk):
+        """Release a chunk that was sent."""
+        if self.buffer is not None:
+            drop_pages(self.buffer, self.offset, chunk.nbytes)
+        self.offset += chunk.nbytes
+        chunk.release()
+
+    def close(self):
+        """Release the buffer, or close the stream."""
+        if self.buffer is not None:
+            self.buffer.release()
+        else:
+            self.file.close()
+
+    def _slices(self, next_size):
+        offset = self.offset
+        while offset < self.buffer.nbytes:
+            size = next_size()
+            chunk = self.buffer[offset:offset + size]
+            offset += chunk.nbytes
+            if self.prefetch:
+                will_need(self.buffer, offset, next_size())
+            yield chunk
+
+    def _read(self, index, size):
+        """Read the next `size` bytes into the buffer `index`."""
+        buffer = self._buffers[index]
+        if buffer is None or len(buffer) < size:
+            buffer = self._buffers[index] = memoryview(bytearray(size))
+        view = buffer[:size]
+        read = _read_into(self.file, view)
+        return view[:read]
+
+    def _reads(self, next_size):
+        while True:
+            chunk = self._read(0, next_size())
+            if not chunk:
+                return
+            yield chunk
+
+    def _prefetched(self, next_size):
+        executor = concurrent.futures.ThreadPoolExecutor(1)
+        try:
+            index = 0
+            future = executor.submit(self._read, index, next_size())
+            while True:
+                chunk = future.result()
+                if not chunk:
+                    return
+                index = 1 - index
+                future = executor.submit(self._read, index, next_size())
+                yield chunk
+        finally:
+            executor.shutdown(wait=True)
+
+
+def _read_into(stream, view):
+    """Fill `view` from `stream`, and return the number of bytes read, less
+    than its size at the end of the stream."""
+    readinto = getattr(stream, 'readinto', None)
+    if readinto is None:
+        data = stream.read(len(view))
+        view[:len(data)] = data
+        return len(data)
+    size = 0
+    while size < len(view):
+        read = readinto(view[size:])
+        if not read:
+            break
+        size += read
+    return size
+
+
+def will_need(view, offset, length):
+    """Ask the kernel to read ahead the pages of a memory-mapped file that
+    are about to be sent."""
+    mapping = view.obj
+    if (isinstance(mapping, mmap.mmap) and hasattr(mmap, 'MADV_WILLNEED')
+            and offset < view.nbytes):
+        start = offset - offset % mmap.PAGESIZE
+        mapping.madvise(mmap.MADV_WILLNEED, start,
+                        min(length + offset - start, view.nbytes - start))
+
+
+class ChunkSizeTuner():
+    """Choose the size of the chunks of an upload from the throughput
+    observed, so that sending one takes about `target` seconds: long enough
+    for the latency of the requests not to matter, short enough for a
+    failed chunk to be cheap to send again.
+
+    The size starts at `initial` bytes, changes at most twofold from one
+    chunk to the next, and stays between `minimum` and `maximum`, in
+    multiples of 64 KiB (so that the chunks of a memory-mapped file start on
+    page boundaries). The default `maximum` is the stock PHP limit
+    (``upload_max_filesize = 2M``); servers accepting larger chunks are
+    better used with a larger one.
+    """
+
+    STEP = 64 * KIB
+
+    def __init__(self, initial=MIB, minimum=256 * KIB, maximum=2 * MIB,
+                 target=5.0):
+        self.minimum = min(minimum, maximum)
+        self.maximum = maximum
+        self.target = target
+        self.size = self._bounded(initial)
+        # Bytes per second, as an exponentially weighted moving average
+        self.throughput = None
+
+    def __repr__(self):
+        return '<ChunkSizeTuner object %d bytes>' % self.size
+
+    def _bounded(self, size):
+        size = max(self.minimum, min(self.maximum, int(size)))
+        return max(self.STEP, size - size % self.STEP)
+
+    def observe(self, size, seconds):
+        """Register a chunk of `size` bytes sent in `seconds` seconds, and
+        return the size of the next chunk."""
+        if seconds <= 0:
+            return self.size
+        throughput = size / float(seconds)
+        if self.throughput is None:
+            self.throughput = throughput
+        else:
+            self.throughput = 0.7 * self.throughput + 0.3 * throughput
+        wanted = self.throughput * self.target
+        self.size = self._bounded(max(self.size / 2.0,
+                                      min(self.size * 2.0, wanted)))
+        return self.size
+
+
+def content_size(file):
+    """Return the size of a file given as a stream or as a buffer."""
+    view = as_buffer(file)
+    if view is not None:
+        return view.nbytes
+    size = file.seek(0, 2)
+    file.seek(0)
+    return size
+
+
+def file_sha1(file):
+    """Return the SHA-1 hex digest of a file given as a stream or as a
+    buffer, leaving the stream at its start."""
+    view = as_buffer(file)
+    if view is not None:
+        return hashlib.sha1(view).hexdigest()
+    sha1 = hashlib.sha1()
+    file.seek(0)
+    for chunk in read_chunks(file, 1024 * 1024):
+        sha1.update(chunk)
+    file.seek(0)
+    return sha1.hexdigest()
+
+
+def has_buffers(files):
+    """Whether the `files` of a request hold memoryviews, to be sent in a
+    `MultipartBody`."""
+    return any(isinstance(_file_content(value), memoryview)
+               for value in files.values())
+
+
+def _file_content(value):
+    if isinstance(value, tuple):
+        return value[1]
+    return value
+
+
+def positions(files):
+    """Return the seekable streams among `files`, with their position."""
+    streams = []
+    for value in (files or {}).values():
+        stream = _file_content(value)
+        if hasattr(stream, 'seek') and hasattr(stream, 'tell'):
+            try:
+                streams.append((stream, stream.tell()))
+            except (OSError, ValueError):
+                pass
+    return streams
+
+
+def rewind(streams):
+    """Move the streams returned by `positions()` back to their position,
+    before the request is sent again."""
+    for stream, position in streams:
+        stream.seek(position)
+
+
+class MultipartBody():
+    """A multipart/form-data request body, made of the encoded `fields` and
+    of the memoryviews of `files`.
+
+    It is iterated by the HTTP client, which writes every part to the
+    socket as it is: the memoryviews are sent without being copied. It can
+    be iterated again to retry the request.
+
+    Args:
+        fields (dict): The form fields, None values being left out
+        files (dict): The files, as memoryviews or (filename, memoryview)
+            tuples
+    """
+
+    def __init__(self, fields, files):
+        self.boundary = uuid.uuid4().hex
+        self.parts = []
+        delimiter = b'--' + self.boundary.encode('ascii') + CRLF
+        for name, value in fields.items():
+            if value is None:
+                continue
+            self.parts.append(delimiter + self._disposition(name) + CRLF
+                              + CRLF + text_type(value).encode('utf-8')
+                              + CRLF)
+        for name, value in files.items():
+            filename = name
+            if isinstance(value, tuple):
+                filename, value = value[:2]
+            self.parts.append(delimiter + self._disposition(name, filename)
+                              + CRLF + b'Content-Type: '
+                              b'application/octet-stream' + CRLF + CRLF)
+            self.parts.append(value)
+            self.parts.append(CRLF)
+        self.parts.append(b'--' + self.boundary.encode('ascii') + b'--'
+                          + CRLF)
+        self.length = sum(part.nbytes if isinstance(part, memoryview)
+                          else len(part) for part in self.parts)
+
+    def __repr__(self):
+        return '<MultipartBody object of %d bytes>' % self.length
+
+    @staticmethod
+    def _disposition(name, filename=None):
+        header = u'Content-Disposition: form-data; name="%s"' % name
+        if filename is not None:
+            header += u'; filename="%s"' % filename
+        return header.encode('utf-8')
+
+    @property
+    def content_type(self):
+        return 'multipart/form-data; boundary=' + self.boundary
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return iter(self.parts)
+
+
+class UploadState():
+    """The progress of a chunked upload, kept in a JSON file so that it can
+    be resumed by another process, see `Site.resume_upload()`.
+
+    The file is written again after every chunk acknowledged by the server,
+    and removed once the upload is published.
+
+    Attributes:
+        path (str): The path of the state file
+        filename (str): The destination filename
+        filesize (int): The size of the file, in bytes
+        sha1 (str): The SHA-1 hex digest of the file
+        filekey (str): The key of the stashed upload, None before the first
+            chunk is acknowledged
+        offset (int): The number of bytes acknowledged
+        ignorewarnings (bool), comment (str), text (str): The parameters of
+            the upload
+    """
+
+    FIELDS = ('filename', 'filesize', 'sha1', 'filekey', 'offset',
+              'ignorewarnings', 'comment', 'text')
+
+    def __init__(self, path, filename, filesize, sha1, filekey=None,
+                 offset=0, ignorewarnings=False, comment='', text=None):
+        self.path = path
+        self.filename = filename
+        self.filesize = filesize
+        self.sha1 = sha1
+        self.filekey = filekey
+        self.offset = offset
+        self.ignorewarnings = ignorewarnings
+        self.comment = comment
+        self.text = text
+
+    def __repr__(self):
+        return "<UploadState object '%s' %d/%d>" % (
+            self.filename, self.offset, self.filesize)
+
+    @classmethod
+    def load(cls, path):
+        """Read the state saved at `path`.
+
+        Raises:
+            UploadStateError: The file is not a valid upload state.
+        """
+        try:
+            with open(path) as fd:
+                state = json.load(fd)
+            return cls(path, **{name: state[name] for name in cls.FIELDS})
+        except (ValueError, KeyError, TypeError) as err:
+            raise UploadStateError('Invalid upload state %s: %s' % (path,
+                                                                    err))
+
+    def save(self):
+        write_json(self.path, {name: getattr(self, name)
+                               for name in self.FIELDS})
+
+    def update(self, filekey, offset):
+        """Record a chunk acknowledged by the server."""
+        self.filekey = filekey
+        self.offset = offset
+        self.save()
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def check(self, file):
+        """Check that `file` is the file whose upload was started.
+
+        Raises:
+            UploadStateError: Its size or its hash differ.
+        """
+        if content_size(file) != self.filesize:
+            raise UploadStateError('%s: the size of the file changed'
+                                   % self.filename)
+        if file_sha1(file) != self.sha1:
+            raise UploadStateError('%s: the contents of the file changed'
+                                   % self.filename)
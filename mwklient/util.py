@@ -2,10 +2,32 @@
 to parse timestamps, read streams in chunks, etc.
 """
 
+from collections import OrderedDict
+from datetime import date
 from io import BytesIO
 from time import strptime, struct_time
+import sys
 import mwklient.errors as errors
 
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+# Cache of the date fields of the recently parsed timestamps
+_DAYS = {}
+_DAYS_SIZE = 4096
+
 
 def version_tuple_from_generator(string, prefix='MediaWiki '):
     """Return a version tuple from a MediaWiki Generator string.
@@ -68,16 +90,161 @@ def parse_timestamp(timestamp):
 
     Args:
         timestamp: A string fomrttaed as formatted as '%Y-%m-%dT%H:%M:%SZ'; if
-        None, it is considered as '0000-00-00T00:00:00Z'.
+        None, it is considered as '0000-00-00T00:00:00Z'. A struct_time,
+        already parsed, is returned as is.
 
     Returns:
         a time tuple (struct_time)
 
     Raises:
     """
+    if isinstance(timestamp, struct_time):
+        # Responses may be shared, see `Site.coalesce`
+        return timestamp
     if not timestamp or timestamp == '0000-00-00T00:00:00Z':
         return struct_time((0, 0, 0, 0, 0, 0, 0, 0, 0))
-    return strptime(timestamp, '%Y-%m-%dT%H:%M:%SZ')
+    parsed = _parse_iso_timestamp(timestamp)
+    if parsed is None:
+        return strptime(timestamp, '%Y-%m-%dT%H:%M:%SZ')
+    return parsed
+
+
+def _parse_iso_timestamp(timestamp):
+    """Fast path of `parse_timestamp()` for the 'YYYY-MM-DDTHH:MM:SSZ' shape
+    used by the API, slicing the string instead of using `time.strptime`.
+
+    Returns:
+        a time tuple (struct_time), or None if the timestamp does not have
+        the expected shape.
+    """
+    if (len(timestamp) != 20 or timestamp[10] != 'T'
+            or timestamp[13] != ':' or timestamp[16] != ':'
+            or timestamp[19] != 'Z'):
+        return None
+    day = timestamp[:10]
+    try:
+        fields = _DAYS[day]
+    except KeyError:
+        if (day[4] != '-' or day[7] != '-'
+                or not day.replace('-', '').isdigit()):
+            return None
+        try:
+            parsed = date(int(day[:4]), int(day[5:7]), int(day[8:]))
+        except ValueError:
+            return None
+        fields = (parsed.year, parsed.month, parsed.day, parsed.weekday(),
+                  parsed.toordinal() - date(parsed.year, 1, 1).toordinal() + 1)
+        if len(_DAYS) >= _DAYS_SIZE:
+            _DAYS.clear()
+        _DAYS[day] = fields
+
+    try:
+        hour = int(timestamp[11:13])
+        minute = int(timestamp[14:16])
+        second = int(timestamp[17:19])
+    except ValueError:
+        return None
+    if hour > 23 or minute > 59 or second > 61:
+        return None
+    return struct_time((fields[0], fields[1], fields[2], hour, minute, second,
+                        fields[3], fields[4], -1))
+
+
+class TimestampedItem(dict):
+    """An item of an API response whose 'timestamp' is parsed on access.
+
+    The value is parsed with `parse_timestamp()` the first time it is read
+    through `item['timestamp']`, `get()`, `items()` or `values()`, so that
+    iterating over long lists only pays for the timestamps actually used.
+    Copies made with `copy()`, `dict(item)` or `{**item}`, and
+    `json.dumps(item)`, get the parsed value too.
+    """
+    __slots__ = ()
+
+    def __iter__(self):
+        # Overriding it makes dict(item) and {**item} read the values
+        # through __getitem__ instead of copying the raw dict
+        return dict.__iter__(self)
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if key == 'timestamp' and not isinstance(value, struct_time):
+            value = parse_timestamp(value)
+            dict.__setitem__(self, key, value)
+        return value
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def items(self):
+        self.get('timestamp')
+        return dict.items(self)
+
+    def values(self):
+        self.get('timestamp')
+        return dict.values(self)
+
+    def copy(self):
+        self.get('timestamp')
+        return dict.copy(self)
+
+
+def batched(iterable, size):
+    """Splits an iterable in lists of at most `size` items.
+
+    Args:
+        iterable: The items to split
+        size: The maximum number of items of each list
+
+    Returns:
+        A generator of lists
+    """
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def get_json_decoder(decoder=None):
+    """Return the function used to decode the JSON responses of the API.
+
+    Args:
+        decoder: Either a function taking a string and returning the decoded
+            object, or the name of a decoder:
+            'json' (the standard library),
+            'ordered' (the standard library, with OrderedDict objects),
+            'orjson' or 'ujson' (if the package is installed),
+            'auto' (the fastest one installed).
+            If None (the default), 'json' on Python 3.7 and later, where
+            dicts keep the order of the keys, and 'ordered' before.
+
+    Raises:
+        RuntimeError: if the decoder is unknown or not installed.
+    """
+    if callable(decoder):
+        return decoder
+    if decoder is None:
+        decoder = 'json' if sys.version_info >= (3, 7) else 'ordered'
+    if decoder == 'auto':
+        decoder = 'orjson' if orjson else 'ujson' if ujson else 'json'
+
+    if decoder == 'json':
+        return json.loads
+    if decoder == 'ordered':
+        return lambda s: json.loads(s, object_pairs_hook=OrderedDict)
+    if decoder == 'orjson' and orjson:
+        return orjson.loads
+    if decoder == 'ujson' and ujson:
+        return ujson.loads
+    if decoder in ('orjson', 'ujson'):
+        raise RuntimeError('The {} package is not installed'.format(decoder))
+    raise RuntimeError('Unknown JSON decoder {!r}'.format(decoder))
 
 
 def read_in_chunks(stream, chunk_size):
@@ -34,8 +34,10 @@ setup(name='mwklient',
       license='MIT',
       packages=['mwklient', 'mwklient.pages'],
       install_requires=['requests-oauthlib', 'six'],
+      extras_require={'async': ['aiohttp'], 'stream': ['ijson']},
       setup_requires=PYTEST_RUNNER,
       tests_require=['pytest', 'pytest-cov',
-                     'responses>=0.3.0', 'responses!=0.6.0', 'mock'],
+                     'responses>=0.3.0', 'responses!=0.6.0', 'mock',
+                     'aiohttp', 'ijson'],
       zip_safe=True
       )
@@ -0,0 +1,93 @@
+# encoding=utf-8
+""" This module contains a local stub of the MediaWiki API, served by a
+thread, for the tests and the benchmarks that need real HTTP connections.
+
+A stub is an object whose ``respond(params)`` method returns the HTTP status
+and the JSON response to the parameters of a request:
+
+    >>> server = serve(stub)
+    >>> site = mwklient.Site('127.0.0.1:%d' % server.server_address[1],
+    ...                      scheme='http')
+    >>> server.shutdown()
+    >>> server.server_close()
+"""
+import threading
+from email.parser import BytesParser
+from six.moves import socketserver
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.urllib.parse import parse_qsl, urlparse
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+
+def parse_multipart(content_type, body):
+    """Return the fields of a multipart/form-data body, by name."""
+    message = BytesParser().parsebytes(
+        b'Content-Type: ' + content_type.encode('ascii') + b'\r\n\r\n'
+        + body)
+    return {part.get_param('name', header='content-disposition'):
+            part.get_payload(decode=True) for part in message.get_payload()}
+
+
+class ThreadedHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, handler, stub=None):
+        HTTPServer.__init__(self, address, handler)
+        self.stub = stub
+        self.lock = threading.Lock()
+        # The addresses the requests came from
+        self.clients = set()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Passes the parameters of each request to the stub of the server, with
+    the files of a multipart/form-data body in ``params['files']``."""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.respond(dict(parse_qsl(urlparse(self.path).query)))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        content_type = self.headers.get('Content-Type', '')
+        if content_type.startswith('multipart/form-data'):
+            fields = parse_multipart(content_type, body)
+            params = {k: v.decode('utf-8') for k, v in fields.items()
+                      if k not in {'chunk', 'file'}}
+            params['files'] = {k: v for k, v in fields.items()
+                               if k in {'chunk', 'file'}}
+        else:
+            params = dict(parse_qsl(body.decode('utf-8')))
+        self.respond(params)
+
+    def respond(self, params):
+        server = self.server
+        with server.lock:
+            server.clients.add(self.client_address)
+        self.send_json(*server.stub.respond(params))
+
+    def send_json(self, status, response):
+        body = json.dumps(response).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(stub, handler=StubHandler):
+    """Start a server for `stub` on a free local port, in a daemon thread,
+    and return it."""
+    server = ThreadedHTTPServer(('127.0.0.1', 0), handler, stub)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
@@ -0,0 +1,287 @@
+# encoding=utf-8
+""" This module contains tests for mwklient.asyncsite.
+The class TestAsyncSite runs an AsyncSite against a local asyncio stand-in
+for the MediaWiki API.
+"""
+import asyncio
+import shutil
+import tempfile
+import unittest
+import pytest
+import mwklient
+from mwklient.cache import SiteinfoCache
+
+aiohttp = pytest.importorskip('aiohttp')
+from aiohttp import web  # noqa: E402
+from mwklient.asyncsite import AsyncSite  # noqa: E402
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+
+SITEINFO = {
+    'general': {'generator': 'MediaWiki 1.33.0', 'writeapi': ''},
+    'namespaces': {
+        '0': {'*': '', 'id': 0},
+        '6': {'*': 'File', 'id': 6},
+        '14': {'*': 'Category', 'id': 14},
+    },
+    'userinfo': {'id': 1, 'name': 'Tester',
+                 'rights': ['read', 'edit', 'writeapi', 'upload']},
+}
+
+
+class StandIn():
+    """A tiny MediaWiki API stand-in, dispatching on request parameters."""
+
+    def __init__(self):
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.delay = 0
+        self.lag_responses = 0
+        self.texts = {'Foo': 'Foo text'}
+
+    async def handle(self, request):
+        params = dict(request.query)
+        if request.method == 'POST':
+            params.update(await request.post())
+        self.requests.append(params)
+
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+
+        if self.lag_responses:
+            self.lag_responses -= 1
+            return web.Response(text='', headers={'x-database-lag': '5',
+                                                  'retry-after': '0'})
+        return web.json_response(self.respond(params))
+
+    def respond(self, params):
+        action = params.get('action')
+        if action == 'edit':
+            assert params['token'] == 'csrf+\\'
+            self.texts[params['title']] = params['text']
+            return {'edit': {'result': 'Success',
+                             'newtimestamp': '2019-01-01T10:00:00Z'}}
+        if action == 'parse':
+            return {'parse': {'title': 'API', 'text': {
+                '*': '<p>{}</p>'.format(params.get('text'))}}}
+        if action == 'ask':
+            if params['query'].endswith('offset=0'):
+                return {'query-continue-offset': 1,
+                        'query': {'results': {'A': {'fulltext': 'A'}}}}
+            return {'query': {'results': [{'fulltext': 'B'}]}}
+        if action == 'upload':
+            assert params['token'] == 'csrf+\\'
+            return {'upload': {'result': 'Success',
+                               'filename': params['filename']}}
+        if params.get('meta', '').startswith('siteinfo'):
+            return {'query': SITEINFO}
+        if params.get('meta') == 'tokens':
+            return {'query': {'tokens': {'csrftoken': 'csrf+\\'}}}
+        if params.get('list') == 'allpages':
+            if 'apcontinue' not in params:
+                return {'continue': {'apcontinue': 'B', 'continue': '-||'},
+                        'query': {'allpages': [{'title': 'A', 'ns': 0}]}}
+            return {'query': {'allpages': [{'title': 'B', 'ns': 0}]}}
+        if params.get('prop') == 'info|revisions':
+            pages = {}
+            for i, title in enumerate(params['titles'].split('|')):
+                page = {'title': title, 'ns': 0, 'pageid': i + 1}
+                if title in self.texts:
+                    page['revisions'] = [{
+                        'revid': i + 10, 'timestamp': '2019-01-01T00:00:00Z',
+                        'slots': {'main': {'*': self.texts[title]}}}]
+                else:
+                    page['missing'] = ''
+                pages[str(i + 1)] = page
+            return {'query': {'pages': pages}}
+        if params.get('prop') == 'pageprops':
+            return {'query': {'redirects': [{'from': 'Bar', 'to': 'Foo'}]}}
+        if params.get('prop') == 'revisions':
+            title = params['titles']
+            return {'query': {'pages': {'1': {
+                'title': title, 'revisions': [{
+                    'timestamp': '2019-01-01T00:00:00Z',
+                    'slots': {'main': {'*': self.texts[title]}}}]}}}}
+        if 'info' in params.get('prop', ''):
+            title = params['titles']
+            page = {'title': title, 'ns': 0, 'lastrevid': 1}
+            if title.startswith('File:'):
+                page['ns'] = 6
+            elif title not in self.texts:
+                page['missing'] = ''
+            return {'query': {'pages': {'1': page}}}
+        if params.get('meta') == 'userinfo':
+            return {'query': {'userinfo': SITEINFO['userinfo']}}
+        return {'query': {}}
+
+
+class TestAsyncSite(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.stand_in = StandIn()
+        app = web.Application()
+        app.router.add_route('*', '/w/api.php', self.stand_in.handle)
+        self.runner = web.AppRunner(app)
+        self.loop.run_until_complete(self.runner.setup())
+        server = web.TCPSite(self.runner, '127.0.0.1', 0)
+        self.loop.run_until_complete(server.start())
+        port = server._server.sockets[0].getsockname()[1]
+        self.host = '127.0.0.1:%d' % port
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.runner.cleanup())
+        self.loop.close()
+
+    def run_with_site(self, coro_function, **kwargs):
+        async def main():
+            async with AsyncSite(self.host, scheme='http', retry_timeout=0,
+                                 **kwargs) as site:
+                return await coro_function(site)
+        return self.loop.run_until_complete(main())
+
+    def test_connect(self):
+        async def check(site):
+            return site
+
+        site = self.run_with_site(check)
+        assert site.initialized
+        assert site.version == (1, 33, 0)
+        assert site.rights == ['read', 'edit', 'writeapi', 'upload']
+        assert site.session is None
+
+    def test_max_lag_is_retried(self):
+        # The maxlag policy is shared with the synchronous Site
+        self.stand_in.lag_responses = 2
+
+        async def check(site):
+            return await site.get('query', list='allpages')
+
+        self.run_with_site(check)
+        assert len(self.stand_in.requests) == 4
+
+    def test_concurrent_requests(self):
+        async def check(site):
+            self.stand_in.delay = 0.05
+            calls = [site.get('query', meta='tokens') for _ in range(50)]
+            return await asyncio.gather(*calls)
+
+        results = self.run_with_site(check)
+        assert len(results) == 50
+        assert self.stand_in.max_in_flight > 10
+
+    def test_async_list(self):
+        async def check(site):
+            titles = []
+            async for title in site.allpages(generator=False):
+                titles.append(title)
+            return titles
+
+        assert self.run_with_site(check) == ['A', 'B']
+
+    def test_page_text_and_edit(self):
+        async def check(site):
+            page = await site.pages['Foo']
+            text = await page.atext()
+            result = await page.aedit('New text', 'Summary')
+            return page, text, result
+
+        page, text, result = self.run_with_site(check)
+        assert isinstance(page, mwklient.page.Page)
+        assert text == 'Foo text'
+        assert result['result'] == 'Success'
+        assert self.stand_in.texts['Foo'] == 'New text'
+        assert page.last_rev_time.tm_hour == 10
+
+    def test_upload(self):
+        async def check(site):
+            with open(__file__, 'rb') as fd:
+                return await site.upload(fd, 'Test.py')
+
+        result = self.run_with_site(check)
+        assert result == {'result': 'Success', 'filename': 'Test.py'}
+        assert any(r.get('action') == 'upload' for r in self.stand_in.requests)
+
+    def test_read_methods(self):
+        # The methods reading the API have asynchronous versions
+        async def check(site):
+            parsed = await site.parse(text='x')
+            texts = [(page.name, text)
+                     async for page, text in site.texts(['Foo', 'Baz'])]
+            streamed = [(page.name, text) async for page, text in
+                        site.texts(['Foo'], stream=True)]
+            answers = [answer async for answer in site.ask('[[A]]')]
+            titles = [page['title'] async for page in site.stream_api(
+                'query', 'query.allpages', list='allpages')]
+            metrics = site.metrics.snapshot()['query+allpages+userinfo']
+            streamed_bytes = metrics['bytes_in']
+            page = await site.pages['Bar']
+            target = await page.aredirects_to()
+            return (parsed, texts, streamed, answers, titles, streamed_bytes,
+                    target)
+
+        parsed, texts, streamed, answers, titles, streamed_bytes, target = \
+            self.run_with_site(check)
+        assert parsed['text']['*'] == '<p>x</p>'
+        assert sorted(texts) == [('Baz', ''), ('Foo', 'Foo text')]
+        assert streamed == [('Foo', 'Foo text')]
+        assert answers == [{'fulltext': 'A'}, {'fulltext': 'B'}]
+        assert titles == ['A']
+        # The body of the stream is counted as it is read
+        assert streamed_bytes == len(json.dumps({
+            'continue': {'apcontinue': 'B', 'continue': '-||'},
+            'query': {'allpages': [{'title': 'A', 'ns': 0}]}}))
+        assert target.name == 'Foo'
+
+    def test_blocking_methods(self):
+        # The methods that would block, or call coroutines without awaiting
+        # them, raise TypeError
+        async def check(site):
+            page = await site.pages['Foo']
+            for call in (page.text, page.redirects_to,
+                         lambda: page.edit('Text'),
+                         lambda: site.bulk_edit([]),
+                         lambda: site.partitioned('allpages'),
+                         lambda: site.resume_upload(None, 'state')):
+                with pytest.raises(TypeError):
+                    call()
+            with pytest.raises(TypeError):
+                iter(site.stream_api('query', 'query.allpages',
+                                     list='allpages'))
+
+        self.run_with_site(check)
+
+    def test_siteinfo_cache(self):
+        # The site information comes from the snapshot, the user information
+        # from the server
+        cache = SiteinfoCache(tempfile.mkdtemp())
+        try:
+            site = self.run_with_site(lambda site: asyncio.sleep(0, site),
+                                      siteinfo_cache=cache)
+            assert site.version == (1, 33, 0)
+            count = len(self.stand_in.requests)
+            site = self.run_with_site(lambda site: asyncio.sleep(0, site),
+                                      siteinfo_cache=cache)
+        finally:
+            shutil.rmtree(cache.directory)
+        assert len(self.stand_in.requests) == count + 1
+        assert self.stand_in.requests[-1]['meta'] == 'userinfo'
+        assert site.version == (1, 33, 0)
+        assert site.rights == ['read', 'edit', 'writeapi', 'upload']
+
+    def test_cheat_pylint(self):
+        self.assertIsNotNone(json)
+
+
+if __name__ == '__main__':
+    print("\nNote: Running in stand-alone mode. Consult the README\n")
+    unittest.main()
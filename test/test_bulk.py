@@ -0,0 +1,97 @@
+# encoding=utf-8
+""" This module contains tests for mwklient.bulk.
+The class TestBulkEditor runs bulk edits of mock pages.
+"""
+import threading
+import time
+import unittest
+import mock
+import mwklient
+from mwklient.bulk import BulkEditor
+from mwklient.errors import APIError
+
+
+def ratelimits(**limits):
+    return {'query': {'userinfo': {'id': 1, 'name': 'Bot',
+                                   'ratelimits': {'edit': limits}}}}
+
+
+class TestBulkEditor(unittest.TestCase):
+
+    def setUp(self):
+        self.site = mock.Mock()
+        self.site.get.return_value = ratelimits()
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def make_page(self, name, failures=()):
+        page = mock.Mock()
+        page.name = name
+        failures = list(failures)
+
+        def edit(text, summary, **kwargs):
+            with self.lock:
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            time.sleep(0.01)
+            with self.lock:
+                self.in_flight -= 1
+            if failures:
+                raise failures.pop(0)
+            return {'result': 'Success', 'title': name, 'text': text}
+
+        page.edit.side_effect = edit
+        return page
+
+    def test_concurrent_edits(self):
+        pages = [self.make_page('Page %d' % i) for i in range(20)]
+        edits = ((page, 'Text', 'Summary') for page in pages)
+
+        results = list(self.site_bulk_edit(edits, concurrency=4))
+
+        assert len(results) == 20
+        assert all(res.error is None for res in results)
+        assert sorted(res.result['title'] for res in results) == sorted(
+            page.name for page in pages)
+        assert 1 < self.max_in_flight <= 4
+        self.site.get_token.assert_called_once_with('csrf')
+        pages[0].edit.assert_called_once_with('Text', 'Summary', minor=True)
+
+    def site_bulk_edit(self, edits, **kwargs):
+        # Site.bulk_edit, bound to the mock site
+        return mwklient.Site.bulk_edit(self.site, edits, minor=True, **kwargs)
+
+    def test_ratelimits_of_the_user(self):
+        self.site.get.return_value = ratelimits(
+            user={'hits': 90, 'seconds': 60},
+            newbie={'hits': 8, 'seconds': 60})
+        editor = BulkEditor(self.site)
+
+        assert (editor.bucket.rate, editor.bucket.per) == (8, 60)
+        self.site.get.assert_called_once_with('query', meta='userinfo',
+                                              uiprop='ratelimits')
+
+        # No limit when the user info is missing
+        self.site.get.return_value = {'batchcomplete': ''}
+        editor = BulkEditor(self.site, per=30)
+        assert (editor.bucket.rate, editor.bucket.per) == (None, 30)
+
+    def test_ratelimited(self):
+        error = APIError('ratelimited', 'Slow down', {})
+        pages = [self.make_page('A', failures=[error]),
+                 self.make_page('B', failures=[APIError('badvalue', '', {})])]
+        editor = BulkEditor(self.site, rate=1000, per=1)
+
+        results = {res.page.name: res
+                   for res in editor.run((p, 'Text', '') for p in pages)}
+
+        assert results['A'].error is None
+        assert pages[0].edit.call_count == 2
+        assert results['B'].error.code == 'badvalue'
+        assert results['B'].result is None
+        assert editor.bucket.rate == 500
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,307 @@
+# encoding=utf-8
+""" This module contains tests for mwklient.cache.
+The class TestSiteinfoCache checks the snapshots themselves and the startup
+of a Site from a snapshot. The class TestResponseCache checks the response
+caches and their use by Site.raw_call(). The class TestContentCache checks
+the revision contents shared by the pages of a site.
+"""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import responses
+import mwklient
+from mwklient.cache import ContentCache, DiskCache, MemoryCache
+from mwklient.cache import SiteinfoCache
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+API_URL = 'https://test.wikipedia.org/w/api.php'
+
+SITEINFO = {
+    'general': {'generator': 'MediaWiki 1.33.0', 'writeapi': ''},
+    'namespaces': {'0': {'*': '', 'id': 0}, '14': {'*': 'Kategorie',
+                                                   'id': 14}},
+}
+
+
+class TestSiteinfoCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = SiteinfoCache(os.path.join(self.directory, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def meta_response(self):
+        query = dict(SITEINFO)
+        query['userinfo'] = {'id': 1, 'name': 'Tester',
+                             'groups': ['*', 'user'], 'rights': ['edit']}
+        return json.dumps({'query': query})
+
+    def test_get_and_set(self):
+        assert self.cache.get('key') is None
+        self.cache.set('key', SITEINFO)
+        assert self.cache.get('key') == SITEINFO
+        assert self.cache.get('other key') is None
+
+        self.cache.delete('key')
+        assert self.cache.get('key') is None
+
+    def test_expired(self):
+        self.cache.set('key', SITEINFO)
+        self.cache.ttl = 10
+        with open(self.cache.path('key')) as fd:
+            snapshot = json.load(fd)
+        snapshot['time'] = time.time() - 20
+        with open(self.cache.path('key'), 'w') as fd:
+            json.dump(snapshot, fd)
+
+        assert self.cache.get('key') is None
+
+    def test_corrupted(self):
+        self.cache.set('key', SITEINFO)
+        with open(self.cache.path('key'), 'w') as fd:
+            fd.write('{"key": "ke')
+
+        assert self.cache.get('key') is None
+
+    @responses.activate
+    def test_site_startup(self):
+        responses.add(responses.GET, API_URL, body=self.meta_response(),
+                      content_type='application/json')
+
+        # A first site stores the snapshot
+        site = mwklient.Site('test.wikipedia.org', siteinfo_cache=self.cache)
+        assert len(responses.calls) == 1
+        assert not site.from_snapshot
+
+        # The next one starts from it, without any request
+        site = mwklient.Site('test.wikipedia.org', siteinfo_cache=self.cache)
+        assert len(responses.calls) == 1
+        assert site.initialized
+        assert site.from_snapshot
+        assert site.version == (1, 33, 0)
+        assert site.namespaces[14] == 'Kategorie'
+
+        # The user information is loaded on demand, along with the siteinfo
+        assert site.rights == ['edit']
+        assert len(responses.calls) == 2
+        assert 'siteinfo' in responses.calls[1].request.url
+        assert not site.from_snapshot
+        assert site.username == 'Tester'
+        assert len(responses.calls) == 2
+
+
+def entry(text, max_age=0, etag=None):
+    return {'text': text, 'etag': etag, 'last_modified': None,
+            'expires': time.time() + max_age}
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def site(self, cache):
+        query = dict(SITEINFO, userinfo={'id': 1, 'name': 'Tester'})
+        responses.add(responses.GET, API_URL, content_type='application/json',
+                      body=json.dumps({'query': query}))
+        site = mwklient.Site('test.wikipedia.org', response_cache=cache,
+                             userinfo_refresh='writes')
+        responses.reset()
+        return site
+
+    def test_memory_eviction(self):
+        cache = MemoryCache(max_size=10)
+        cache.set('a', entry('aaaa'))
+        cache.set('b', entry('bbbb'))
+        assert cache.get('a')['text'] == 'aaaa'
+        cache.set('c', entry('cccc'))
+
+        # b was the least recently used
+        assert cache.get('b') is None
+        assert cache.get('a') is not None
+        assert cache.size == 8
+
+        cache.set('d', entry('d' * 11))
+        assert cache.get('d') is None
+        assert len(cache) == 2
+
+    def test_disk_eviction(self):
+        cache = DiskCache(self.directory, max_size=1500)
+        for i in range(3):
+            cache.set('key %d' % i, entry('x' * 300))
+            os.utime(cache.path('key %d' % i), (i, i))
+        assert cache.get('key 0')['text'] == 'x' * 300
+        cache.set('key 3', entry('x' * 300))
+
+        # key 0 was used last, so key 1 goes first
+        assert cache.get('key 1') is None
+        assert cache.get('key 0') is not None
+        assert cache.get('key 3') is not None
+        assert cache.size <= 1500
+
+        # The size is known again after a restart
+        assert DiskCache(self.directory).size == cache.size
+
+    @responses.activate
+    def test_fresh(self):
+        site = self.site(MemoryCache())
+        responses.add(responses.GET, API_URL, body='{"parse": {}}',
+                      headers={'Cache-Control': 'private, max-age=60',
+                               'Age': '10'})
+
+        assert site.get('parse', page='Test') == {'parse': {}}
+        assert site.get('parse', page='Test') == {'parse': {}}
+        assert len(responses.calls) == 1
+
+    @responses.activate
+    def test_revalidation(self):
+        site = self.site(DiskCache(self.directory))
+        responses.add(responses.GET, API_URL, body='{"parse": {}}',
+                      headers={'Cache-Control': 'max-age=0', 'ETag': '"v1"'})
+        responses.add(responses.GET, API_URL, status=304)
+
+        assert site.get('parse', page='Test') == {'parse': {}}
+        assert site.get('parse', page='Test') == {'parse': {}}
+        assert site.get('parse', page='Test') == {'parse': {}}
+        assert len(responses.calls) == 3
+        assert 'If-None-Match' not in responses.calls[0].request.headers
+        assert responses.calls[1].request.headers['If-None-Match'] == '"v1"'
+        # The validator is kept after a 304 response without it
+        assert responses.calls[2].request.headers['If-None-Match'] == '"v1"'
+
+    @responses.activate
+    def test_bypass(self):
+        site = self.site(MemoryCache())
+        headers = {'Cache-Control': 'max-age=60'}
+        responses.add(responses.GET, API_URL, body='{}', headers=headers)
+        responses.add(responses.POST, API_URL, body='{}', headers=headers)
+
+        for _ in range(2):
+            site.post('parse', page='Test')
+            site.get('query', meta='tokens')
+            site.get('query', list='allpages', refresh_userinfo=True)
+            site.get('parse', page='Test', token='+\\\\')
+            site.raw_call('api', {'action': 'parse'}, http_method='GET',
+                          stream=True)
+        assert len(responses.calls) == 10
+        assert len(site.response_cache) == 0
+
+    @responses.activate
+    def test_errors(self):
+        site = self.site(MemoryCache())
+        headers = {'Cache-Control': 'max-age=60'}
+        responses.add(responses.GET, API_URL, headers=headers,
+                      body='{"error": {"code": "missingtitle", "info": ""}}')
+        responses.add(responses.GET, API_URL, body='{"parse": {}}',
+                      headers=dict(headers, **{
+                          'MediaWiki-API-Error': 'internal_api_error'}))
+
+        with self.assertRaises(mwklient.errors.APIError):
+            site.get('parse', page='A')
+        # Marked as an error by its header only
+        site.get('parse', page='B')
+        assert len(site.response_cache) == 0
+
+    @responses.activate
+    def test_parse(self):
+        # Pages are parsed with GET requests, which can be cached
+        site = self.site(MemoryCache())
+        responses.add(responses.GET, API_URL, body='{"parse": {"text": ""}}',
+                      headers={'Cache-Control': 'max-age=300'})
+        responses.add(responses.POST, API_URL, body='{"parse": {}}')
+
+        assert site.parse(page='Test', maxage=300) == {'text': ''}
+        assert site.parse(page='Test', maxage=300) == {'text': ''}
+        assert 'maxage=300' in responses.calls[0].request.url
+        site.parse(text='Some [[wikitext]]')
+        assert len(responses.calls) == 2
+        assert responses.calls[1].request.method == 'POST'
+
+    @responses.activate
+    def test_no_store(self):
+        site = self.site(MemoryCache())
+        responses.add(responses.GET, API_URL, body='{}',
+                      headers={'Cache-Control': 'no-store, max-age=60'})
+        responses.add(responses.GET, API_URL, body='{}',
+                      headers={'Cache-Control': 'no-cache'})
+
+        site.get('parse', page='A')
+        site.get('parse', page='B')
+        assert len(site.response_cache) == 0
+
+
+class TestContentCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_get_and_set(self):
+        cache = ContentCache(store=DiskCache(self.directory))
+        timestamp = time.strptime('2019-05-01T10:00:00Z',
+                                  '%Y-%m-%dT%H:%M:%SZ')
+        cache.set(12, 'main', None, False, 'Text', timestamp)
+
+        assert cache.get(12) == ('Text', timestamp)
+        assert cache.get(12, section='0') is None
+        assert cache.get(12, expandtemplates=True) is None
+        assert cache.get(13) is None
+        assert (cache.hits, cache.misses) == (1, 3)
+
+    @responses.activate
+    def test_shared_by_pages(self):
+        query = dict(SITEINFO, userinfo={'id': 1, 'name': 'Tester',
+                                         'rights': ['read']})
+        responses.add(responses.GET, API_URL, content_type='application/json',
+                      body=json.dumps({'query': query}))
+        site = mwklient.Site('test.wikipedia.org', userinfo_refresh='writes')
+        responses.reset()
+
+        info = {'pageid': 1, 'ns': 0, 'title': 'Test', 'lastrevid': 12}
+        revision = {'revid': 12, 'timestamp': '2019-05-01T10:00:00Z',
+                    'slots': {'main': {'*': 'Text'}}}
+        responses.add(responses.GET, API_URL, body=json.dumps({'query': {
+            'pages': {'1': dict(info, revisions=[revision])}}}))
+
+        page = mwklient.page.Page(site, 'Test', dict(info))
+        assert page.text() == 'Text'
+        assert len(responses.calls) == 1
+        assert 'ids' in responses.calls[0].request.url
+
+        # Another instance of the page finds the text of the revision
+        other = mwklient.page.Page(site, 'Test', dict(info))
+        assert other.text() == 'Text'
+        assert other.last_rev_time == page.last_rev_time
+        assert len(responses.calls) == 1
+        assert (site.content_cache.hits, site.content_cache.misses) == (1, 1)
+
+        # But not once the page has changed
+        other = mwklient.page.Page(site, 'Test', dict(info, lastrevid=13))
+        assert other.text() == 'Text'
+        assert len(responses.calls) == 2
+
+        # Expanded texts are not shared, since the templates may have changed
+        expanded = []
+        site.expandtemplates = lambda text: expanded.append(text) or 'TEXT'
+        for _ in range(2):
+            page = mwklient.page.Page(site, 'Test', dict(info))
+            assert page.text(expandtemplates=True) == 'TEXT'
+        assert expanded == ['Text', 'Text']
+        assert len(responses.calls) == 4
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -126,6 +126,61 @@ class TestClient(TestCase):
         assert 'retry-after' in responses.calls[0].response.headers
         assert 'retry-after' not in responses.calls[1].response.headers
 
+    @responses.activate
+    @mock.patch('time.sleep')
+    def test_max_lag_gate(self, sleep):
+        # The lag seen by one request pauses the others sharing the gate
+
+        def request_callback(request):
+            if len(responses.calls) == 0:
+                return (200, {'x-database-lag': '5', 'retry-after': '5'}, '')
+            return (200, {}, self.metaResponseAsJson())
+
+        self.httpShouldReturn(callback=request_callback, scheme='https')
+
+        gate = mwklient.sleep.BackoffGate()
+        mwklient.Site('test.wikipedia.org', backoff_gate=gate)
+        assert gate.remaining() > 4
+        assert sleep.call_args_list[0] == mock.call(5)
+
+    @responses.activate
+    @mock.patch('time.sleep')
+    def test_metrics(self, sleep):
+        # The requests and retries are recorded by module
+
+        def request_callback(request):
+            if len(responses.calls) == 0:
+                return (200, {'x-database-lag': '5', 'retry-after': '5'}, '')
+            return (200, {}, self.metaResponseAsJson())
+
+        self.httpShouldReturn(callback=request_callback, scheme='https')
+
+        site = mwklient.Site('test.wikipedia.org')
+        metrics = site.metrics.snapshot()
+        assert list(metrics) == ['query+siteinfo|userinfo']
+        counters = metrics['query+siteinfo|userinfo']
+        assert counters['requests'] == 2
+        assert counters['retries'] == 1 and counters['sleep_time'] == 5
+        assert counters['bytes_in'] == len(self.metaResponseAsJson())
+        assert counters['bytes_out'] > 0
+        assert counters['http_time'] > 0 and counters['decode_time'] > 0
+
+    @responses.activate
+    def test_json_decoder(self):
+        # A custom decoder should be used for the API responses
+
+        self.httpShouldReturn(self.metaResponseAsJson(), scheme='https')
+        decoded = []
+
+        def decoder(res):
+            decoded.append(res)
+            return json.loads(res)
+
+        site = mwklient.Site('test.wikipedia.org', json_decoder=decoder)
+
+        assert len(decoded) == 1
+        assert site.initialized
+
     @responses.activate
     def test_http_error(self):
         # Client should raise HTTPError
@@ -177,6 +232,25 @@ class TestClient(TestCase):
 
         assert 'action=query' in responses.calls[0].request.url
         assert 'meta=siteinfo%7Cuserinfo' in responses.calls[0].request.url
+        assert 'maxlag=3' in responses.calls[0].request.url
+
+    @responses.activate
+    def test_lag_control(self):
+        # A lagged response lowers the concurrency of the requests
+
+        def request_callback(request):
+            if len(responses.calls) == 0:
+                return (200, {'x-database-lag': '5', 'retry-after': '0'}, '')
+            return (200, {}, self.metaResponseAsJson())
+
+        self.httpShouldReturn(callback=request_callback, scheme='https')
+
+        control = mwklient.throttle.LagController(max_concurrency=4)
+        mwklient.Site('test.wikipedia.org', max_lag=None, lag_control=control)
+        assert 'maxlag' not in responses.calls[0].request.url
+        assert control.lagged == 1 and control.lag == 5
+        assert control.concurrency == 2
+        assert control.active == 0 and control.successes == 1
 
     @responses.activate
     def test_httpauth_defaults_to_basic_auth(self):
@@ -512,6 +586,160 @@ class TestClientApiMethods(TestCase):
         assert revisions[0]['timestamp'] == time.strptime(
             '2015-11-08T21:52:46Z', '%Y-%m-%dT%H:%M:%SZ')
         assert revisions[1]['revid'] == 689816909
+        # The response, which may be shared, is left untouched
+        raw = self.api.return_value['query']['pages']['1']['revisions'][0]
+        assert raw == {'revid': 689697696, 'timestamp': '2015-11-08T21:52:46Z',
+                       'comment': 'Test comment 1'}
+
+    def test_recentchanges(self):
+        self.api.return_value = {'query': {'recentchanges': [
+            {'title': 'Foo', 'rcid': 1, 'timestamp': '2019-05-01T10:00:00Z'}]}}
+
+        changes = list(self.site.recentchanges(start='2019-05-01T10:00:00Z',
+                                               direc='newer', namespace='0'))
+
+        args, kwargs = self.api.call_args
+        params = dict(args[2:], **kwargs)
+        assert params['list'] == 'recentchanges'
+        assert params['rcdir'] == 'newer'
+        assert params['rcstart'] == '2019-05-01T10:00:00Z'
+        assert 'rcdirec' not in params
+        assert changes[0]['title'] == 'Foo'
+
+    def test_texts(self):
+        # Pages left out of a truncated response come with the continuation
+        self.api.side_effect = [{
+            'continue': {'rvcontinue': '2|3', 'continue': '||'},
+            'query': {'pages': {
+                '1': {'pageid': 1, 'ns': 0, 'title': 'Foo', 'revisions': [{
+                    'timestamp': '2015-11-08T21:52:46Z', '*': 'Foo text'}]},
+                '2': {'pageid': 2, 'ns': 0, 'title': 'Bar'},
+                '-1': {'ns': 0, 'title': 'Baz', 'missing': ''},
+            }}}, {
+            'query': {'pages': {
+                '1': {'pageid': 1, 'ns': 0, 'title': 'Foo'},
+                '2': {'pageid': 2, 'ns': 0, 'title': 'Bar', 'revisions': [{
+                    'timestamp': '2015-11-09T16:09:28Z', '*': 'Bar text'}]},
+                '-1': {'ns': 0, 'title': 'Baz', 'missing': ''},
+            }}}]
+
+        self.api.reset_mock()
+        bar = mwklient.page.Page(self.site, 'Bar', {'title': 'Bar'})
+        texts = list(self.site.texts(['Foo', bar, 'Baz']))
+
+        assert self.api.call_count == 2
+        args, kwargs = self.api.call_args_list[0]
+        assert kwargs['titles'] == 'Foo|Bar|Baz'
+        assert 'content' in kwargs['rvprop']
+        args, kwargs = self.api.call_args_list[1]
+        assert kwargs['rvcontinue'] == '2|3'
+
+        assert [(page.name, text) for page, text in texts] == [
+            ('Foo', 'Foo text'), ('Baz', ''), ('Bar', 'Bar text')]
+        assert texts[2][0] is bar
+        assert bar.last_rev_time == time.strptime(
+            '2015-11-09T16:09:28Z', '%Y-%m-%dT%H:%M:%SZ')
+
+        # The text is now cached by the page
+        self.site.rights = ['read']
+        assert bar.text() == 'Bar text'
+        assert self.api.call_count == 2
+
+        # An uninitialized site assumes a recent MediaWiki
+        self.site.version = None
+        self.api.side_effect = None
+        self.api.return_value = {'query': {'pages': {}}}
+        assert list(self.site.texts(['Qux'])) == []
+        assert self.api.call_args[1]['rvslots'] == 'main'
+
+
+class TestClientUserinfoRefresh(TestCase):
+
+    def setUp(self):
+        self.raw_api = mock.patch('mwklient.client.Site.raw_api').start()
+        self.raw_api.return_value = self.metaResponse()
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def last_query(self):
+        return self.raw_api.call_args[1]
+
+    def test_always(self):
+        site = mwklient.Site('test.wikipedia.org')
+        site.get('query', list='allpages')
+
+        assert self.last_query()['meta'] == 'userinfo'
+        assert self.last_query()['uiprop'] == 'blockinfo|hasmsg'
+
+    def test_writes(self):
+        site = mwklient.Site('test.wikipedia.org', userinfo_refresh='writes')
+        # The initial query asks for the complete user state
+        assert 'blockinfo' in self.last_query()['uiprop']
+
+        site.get('query', list='allpages')
+        assert 'meta' not in self.last_query()
+        assert 'uiprop' not in self.last_query()
+
+        # The state is fresh enough
+        self.raw_api.reset_mock()
+        site.ensure_user_state()
+        assert not self.raw_api.called
+
+        site.userinfo_time -= 61
+        site.ensure_user_state()
+        assert self.last_query()['meta'] == 'userinfo'
+        assert self.last_query()['uiprop'] == 'blockinfo|hasmsg'
+
+    def test_interval(self):
+        site = mwklient.Site('test.wikipedia.org', userinfo_refresh=30)
+        site.get('query', list='allpages')
+        assert 'meta' not in self.last_query()
+
+        site.userinfo_time -= 31
+        site.get('query', list='allpages')
+        assert self.last_query()['meta'] == 'userinfo'
+
+    def test_per_call(self):
+        site = mwklient.Site('test.wikipedia.org', userinfo_refresh='writes')
+        site.get('query', list='allpages', refresh_userinfo=True)
+        assert self.last_query()['meta'] == 'userinfo'
+        assert 'refresh_userinfo' not in self.last_query()
+
+        site = mwklient.Site('test.wikipedia.org')
+        site.get('query', list='allpages', refresh_userinfo=False)
+        assert 'meta' not in self.last_query()
+
+    def test_invalid_mode(self):
+        with pytest.raises(RuntimeError):
+            mwklient.Site('test.wikipedia.org', userinfo_refresh='never')
+
+    def test_userinfo_readers(self):
+        # The callers reading the user info ask for it, as queries do not
+        # piggy-back it anymore
+
+        def raw_api(action, http_method='POST', *args, **kwargs):
+            response = self.metaResponse()
+            userinfo = response['query'].pop('userinfo')
+            if 'userinfo' in kwargs.get('meta', ''):
+                response['query']['userinfo'] = userinfo
+                if 'ratelimits' in kwargs.get('uiprop', ''):
+                    userinfo['ratelimits'] = {'edit': {
+                        'user': {'hits': 90, 'seconds': 60}}}
+            return response
+
+        self.raw_api.side_effect = raw_api
+        site = mwklient.Site('test.wikipedia.org', userinfo_refresh='writes')
+        site.get('query', list='allpages')
+        site.site_init()
+        assert 'read' in site.rights
+
+        editor = mwklient.bulk.BulkEditor(site)
+        assert (editor.bucket.rate, editor.bucket.per) == (90, 60)
+
+        site.userinfo_time -= 61
+        site.ensure_user_state()
+        assert self.last_query()['meta'] == 'userinfo'
 
 
 class TestClientUploadArgs(TestCase):
@@ -0,0 +1,146 @@
+# encoding=utf-8
+""" This module contains a stress test of a Site shared by many threads.
+The class TestConcurrency runs it against a local threaded stub of the
+MediaWiki API.
+"""
+import itertools
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+import mwklient
+from mwklient.client import UserState
+from stub_server import serve
+
+THREADS = 32
+
+SITEINFO = {
+    'general': {'generator': 'MediaWiki 1.33.0', 'writeapi': ''},
+    'namespaces': {'0': {'*': '', 'id': 0}},
+}
+
+# The two user states the stub alternates between
+USERINFO = [
+    {'id': 1, 'name': 'Tester', 'messages': '',
+     'blockedby': 'Admin', 'blockreason': 'Testing'},
+    {'id': 0, 'name': '127.0.0.1', 'anon': ''},
+]
+USER_STATES = [
+    UserState(blocked=('Admin', 'Testing'), hasmsg=True, logged_in=True),
+    UserState(blocked=False, hasmsg=False, logged_in=False),
+]
+
+
+class Stub():
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.token_requests = 0
+        self.page_requests = 0
+        self.delay = 0.0
+        self.edits = []
+        self.userinfo = itertools.cycle(USERINFO)
+
+    def respond(self, params):
+        if params.get('meta') == 'tokens':
+            with self.lock:
+                self.token_requests += 1
+            # Leave the other threads time to ask for the token as well
+            time.sleep(0.1)
+            return 200, {'query': {'tokens': {'csrftoken': 'csrf+\\'}}}
+        if params.get('action') == 'edit':
+            if params.get('token') != 'csrf+\\':
+                return 200, {'error': {'code': 'badtoken',
+                                       'info': 'Bad token'}}
+            with self.lock:
+                self.edits.append(params['title'])
+            return 200, {'edit': {'result': 'Success'}}
+
+        with self.lock:
+            query = {'userinfo': dict(next(self.userinfo))}
+        if 'siteinfo' in params.get('meta', ''):
+            query.update(SITEINFO)
+        if params.get('list') == 'allpages':
+            query['allpages'] = [{'title': 'A', 'ns': 0}]
+        if params.get('prop') == 'info':
+            with self.lock:
+                self.page_requests += 1
+            time.sleep(self.delay)
+            query['pages'] = {'1': {'pageid': 1, 'ns': 0,
+                                    'title': params['titles']}}
+        return 200, {'query': query}
+
+
+class TestConcurrency(unittest.TestCase):
+
+    def setUp(self):
+        self.stub = Stub()
+        self.server = serve(self.stub)
+        self.host = '127.0.0.1:%d' % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_shared_site(self):
+        site = mwklient.Site(self.host, scheme='http', pool_size=THREADS)
+        states = []
+        done = threading.Event()
+
+        def watch():
+            while not done.wait(0.001):
+                states.append(site.user_state)
+
+        def work(i):
+            token = site.get_token('csrf')
+            for j in range(5):
+                site.get('query', list='allpages')
+                site.post('edit', title='Page %d-%d' % (i, j), text='Text',
+                          token=token)
+
+        watcher = threading.Thread(target=watch)
+        watcher.start()
+        try:
+            with ThreadPoolExecutor(THREADS) as executor:
+                list(executor.map(work, range(THREADS)))
+        finally:
+            done.set()
+            watcher.join()
+
+        # Single-flight token fetching
+        assert self.stub.token_requests == 1
+        assert len(self.stub.edits) == THREADS * 5
+        # The connections are reused by the pool
+        assert len(self.server.clients) <= THREADS
+        # The user state is never a mix of different responses
+        assert states
+        assert all(state in USER_STATES for state in states)
+
+    def test_coalesced_reads(self):
+        self.stub.delay = 0.05
+        site = mwklient.Site(self.host, scheme='http', pool_size=THREADS)
+        barrier = threading.Barrier(THREADS)
+
+        def work(i):
+            barrier.wait()
+            return site.get('query', prop='info', titles='Page %d' % (i % 2))
+
+        with ThreadPoolExecutor(THREADS) as executor:
+            results = list(executor.map(work, range(THREADS)))
+
+        # One request per title, shared by the threads asking for it
+        assert self.stub.page_requests == 2
+        assert site.flights.saved == THREADS - 2
+        assert results[0] is results[2]
+        assert results[0]['query']['pages']['1']['title'] == 'Page 0'
+
+        self.stub.page_requests = 0
+        site.coalesce = False
+        barrier.reset()
+        with ThreadPoolExecutor(THREADS) as executor:
+            list(executor.map(work, range(THREADS)))
+        assert self.stub.page_requests == THREADS
+
+
+if __name__ == '__main__':
+    unittest.main()
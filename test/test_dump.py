@@ -0,0 +1,208 @@
+# encoding=utf-8
+""" This module contains tests for mwklient.dump.
+The class TestDumpSite reads small dumps written in the formats of the
+Wikimedia dumps: uncompressed, multistream with or without the companion
+index, and compressed as a single stream.
+"""
+import bz2
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from mwklient.dump import DumpIndex, DumpSite
+
+HEADER = u'''<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/" \
+version="0.10" xml:lang="en">
+  <siteinfo>
+    <sitename>Wikipedia</sitename>
+    <dbname>testwiki</dbname>
+    <base>https://test.wikipedia.org/wiki/Main_Page</base>
+    <generator>MediaWiki 1.34.0-wmf.20</generator>
+    <case>first-letter</case>
+    <namespaces>
+      <namespace key="-1" case="first-letter">Special</namespace>
+      <namespace key="0" case="first-letter" />
+      <namespace key="10" case="first-letter">Template</namespace>
+      <namespace key="14" case="first-letter">Category</namespace>
+    </namespaces>
+  </siteinfo>
+'''
+
+REVISION = u'''    <revision>
+      <id>{revid}</id>
+      <parentid>{parentid}</parentid>
+      <timestamp>2019-05-0{revid}T10:00:00Z</timestamp>
+      <contributor>
+        <username>{user}</username>
+        <id>7</id>
+      </contributor>
+      <comment>Edit {revid}</comment>
+      <model>wikitext</model>
+      <format>text/x-wiki</format>
+      <text bytes="{size}" xml:space="preserve">{text}</text>
+      <sha1>abc</sha1>
+    </revision>
+'''
+
+# (title, namespace, id, [(revid, user, text)])
+PAGES = [
+    (u'Zebra', 0, 1, [(1, 'Alice', u'Stripes')]),
+    (u'Apple & "pie"', 0, 2, [(2, 'Alice', u'Crust &amp; filling')]),
+    (u'Template:Infobox', 10, 3, [(3, 'Bob', u'{{{1}}}')]),
+    (u'Ærø', 0, 4, [(4, 'Bob', u'Island'), (5, 'Carol', u'Danish island'),
+                    (6, 'Bob', u'A Danish island')]),
+    (u'Apricot', 0, 5, [(7, 'Alice', u'#REDIRECT [[Apple]]')]),
+]
+
+
+def page_xml(title, ns, pageid, revisions):
+    parts = [u'  <page>\n', u'    <title>%s</title>\n' % title.replace(
+        u'&', u'&amp;').replace(u'"', u'&quot;'),
+        u'    <ns>%d</ns>\n' % ns, u'    <id>%d</id>\n' % pageid]
+    if revisions[-1][2].startswith(u'#REDIRECT'):
+        parts.append(u'    <redirect title="Apple" />\n')
+    parentid = 0
+    for revid, user, text in revisions:
+        parts.append(REVISION.format(revid=revid, parentid=parentid,
+                                     user=user, size=len(text), text=text))
+        parentid = revid
+    parts.append(u'  </page>\n')
+    return u''.join(parts).encode('utf-8')
+
+
+class TestDumpSite(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_dump(self, kind, per_stream=2):
+        pages = [page_xml(*page) for page in PAGES]
+        footer = b'</mediawiki>\n'
+        if kind == 'xml':
+            path = os.path.join(self.directory, 'testwiki.xml')
+            with open(path, 'wb') as fd:
+                fd.write(HEADER.encode('utf-8') + b''.join(pages) + footer)
+            return path
+
+        path = os.path.join(self.directory,
+                            'testwiki-pages-articles-multistream.xml.bz2')
+        if kind == 'single':
+            with open(path, 'wb') as fd:
+                fd.write(bz2.compress(HEADER.encode('utf-8')
+                                      + b''.join(pages) + footer))
+            return path
+
+        lines = []
+        with open(path, 'wb') as fd:
+            fd.write(bz2.compress(HEADER.encode('utf-8')))
+            for i in range(0, len(pages), per_stream):
+                offset = fd.tell()
+                for title, _, pageid, _ in PAGES[i:i + per_stream]:
+                    lines.append(u'%d:%d:%s\n' % (offset, pageid, title))
+                fd.write(bz2.compress(b''.join(pages[i:i + per_stream])))
+            fd.write(bz2.compress(footer))
+        if kind == 'companion':
+            companion = path[:-len('.xml.bz2')] + '-index.txt.bz2'
+            with open(companion, 'wb') as fd:
+                fd.write(bz2.compress(u''.join(lines).encode('utf-8')))
+        return path
+
+    def check_site(self, site):
+        assert site.version[:2] == (1, 34)
+        assert site.namespaces[10] == u'Template'
+        assert len(site.index) == len(PAGES)
+
+        page = site.pages['zebra']
+        assert page.exists
+        assert page.name == u'Zebra'
+        assert page.pageid == 1
+        assert page.revision == 1
+        assert page.text() == u'Stripes'
+        assert page.last_rev_time == time.strptime('2019-05-01T10:00:00Z',
+                                                   '%Y-%m-%dT%H:%M:%SZ')
+
+        assert site.pages[u'Apple & "pie"'].text() == u'Crust & filling'
+        assert site.pages['template:Infobox'].namespace == 10
+        assert site.pages['Template:Infobox'].text() == u'{{{1}}}'
+        assert site.pages['Apricot'].redirect
+        assert not site.pages['Missing'].exists
+        assert site.pages['Missing'].text() == u''
+
+        assert list(site.allpages(generator=False)) == [
+            u'Apple & "pie"', u'Apricot', u'Zebra', u'Ærø']
+        assert list(site.allpages(prefix='Ap', generator=False)) == [
+            u'Apple & "pie"', u'Apricot']
+        assert list(site.allpages(start='B', end='Zebra',
+                                  generator=False)) == [u'Zebra']
+        assert [page.name for page in site.allpages(namespace=10)] == [
+            u'Template:Infobox']
+
+    def test_plain(self):
+        path = self.write_dump('xml')
+        self.check_site(DumpSite(path))
+
+    def test_multistream(self):
+        path = self.write_dump('multistream')
+        site = DumpSite(path)
+        self.check_site(site)
+        site.close()
+
+        # The index is only built once
+        mtime = os.stat(path + '.mwkidx').st_mtime
+        site = DumpSite(path)
+        assert os.stat(path + '.mwkidx').st_mtime == mtime
+        self.check_site(site)
+
+    def test_companion_index(self):
+        path = self.write_dump('companion')
+        site = DumpSite(path)
+        self.check_site(site)
+        index = DumpIndex(path + '.mwkidx')
+        offsets = [index.entry(i)[2] for i in range(len(index))]
+        assert len(set(offsets)) == 3
+
+    def test_single_stream(self):
+        path = self.write_dump('single')
+        site = DumpSite(path)
+        assert not site.multistream
+        self.check_site(site)
+
+        # The pages are read one by one from the decompressed data
+        index = DumpIndex(path + '.mwkidx')
+        offsets = [index.entry(i)[2] for i in range(len(index))]
+        assert len(set(offsets)) == len(PAGES)
+        assert list(site._read_block(index.find(0, u'Zebra'))) == [u'Zebra']
+        assert DumpSite(self.write_dump('multistream')).multistream
+
+    def test_revisions(self):
+        site = DumpSite(self.write_dump('multistream'))
+        page = site.pages[u'Ærø']
+        assert page.text() == u'A Danish island'
+
+        revisions = list(page.revisions())
+        assert [rev['revid'] for rev in revisions] == [6, 5, 4]
+        assert revisions[1] == {
+            'revid': 5, 'parentid': 4, 'user': u'Carol', 'userid': 7,
+            'comment': u'Edit 5', 'timestamp': time.strptime(
+                '2019-05-05T10:00:00Z', '%Y-%m-%dT%H:%M:%SZ')}
+
+        revisions = page.revisions(direc='newer', startid=5, prop='content')
+        assert [rev['*'] for rev in revisions] == [u'Danish island',
+                                                   u'A Danish island']
+        revisions = page.revisions(user='Bob', prop='ids')
+        assert [rev['revid'] for rev in revisions] == [6, 4]
+        revisions = page.revisions(end='2019-05-05T00:00:00Z', prop='ids')
+        assert [rev['revid'] for rev in revisions] == [6, 5]
+
+        with self.assertRaises(NotImplementedError):
+            page.text(section=1)
+        with self.assertRaises(NotImplementedError):
+            site.get('query', list='allpages')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,14 +2,18 @@
 """ This module contains tests for mwklient.listing.
 The class TestList defines unit test cases.
 """
+import gc
 import logging
+import time
+import weakref
 import unittest
 import pytest
 import requests
 import responses
 import mock
 import mwklient
-from mwklient.listing import List, GeneratorList
+from mwklient.listing import List, GeneratorList, PageList
+from mwklient.listing import RevisionsIterator
 
 try:
     import json
@@ -94,6 +98,23 @@ class TestList(unittest.TestCase):
         self.assertEqual(len(vals), 3)
         self.assertTrue(isinstance(vals[0], tuple))
 
+    @mock.patch('mwklient.client.Site')
+    def test_list_shared_response(self, mock_site):
+        # Test that parsing the timestamps leaves the response, which may be
+        # shared by coalesced calls, untouched
+
+        response = {'query': {'recentchanges': [
+            {'title': 'Foo', 'timestamp': '2019-01-02T03:04:05Z'}]}}
+        mock_site.get.return_value = response
+        lst = List(mock_site, 'recentchanges', 'rc')
+        vals = [x for x in lst]
+
+        self.assertEqual(vals[0]['timestamp'],
+                         time.strptime('2019-01-02T03:04:05Z',
+                                       '%Y-%m-%dT%H:%M:%SZ'))
+        self.assertEqual(response['query']['recentchanges'][0]['timestamp'],
+                         '2019-01-02T03:04:05Z')
+
     @mock.patch('mwklient.client.Site')
     def test_generator_list(self, mock_site):
         # Test that the GeneratorList yields Page objects
@@ -107,6 +128,217 @@ class TestList(unittest.TestCase):
         self.assertTrue(isinstance(vals[1], mwklient.image.Image))
         self.assertTrue(isinstance(vals[2], mwklient.listing.Category))
 
+    @mock.patch('mwklient.client.Site')
+    def test_list_prefetch(self, mock_site):
+        # Test that the next chunk is loaded while the current one is
+        # consumed, without loading further ahead than asked to
+
+        responses = [
+            {'continue': {'apcontinue': str(i), 'continue': '-||'},
+             'query': {'allpages': [{'title': str(i)}]}}
+            for i in range(3)
+        ]
+        responses.append({'query': {'allpages': [{'title': '3'}]}})
+        mock_site.get.side_effect = responses
+
+        lst = List(mock_site, 'allpages', 'ap', return_values='title',
+                   prefetch=1)
+        self.assertEqual(next(lst), '0')
+        for _ in range(100):
+            if mock_site.get.call_count == 2:
+                break
+            time.sleep(0.01)
+        time.sleep(0.05)
+        self.assertEqual(mock_site.get.call_count, 2)
+
+        self.assertEqual(list(lst), ['1', '2', '3'])
+        args, kwargs = mock_site.get.call_args
+        self.assertIn(('apcontinue', '2'), args)
+
+    @mock.patch('mwklient.client.Site')
+    def test_list_prefetch_stop(self, mock_site):
+        # The worker stops when the iteration is over or abandoned, and does
+        # not keep the list alive
+        def get(action, *args):
+            i = int(dict(args).get('apcontinue', 0))
+            return {'continue': {'apcontinue': str(i + 1), 'continue': '-||'},
+                    'query': {'allpages': [{'title': str(i)}]}}
+        mock_site.get.side_effect = get
+
+        lst = List(mock_site, 'allpages', 'ap', return_values='title',
+                   max_items=2, prefetch=1)
+        self.assertEqual(list(lst), ['0', '1'])
+        self.assertTrue(lst._stopped.is_set())
+
+        lst = List(mock_site, 'allpages', 'ap', return_values='title',
+                   prefetch=2)
+        for title in lst:
+            break
+        stopped = lst._stopped
+        ref = weakref.ref(lst)
+        del lst
+        gc.collect()
+        self.assertIsNone(ref())
+        self.assertTrue(stopped.is_set())
+        time.sleep(0.2)
+        calls = mock_site.get.call_count
+        time.sleep(0.2)
+        self.assertEqual(mock_site.get.call_count, calls)
+
+    @mock.patch('mwklient.client.Site')
+    def test_list_prefetch_error(self, mock_site):
+        # Errors of the worker thread are raised by the consumer
+        mock_site.get.side_effect = mwklient.errors.APIError('code', 'info',
+                                                             {})
+        lst = List(mock_site, 'allpages', 'ap', prefetch=2)
+        with pytest.raises(mwklient.errors.APIError):
+            next(lst)
+
+    @mock.patch('mwklient.client.Site')
+    def test_revisions_prefetch(self, mock_site):
+        # Test that the subclasses preparing their arguments work in
+        # prefetch mode too
+        page = mock.Mock(site=mock_site)
+        page.name = 'Foo'
+        mock_site.get.side_effect = [
+            {'continue': {'rvcontinue': '2', 'continue': '||'},
+             'query': {'pages': {'1': {'title': 'Foo',
+                                       'revisions': [{'revid': 1}]}}}},
+            {'query': {'pages': {'1': {'title': 'Foo',
+                                       'revisions': [{'revid': 2}]}}}},
+        ]
+        lst = RevisionsIterator(page, 'revisions', 'rv', rvstart='2019',
+                                rvstartid=1, prefetch=1)
+        self.assertEqual([rev['revid'] for rev in lst], [1, 2])
+        args, kwargs = mock_site.get.call_args
+        self.assertNotIn('rvstart', dict(args[1:]))
+
+    def setup_site_for_fetch(self, mock_site):
+        mock_site.titles_limit = 2
+        mock_site.namespaces = {0: '', 6: 'File', 14: 'Category'}
+        mock_site.default_namespaces = mock_site.namespaces
+        mock_site.get.side_effect = [
+            {'query': {
+                'normalized': [{'from': 'foo', 'to': 'Foo'}],
+                'redirects': [{'from': 'Foo', 'to': 'Bar'}],
+                'pages': {
+                    '2': {'pageid': 2, 'ns': 0, 'title': 'Bar'},
+                    '3': {'pageid': 3, 'ns': 6, 'title': 'File:Baz.jpg'},
+                }}},
+            {'query': {
+                'pages': {
+                    '-1': {'ns': 14, 'title': 'Category:Qux', 'missing': ''},
+                }}},
+        ]
+
+    @mock.patch('mwklient.client.Site')
+    def test_resume(self, mock_site):
+        # Test that a list resumes from a saved state, loading the current
+        # chunk again and skipping its consumed items
+        lst = List(mock_site, 'allpages', 'ap', limit=2,
+                   return_values='title')
+        self.setup_dummy_responses(mock_site, 'allpages')
+        assert next(lst) == "Kre'fey"
+        state = json.loads(json.dumps(lst.state()))
+        assert state['consumed'] == 1
+        assert state['count'] == 1
+
+        states = []
+        lst = List(mock_site, 'allpages', 'ap', limit=2,
+                   return_values='title',
+                   checkpoint=lambda state: states.append(json.dumps(state)))
+        lst.resume(state)
+        self.setup_dummy_responses(mock_site, 'allpages')
+        assert list(lst) == ['Kre-O', 'Kre-O Transformers']
+        args = dict(mock_site.get.call_args_list[0][0][1:])
+        assert 'apcontinue' not in args
+        assert lst.count == 3
+        assert lst.state()['done']
+
+        # The checkpoints are taken after each chunk
+        assert len(states) == 2
+        assert json.loads(states[0])['consumed'] == 1
+        state = json.loads(states[1])
+        assert state['args']['apcontinue'] == 'Kre_Mbaye'
+        assert state['consumed'] == 0
+        self.setup_dummy_responses(mock_site, 'allpages')
+        mock_site.get.side_effect = list(mock_site.get.side_effect)[1:]
+        lst = List(mock_site, 'allpages', 'ap', limit=2,
+                   return_values='title').resume(state)
+        assert list(lst) == ['Kre-O Transformers']
+        args = dict(mock_site.get.call_args[0][1:])
+        assert args['apcontinue'] == 'Kre_Mbaye'
+
+        with pytest.raises(RuntimeError):
+            List(mock_site, 'logevents', 'le').resume(state)
+
+    @mock.patch('mwklient.client.Site')
+    def test_max_limit(self, mock_site):
+        # The API picks the limit of the module for the current user, even
+        # for a site initialized from a snapshot or for the image metadata
+        # requested by generator lists
+        lst = List(mock_site, 'allpages', 'ap')
+        assert lst.args['aplimit'] == 'max'
+        lst = List(mock_site, 'allpages', 'ap', limit='max')
+        assert lst.args['aplimit'] == 'max'
+        lst = List(mock_site, 'allpages', 'ap', limit=10)
+        assert lst.args['aplimit'] == '10'
+
+        page = mock.Mock()
+        page.site = mock_site
+        revisions = RevisionsIterator(page, 'revisions', 'rv', limit='max',
+                                      rvprop='ids|content')
+        assert revisions.args['rvlimit'] == 'max'
+        lst = GeneratorList(mock_site, 'allimages', 'ai')
+        assert dict(lst.chunk_args())['gailimit'] == 'max'
+
+    @mock.patch('mwklient.client.Site')
+    def test_fetch_many(self, mock_site):
+        # Test that titles are packed into batches and mapped to their pages
+        self.setup_site_for_fetch(mock_site)
+        pages = PageList(mock_site).fetch_many(
+            ['foo', 'File:Baz.jpg', 'Category:Qux'], redirects=True)
+
+        first = next(pages)
+        self.assertEqual(mock_site.get.call_count, 1)
+        args, kwargs = mock_site.get.call_args
+        self.assertEqual(kwargs['titles'], 'foo|File:Baz.jpg')
+        self.assertEqual(kwargs['redirects'], '')
+
+        vals = [first] + list(pages)
+        self.assertEqual(mock_site.get.call_count, 2)
+        self.assertEqual([p.name for p in vals],
+                         ['Bar', 'File:Baz.jpg', 'Category:Qux'])
+        self.assertTrue(isinstance(vals[1], mwklient.image.Image))
+        self.assertTrue(isinstance(vals[2], mwklient.listing.Category))
+        self.assertFalse(vals[2].exists)
+
+    @mock.patch('mwklient.client.Site')
+    def test_fetch_many_long(self, mock_site):
+        # Test that long batches are sent by POST, and that redirect loops
+        # are not followed forever
+        mock_site.titles_limit = 500
+        mock_site.namespaces = {0: ''}
+        mock_site.default_namespaces = mock_site.namespaces
+        mock_site.post.return_value = {'query': {
+            'redirects': [{'from': 'A', 'to': 'B'}, {'from': 'B', 'to': 'A'}],
+            'pages': {'-1': {'ns': 0, 'title': 'T0', 'missing': ''}}}}
+        titles = ['A'] + ['T{}'.format(i) for i in range(400)]
+        vals = list(PageList(mock_site).fetch_many(titles, redirects=True))
+
+        self.assertEqual(mock_site.get.call_count, 0)
+        self.assertEqual(mock_site.post.call_count, 1)
+        self.assertEqual([p.name for p in vals], ['T0'])
+
+    @mock.patch('mwklient.client.Site')
+    def test_fetch_many_ids(self, mock_site):
+        self.setup_site_for_fetch(mock_site)
+        vals = list(PageList(mock_site).fetch_many_ids([2, 3, 4]))
+
+        args, kwargs = mock_site.get.call_args_list[0]
+        self.assertEqual(kwargs['pageids'], '2|3')
+        self.assertEqual([p.pageid for p in vals], [2, 3])
+
     def test_cheat_pylint(self):
         """ Dumb test that avoids unused import warning for time package.
         """
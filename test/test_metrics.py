@@ -0,0 +1,100 @@
+# encoding=utf-8
+""" This module contains tests for mwklient.metrics.
+The class TestMetrics records counters and spans, with hooks and a fake
+tracer.
+"""
+import contextlib
+import unittest
+from pytest import raises
+from mwklient.metrics import Metrics, module_name
+
+
+class FakeSpan():
+
+    def __init__(self):
+        self.attributes = {}
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+
+class FakeTracer():
+
+    def __init__(self):
+        self.spans = []
+
+    @contextlib.contextmanager
+    def start_as_current_span(self, name, attributes=None):
+        span = FakeSpan()
+        span.attributes.update(attributes or {})
+        self.spans.append((name, span))
+        yield span
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_module_name(self):
+        assert module_name({'action': 'edit', 'title': 'A'}) == 'edit'
+        assert module_name({'action': 'query', 'list': 'allpages',
+                            'meta': 'userinfo'}) == 'query+allpages+userinfo'
+        assert module_name({'action': 'query', 'generator': 'allpages',
+                            'prop': 'info|revisions'}) == (
+                                'query+allpages+info|revisions')
+        assert module_name({}) == ''
+
+    def test_record(self):
+        metrics = Metrics()
+        metrics.record('query+allpages', requests=1, bytes_in=100)
+        metrics.record('query+allpages', requests=1, http_time=0.5)
+        metrics.record('edit', requests=1, retries=1, sleep_time=5)
+
+        snapshot = metrics.snapshot()
+        assert snapshot['query+allpages']['requests'] == 2
+        assert snapshot['query+allpages']['bytes_in'] == 100
+        assert snapshot['query+allpages']['chunks'] == 0
+        assert metrics.total()['requests'] == 3
+        assert metrics.total()['sleep_time'] == 5
+
+        # Snapshots are copies
+        snapshot['edit']['requests'] = 10
+        assert metrics.snapshot()['edit']['requests'] == 1
+        metrics.reset()
+        assert metrics.snapshot() == {}
+
+    def test_hooks(self):
+        metrics = Metrics()
+        calls = []
+
+        def hook(name, attributes, duration, error):
+            calls.append((name, dict(attributes), error))
+
+        metrics.add_hook(hook)
+        metrics.add_hook(lambda *args: 1 / 0)  # Failing hooks are ignored
+        with metrics.span('raw_api', module='parse') as attributes:
+            attributes['status'] = 200
+        with raises(KeyError):
+            with metrics.span('raw_call', module='edit'):
+                raise KeyError('failed')
+
+        assert calls[0] == ('raw_api', {'module': 'parse', 'status': 200},
+                            None)
+        assert calls[1][0] == 'raw_call'
+        assert isinstance(calls[1][2], KeyError)
+
+        metrics.remove_hook(hook)
+        with metrics.span('raw_api', module='parse'):
+            pass
+        assert len(calls) == 2
+
+    def test_tracer(self):
+        tracer = FakeTracer()
+        metrics = Metrics(tracer=tracer)
+        with metrics.span('load_chunk', module='query+allpages') as attrs:
+            attrs['items'] = 10
+        name, span = tracer.spans[0]
+        assert name == 'mwklient.load_chunk'
+        assert span.attributes == {'module': 'query+allpages', 'items': 10}
+
+
+if __name__ == '__main__':
+    unittest.main()
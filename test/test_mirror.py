@@ -0,0 +1,133 @@
+# encoding=utf-8
+""" This module contains tests for mwklient.mirror.
+The class TestMirror seeds and updates a mirror of a fake site.
+"""
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import mock
+from mwklient.mirror import Mirror
+
+
+class FakeSite():
+    """The pages of a site, and its recent changes."""
+
+    titles_limit = 2
+
+    def __init__(self):
+        self.pages = {}
+        self.changes = []
+        self.fetched = []
+
+    def edit(self, title, text, namespace=0, log=None):
+        revid = 100 + len(self.changes)
+        timestamp = '2019-05-01T10:00:%02dZ' % len(self.changes)
+        if text is None:
+            self.pages.pop(title, None)
+        else:
+            self.pages[title] = (text, revid, namespace, timestamp)
+        change = {'title': title, 'rcid': revid, 'timestamp': timestamp,
+                  'ns': namespace}
+        if log:
+            change['logparams'] = log
+        self.changes.append(change)
+
+    def get(self, action, **kwargs):
+        return {'query': {'recentchanges': self.changes[-1:]}}
+
+    def allpages(self, namespace='0', generator=True):
+        return iter(sorted(title for title, page in self.pages.items()
+                           if page[2] == int(namespace)))
+
+    def recentchanges(self, start, direc, namespace, **kwargs):
+        assert direc == 'newer'
+        namespaces = [int(ns) for ns in namespace.split('|')]
+        return iter([dict(change, timestamp=time.strptime(
+            change['timestamp'], '%Y-%m-%dT%H:%M:%SZ'))
+            for change in self.changes
+            if change['timestamp'] >= start and change['ns'] in namespaces])
+
+    def texts(self, titles, slot='main'):
+        assert len(titles) <= self.titles_limit
+        self.fetched.extend(titles)
+        for title in titles:
+            page = mock.Mock(redirect=False, pageid=1, last_rev_time=None)
+            page.name = title
+            if title in self.pages:
+                text, page.revision, page.namespace, timestamp = (
+                    self.pages[title])
+                page.last_rev_time = time.strptime(timestamp,
+                                                   '%Y-%m-%dT%H:%M:%SZ')
+                page.exists = True
+            else:
+                text = u''
+                page.exists = False
+            yield page, text
+
+
+class TestMirror(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'mirror.sqlite')
+        self.site = FakeSite()
+        self.site.edit('A', 'Text of A')
+        self.site.edit('B', 'Text of B')
+        self.site.edit('C', 'Text of C')
+        self.site.edit('Template:T', 'Template', namespace=10)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_seed(self):
+        mirror = Mirror(self.site, self.path)
+        assert mirror.seed() == 3
+        assert len(mirror) == 3
+        assert list(mirror.titles()) == ['A', 'B', 'C']
+        assert mirror.text('B') == 'Text of B'
+        assert mirror.text('Template:T') is None
+        assert 'A' in mirror
+        assert mirror.page('C') == {
+            'title': 'C', 'pageid': 1, 'namespace': 0, 'revid': 102,
+            'timestamp': '2019-05-01T10:00:02Z', 'redirect': 0,
+            'text': 'Text of C'}
+        assert mirror.watermark == ('2019-05-01T10:00:03Z', 103)
+
+    def test_update(self):
+        mirror = Mirror(self.site, self.path, namespaces=(0, 10))
+        mirror.seed()
+        self.site.fetched = []
+
+        self.site.edit('A', 'New text of A')
+        self.site.edit('B', None)
+        self.site.edit('A', 'Newer text of A')
+        self.site.edit('C', None, log={'target_title': 'D'})
+        self.site.pages['D'] = ('Text of C', 106, 0, '2019-05-01T10:00:07Z')
+        # In batches of two changes: A and B, A and C, then D
+        assert mirror.update() == 5
+
+        assert sorted(self.site.fetched) == ['A', 'A', 'B', 'C', 'D']
+        assert list(mirror.titles()) == ['A', 'D', 'Template:T']
+        assert mirror.text('A') == 'Newer text of A'
+        assert mirror.text('D') == 'Text of C'
+        assert mirror.watermark == ('2019-05-01T10:00:07Z', 107)
+
+        # Nothing changed since
+        self.site.fetched = []
+        assert mirror.update() == 0
+        assert self.site.fetched == []
+
+        # The namespaces are kept with the mirror
+        mirror.close()
+        assert Mirror(self.site, self.path).namespaces == [0, 10]
+
+    def test_not_seeded(self):
+        mirror = Mirror(self.site, self.path)
+        with self.assertRaises(RuntimeError):
+            mirror.update()
+
+
+if __name__ == '__main__':
+    unittest.main()
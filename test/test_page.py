@@ -381,7 +381,7 @@ class TestPageApiArgs(unittest.TestCase):
             'iiprop': iiprop,
             'inprop': 'protection',
             'prop': 'info|imageinfo',
-            'gcllimit': repr(self.page.site.api_limit),
+            'gcllimit': 'max',
         }
         self.assertEqual(dic, args)
 
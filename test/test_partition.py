@@ -0,0 +1,108 @@
+# encoding=utf-8
+""" This module contains tests for mwklient.partition.
+The class TestPartitionedList lists the titles of a fake site in ranges.
+"""
+import threading
+import time
+import unittest
+import mwklient
+from mwklient.partition import PartitionedList, prefix_boundaries, quantiles
+
+TITLES = sorted([u'Apple', u'Apricot', u'Banana', u'Blue cheese',
+                 u'Blue_berry', u'Cherry', u'Date', u'Elderberry', u'Fig',
+                 u'Grape', u'Kiwi', u'Lemon', u'Mango', u'Nectarine',
+                 u'Orange', u'Peach', u'Pear', u'Quince', u'Raspberry',
+                 u'Strawberry', u'Tangerine', u'Ugli fruit', u'Zucchini',
+                 u'Ærø'], key=lambda title: title.replace(u' ', u'_'))
+TITLES = [title.replace(u'_', u' ') for title in TITLES]
+
+
+class FakeSite():
+
+    def __init__(self, delay=0.0, fail_at=None):
+        self.delay = delay
+        self.fail_at = fail_at
+        self.lock = threading.Lock()
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def get(self, action, list, rnnamespace, rnlimit):
+        assert list == 'random'
+        return {'query': {'random': [
+            {'ns': rnnamespace, 'title': title} for title in TITLES[::-1]]}}
+
+    def allpages(self, start=None, end=None, namespace='0', generator=True):
+        with self.lock:
+            self.calls.append((start, end))
+        key = (lambda title: title.replace(u' ', u'_'))
+        for title in TITLES:
+            if start is not None and key(title) < key(start):
+                continue
+            if end is not None and key(title) > key(end):
+                return
+            if title == self.fail_at:
+                raise mwklient.errors.APIError('failed', 'Failed', {})
+            with self.lock:
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            time.sleep(self.delay)
+            with self.lock:
+                self.in_flight -= 1
+            yield title
+
+
+class TestPartitionedList(unittest.TestCase):
+
+    def test_boundaries(self):
+        assert prefix_boundaries(4) == [u'G', u'N', u'U']
+        assert quantiles([u'D', u'A', u'C', u'B'], 2) == [u'C']
+        assert quantiles([u'A'], 8) == [u'A']
+        assert quantiles([], 8) == []
+
+    def test_ordered(self):
+        site = FakeSite(delay=0.01)
+        titles = list(PartitionedList(site, 'allpages', partitions=4))
+
+        assert titles == TITLES
+        assert len(site.calls) == 4
+        assert site.calls[0][0] is None and site.calls[-1][1] is None
+        assert site.max_in_flight > 1
+
+    def test_unordered(self):
+        site = FakeSite()
+        lst = PartitionedList(site, 'allpages', partitions=3, workers=2,
+                              split='prefix', ordered=False)
+        titles = list(lst)
+
+        assert sorted(titles) == sorted(TITLES)
+        assert len(titles) == len(TITLES)
+        assert set(site.calls) == {(None, u'J'), (u'J', u'R'), (u'R', None)}
+
+    def test_bounds(self):
+        site = FakeSite()
+        lst = PartitionedList(site, 'allpages', boundaries=['Blue_cheese',
+                                                            'Fig', 'Mango'],
+                              start='Banana', end='Lemon')
+        assert list(lst) == TITLES[TITLES.index(u'Banana'):
+                                   TITLES.index(u'Lemon') + 1]
+        assert site.calls[0] == (u'Banana', u'Blue cheese')
+        assert site.calls[-1] == (u'Fig', u'Lemon')
+
+    def test_error(self):
+        site = FakeSite(fail_at=u'Peach')
+        with self.assertRaises(mwklient.errors.APIError):
+            list(PartitionedList(site, 'allpages', partitions=4))
+
+    def test_stop_early(self):
+        site = FakeSite(delay=0.01)
+        titles = PartitionedList(site, 'allpages', partitions=4)
+        assert next(iter(titles)) == TITLES[0]
+
+    def test_unsupported(self):
+        with self.assertRaises(RuntimeError):
+            PartitionedList(FakeSite(), 'recentchanges')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,9 +5,10 @@ The class TestSleep defines unit test cases.
 import unittest
 import time
 from mock import call, patch
-from pytest import raises
-from mwklient.sleep import Sleeper, Sleepers
-from mwklient.errors import MaximumRetriesExceeded
+from pytest import raises, warns
+from mwklient.sleep import (Sleeper, Sleepers, BackoffGate,
+                            DecorrelatedJitter, ExponentialBackoff)
+from mwklient.errors import DeadlineExceeded, MaximumRetriesExceeded
 
 
 class TestSleepers(unittest.TestCase):
@@ -49,6 +50,69 @@ class TestSleepers(unittest.TestCase):
         with raises(MaximumRetriesExceeded):
             sleeper.sleep()
 
+    def test_exponential(self):
+        sleepers = Sleepers(10, 30, backoff=ExponentialBackoff(
+            base=2, cap=10, jitter=False))
+        sleeper = sleepers.make()
+        for _ in range(5):
+            sleeper.sleep()
+        self.sleep.assert_has_calls([call(2), call(4), call(8), call(10),
+                                     call(10)])
+
+    def test_jitter(self):
+        sleeper = Sleepers(10, 30, backoff=ExponentialBackoff(
+            base=2, cap=10)).make()
+        timeouts = [sleeper.next_timeout() for _ in range(5)]
+        assert all(0 <= timeout <= 10 for timeout in timeouts)
+
+        sleeper = Sleepers(10, 30, backoff=DecorrelatedJitter(
+            base=1, cap=20)).make()
+        for _ in range(8):
+            previous = sleeper.previous
+            timeout = sleeper.next_timeout()
+            assert 1 <= timeout <= min(20, max(1, previous * 3))
+
+    @patch('time.monotonic')
+    def test_deadline(self, monotonic):
+        monotonic.return_value = 100
+        sleeper = Sleepers(None, 30, deadline=60).make()
+        sleeper.sleep()
+        sleeper.sleep()
+        monotonic.return_value = 140
+        with raises(DeadlineExceeded):
+            # 30 more seconds would end after the deadline
+            sleeper.sleep()
+        with raises(MaximumRetriesExceeded):
+            sleeper.sleep()
+
+    def test_unlimited_retries(self):
+        with raises(RuntimeError):
+            Sleepers(None, 30)
+
+    def test_negative_max_retries(self):
+        # Deprecated, and as before, no retry at all
+        with warns(DeprecationWarning):
+            sleepers = Sleepers(-1, 30)
+        with raises(MaximumRetriesExceeded):
+            sleepers.make().sleep()
+
+    @patch('time.monotonic')
+    def test_gate(self, monotonic):
+        monotonic.return_value = 100
+        gate = BackoffGate()
+        sleepers = Sleepers(10, 30, gate=gate)
+        gate.close(20)
+        gate.close(5)
+        assert gate.remaining() == 20
+
+        # The retries wait for the gate as well
+        sleepers.make().sleep()
+        gate.wait()
+        self.sleep.assert_has_calls([call(20), call(20)])
+        monotonic.return_value = 130
+        gate.wait()
+        assert self.sleep.call_count == 2
+
     def test_cheat_pylint(self):
         """ Dumb test that avoids unused import warning for time package.
         """
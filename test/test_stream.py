@@ -0,0 +1,126 @@
+# encoding=utf-8
+""" This module contains tests for mwklient.stream.
+The class TestStream checks the incremental parsing of API responses, and
+the streaming mode of Site.stream_api() and lists.
+"""
+import io
+import unittest
+import pytest
+import responses
+import mwklient
+from mwklient.listing import List
+
+ijson = pytest.importorskip('ijson')
+from mwklient.stream import iter_member  # noqa: E402
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+API_URL = 'https://test.wikipedia.org/w/api.php'
+
+
+class TestStream(unittest.TestCase):
+
+    def parse(self, document, member):
+        rest = ijson.ObjectBuilder()
+        fileobj = io.BytesIO(json.dumps(document).encode('utf-8'))
+        return list(iter_member(fileobj, member, rest)), rest.value
+
+    def test_array_member(self):
+        items, rest = self.parse({
+            'continue': {'apcontinue': 'C', 'continue': '-||'},
+            'query': {'allpages': [{'title': 'A'}, {'title': 'B'}, 3],
+                      'userinfo': {'id': 0}},
+        }, 'query.allpages')
+
+        assert items == [{'title': 'A'}, {'title': 'B'}, 3]
+        assert rest == {'continue': {'apcontinue': 'C', 'continue': '-||'},
+                        'query': {'allpages': [], 'userinfo': {'id': 0}}}
+
+    def test_object_member(self):
+        items, rest = self.parse({
+            'query': {'pages': {'1': {'title': 'A', 'length': 1.5},
+                                '2': {'title': 'B', 'links': [{}, []]}}},
+        }, 'query.pages')
+
+        assert items == [{'title': 'A', 'length': 1.5},
+                         {'title': 'B', 'links': [{}, []]}]
+        assert rest == {'query': {'pages': {}}}
+
+    def test_wildcard_member(self):
+        items, rest = self.parse({
+            'query': {'pages': {
+                '1': {'title': 'A', 'revisions': [{'revid': 1}]},
+                '2': {'title': 'B', 'revisions': [{'revid': 2}]}}},
+        }, 'query.pages.*.revisions')
+
+        assert items == [{'revid': 1}, {'revid': 2}]
+        assert rest['query']['pages']['2'] == {'title': 'B', 'revisions': []}
+
+    def test_missing_member(self):
+        items, rest = self.parse({'batchcomplete': ''}, 'query.pages')
+
+        assert items == []
+        assert rest == {'batchcomplete': ''}
+
+    @responses.activate
+    def test_stream_api(self):
+        body = json.dumps({
+            'warnings': {'main': {'*': 'Some warning'}},
+            'query': {'allpages': [{'title': 'A'}, {'title': 'B'}],
+                      'userinfo': {'id': 1, 'name': 'Tester'}},
+        })
+        responses.add(responses.GET, API_URL, body=body)
+        site = mwklient.Site('test.wikipedia.org', do_init=False)
+
+        stream = site.stream_api('query', 'query.allpages', list='allpages')
+
+        assert [page['title'] for page in stream] == ['A', 'B']
+        assert stream.result['query'] == {'allpages': [],
+                                          'userinfo': {'id': 1,
+                                                       'name': 'Tester'}}
+        assert site.logged_in
+        assert 'list=allpages' in responses.calls[0].request.url
+        # The body is counted as it is read
+        metrics = site.metrics.snapshot()['query+allpages+userinfo']
+        assert metrics['requests'] == 1
+        assert metrics['bytes_in'] == len(body)
+
+    @responses.activate
+    def test_stream_api_error(self):
+        responses.add(responses.GET, API_URL, json={
+            'error': {'code': 'badvalue', 'info': 'Bad value'}})
+        site = mwklient.Site('test.wikipedia.org', do_init=False)
+
+        with pytest.raises(mwklient.errors.APIError):
+            list(site.stream_api('query', 'query.allpages', list='allpages'))
+
+    @responses.activate
+    def test_stream_api_invalid_response(self):
+        responses.add(responses.GET, API_URL, body='<html>Oops</html>')
+        site = mwklient.Site('test.wikipedia.org', do_init=False)
+
+        with pytest.raises(mwklient.errors.InvalidResponse):
+            list(site.stream_api('query', 'query.allpages', list='allpages'))
+
+    @responses.activate
+    def test_list_stream(self):
+        # The continuation is read once each chunk has been streamed
+        responses.add(responses.GET, API_URL, json={
+            'continue': {'apcontinue': 'B', 'continue': '-||'},
+            'query': {'allpages': [{'title': 'A'}]}})
+        responses.add(responses.GET, API_URL, json={
+            'query': {'allpages': [{'title': 'B'}, {'title': 'C'}]}})
+        site = mwklient.Site('test.wikipedia.org', do_init=False)
+
+        lst = List(site, 'allpages', 'ap', stream=True, return_values='title')
+
+        assert list(lst) == ['A', 'B', 'C']
+        assert len(responses.calls) == 2
+        assert 'apcontinue=B' in responses.calls[1].request.url
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+# encoding=utf-8
+""" This module contains tests for mwklient.throttle.
+The classes TestTokenBucket and TestLagController run them against a fake
+clock.
+"""
+import threading
+import unittest
+from mwklient.throttle import LagController, TokenBucket
+
+
+class FakeClock():
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def bucket(self, *args, **kwargs):
+        return TokenBucket(*args, clock=self.clock, sleep=self.clock.sleep,
+                           **kwargs)
+
+    def test_unlimited(self):
+        bucket = self.bucket()
+        assert [bucket.acquire() for _ in range(5)] == [0] * 5
+        assert self.clock.now == 100
+
+    def test_rate(self):
+        bucket = self.bucket(2, per=1)
+        waits = [bucket.acquire() for _ in range(5)]
+        assert waits == [0, 0.5, 0.5, 0.5, 0.5]
+        assert self.clock.now == 102
+
+    def test_burst(self):
+        bucket = self.bucket(1, per=1, burst=3)
+        waits = [bucket.acquire() for _ in range(5)]
+        assert waits == [0, 0, 0, 1, 1]
+
+    def test_set_rate_and_pause(self):
+        bucket = self.bucket()
+        bucket.acquire()
+        bucket.set_rate(1, per=10)
+        bucket.pause(30)
+        assert bucket.acquire() == 30
+        assert bucket.acquire() == 10
+
+
+class TestLagController(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.control = LagController(4, min_interval=1, max_interval=4,
+                                     increase_after=2, clock=self.clock,
+                                     sleep=self.clock.sleep)
+
+    def test_decrease_and_recover(self):
+        control = self.control
+        control.acquire()
+        control.acquire()
+        control.release(lag='3', retry_after='2')
+        assert (control.concurrency, control.interval) == (2, 1)
+        # Sent before the decrease, in the same lag event
+        control.release(lag='3.5')
+        assert (control.concurrency, control.interval) == (2, 1)
+        assert control.lagged == 2 and control.lag == 3.5
+
+        # The requests wait for the time asked
+        start = self.clock.now
+        control.acquire()
+        assert self.clock.now - start == 2
+        control.release(lag='4')
+        assert (control.concurrency, control.interval) == (1, 2)
+
+        # Without retry-after, they wait for the lag, then are paced
+        start = self.clock.now
+        for _ in range(2):
+            control.acquire()
+            control.release()
+        assert self.clock.now - start == 4 + 2
+        assert (control.concurrency, control.interval) == (2, 1.5)
+
+        for _ in range(4):
+            control.acquire()
+            control.release()
+        assert (control.concurrency, control.interval) == (4, 0)
+
+        # Failed requests do not count
+        control.acquire()
+        control.release(failed=True)
+        assert control.successes == 0
+
+    def test_max_interval(self):
+        control = self.control
+        for _ in range(10):
+            self.clock.now += 100
+            control.acquire()
+            control.release(lag='1', retry_after='5')
+        assert (control.concurrency, control.interval) == (1, 4)
+        assert control.lagged_until == self.clock.now + 5
+
+    def test_concurrency(self):
+        control = self.control
+        control.concurrency = 1
+        control.acquire()
+        acquired = threading.Event()
+
+        def other():
+            control.acquire()
+            acquired.set()
+
+        thread = threading.Thread(target=other)
+        thread.start()
+        assert not acquired.wait(0.05)
+        control.release()
+        assert acquired.wait(1)
+        thread.join()
+        assert control.active == 1
+
+
+if __name__ == '__main__':
+    unittest.main()
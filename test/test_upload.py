@@ -0,0 +1,355 @@
+# encoding=utf-8
+""" This module contains tests for mwklient.upload.
+The class TestUpload uploads files, from streams and from buffers, to a
+local stub of the MediaWiki API that assembles the chunks it receives, and
+resumes interrupted uploads.
+"""
+import io
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import mock
+import requests
+import mwklient
+from mwklient.upload import (MIB, ChunkReader, ChunkSizeTuner,
+                             MultipartBody, UploadState, as_buffer,
+                             read_chunks)
+from stub_server import parse_multipart, serve
+
+SITEINFO = {
+    'general': {'generator': 'MediaWiki 1.34.0', 'writeapi': ''},
+    'namespaces': {'0': {'*': '', 'id': 0}, '6': {'*': 'File', 'id': 6}},
+    'userinfo': {'id': 1, 'name': 'Tester', 'groups': ['user'],
+                 'rights': ['read', 'edit', 'writeapi', 'upload']},
+}
+
+
+class Stub():
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stash = {}
+        self.uploads = []
+        self.chunks = []
+        self.failures = 0
+        # The number of chunks received before the connection is "lost"
+        self.fail_after = None
+        # The statuses returned in turn to checkstatus, by filekey, for
+        # the uploads queued with async=1
+        self.queued = {}
+
+    def respond(self, params):
+        if params.get('action') == 'upload':
+            with self.lock:
+                if self.failures:
+                    self.failures -= 1
+                    return 503, {}
+                if 'chunk' in params.get('files', {}) and (
+                        self.fail_after is not None
+                        and len(self.chunks) >= self.fail_after):
+                    return 400, {}
+            if 'checkstatus' in params:
+                return 200, self.check_status(params)
+            return 200, {'upload': self.upload(params)}
+        query = {}
+        if 'siteinfo' in params.get('meta', ''):
+            query.update(SITEINFO)
+        if 'userinfo' in params.get('meta', ''):
+            query['userinfo'] = SITEINFO['userinfo']
+        if 'tokens' in params.get('meta', ''):
+            query['tokens'] = {'csrftoken': 'csrf+\\'}
+        if 'titles' in params:
+            query['pages'] = {'-1': {'ns': 6, 'title': params['titles'],
+                                     'missing': ''}}
+        return 200, {'query': query}
+
+    def check_status(self, params):
+        if self.queued.get(params['filekey']):
+            return {'upload': self.queued[params['filekey']].pop(0)}
+        if params['filekey'] not in self.stash:
+            return {'error': {'code': 'missingresult',
+                              'info': 'No result in status data'}}
+        offset = len(self.stash[params['filekey']])
+        return {'upload': {'result': 'Continue', 'offset': offset,
+                           'filekey': params['filekey']}}
+
+    def upload(self, params):
+        files = params.get('files', {})
+        if 'file' in files:
+            self.uploads.append((params['filename'], files['file']))
+            return {'result': 'Success', 'filename': params['filename']}
+        if 'chunk' not in files:
+            # Publishing the stashed file
+            data = self.stash.pop(params['filekey'])
+            self.uploads.append((params['filename'], bytes(data)))
+            result = {'result': 'Success', 'filename': params['filename']}
+            return self.queue(params, result, 'publish')
+
+        chunk = files['chunk']
+        self.chunks.append(len(chunk))
+        filekey = params.get('filekey', 'key%d' % len(self.stash))
+        data = self.stash.setdefault(filekey, bytearray())
+        assert int(params['offset']) == len(data)
+        data.extend(chunk)
+        if len(data) < int(params['filesize']):
+            return {'result': 'Continue', 'filekey': filekey,
+                    'offset': len(data)}
+        return self.queue(params, {'result': 'Success', 'filekey': filekey},
+                          'assembling')
+
+    def queue(self, params, result, stage):
+        """Return `result` to the polls, after a first poll in progress,
+        when asked for with async=1."""
+        if 'async' not in params:
+            return result
+        filekey = params.get('filekey', result.get('filekey'))
+        self.queued[filekey] = [{'result': 'Poll', 'stage': stage}, result]
+        return {'result': 'Poll', 'stage': 'queued', 'filekey': filekey}
+
+
+class TestBuffers(unittest.TestCase):
+
+    def test_as_buffer(self):
+        assert as_buffer(u'path/to/file') is None
+        assert as_buffer(io.BytesIO(b'data')) is None
+        assert as_buffer(b'data').nbytes == 4
+        view = as_buffer(memoryview(bytearray(8)).cast('I'))
+        assert (view.format, view.nbytes) == ('B', 8)
+
+    def test_chunks(self):
+        data = bytearray(b'0123456789')
+        reader = ChunkReader(data, offset=1)
+        chunks = []
+        for chunk in reader.chunks(lambda: 2 * len(chunks) + 2):
+            chunks.append(chunk)
+        assert [bytes(chunk) for chunk in chunks] == [b'12', b'3456',
+                                                      b'789']
+        # The chunks share the memory of the buffer
+        data[1:2] = b'X'
+        assert bytes(chunks[0]) == b'X2'
+
+        reader.sent(chunks[0])
+        assert reader.offset == 3
+        reader.close()
+
+    def test_prefetched_chunks(self):
+        stream = io.BytesIO(b'0123456789')
+        reader = ChunkReader(stream, offset=2, prefetch=True)
+        chunks = []
+        for chunk in reader.chunks(lambda: 3):
+            chunks.append(bytes(chunk))
+            reader.sent(chunk)
+        assert chunks == [b'234', b'567', b'89']
+        assert reader.offset == 10
+        # The chunks are read into two buffers in turn
+        assert [len(buffer) for buffer in reader._buffers] == [3, 3]
+        reader.close()
+        assert stream.closed
+
+    def test_tuner(self):
+        tuner = ChunkSizeTuner(initial=MIB, minimum=MIB // 4,
+                               maximum=8 * MIB, target=1.0)
+        # Twice as large at most
+        assert tuner.observe(MIB, 0.1) == 2 * MIB
+        assert tuner.observe(2 * MIB, 0.2) == 4 * MIB
+        assert tuner.observe(4 * MIB, 0.1) == 8 * MIB
+        assert tuner.observe(8 * MIB, 0.1) == 8 * MIB
+
+        # Half as large at most, down to the minimum
+        tuner = ChunkSizeTuner(initial=MIB, minimum=MIB // 4, target=1.0)
+        assert tuner.observe(MIB, 8.0) == MIB // 2
+        assert tuner.observe(MIB // 2, 4.0) == MIB // 4
+        assert tuner.observe(MIB // 4, 2.0) == MIB // 4
+        # The average throughput goes up to 857.6 KiB/s
+        assert tuner.observe(MIB // 4, 0.1) == MIB // 2
+        # 907.52 KiB, aligned on 64 KiB
+        assert tuner.observe(MIB // 2, 0.5) == 896 * 1024
+        assert ChunkSizeTuner(1000).size == MIB // 4
+        # The maximum suits the stock PHP limits, and wins over the minimum
+        assert ChunkSizeTuner(4 * MIB).size == 2 * MIB
+        assert ChunkSizeTuner(maximum=MIB // 8).size == MIB // 8
+
+    def test_read_chunks(self):
+        chunks = []
+        for chunk in read_chunks(io.BytesIO(b'0123456789'), 4):
+            chunks.append(bytes(chunk))
+            base = chunk.obj
+        assert chunks == [b'0123', b'4567', b'89']
+        # A single buffer is allocated
+        assert len(base) == 4
+
+        chunks = read_chunks(mock.Mock(spec=['read'], read=mock.Mock(
+            side_effect=[b'0123', b'45', b''])), 4)
+        assert [bytes(chunk) for chunk in chunks] == [b'0123', b'45']
+
+    def test_multipart_body(self):
+        view = memoryview(b'\x00binary\r\n--data')
+        body = MultipartBody({'action': 'upload', 'comment': u'Ærø',
+                              'text': None}, {'chunk': view})
+        data = b''.join(body)
+        assert len(body) == len(data)
+        # The buffer is one of the parts
+        assert any(part is view for part in body)
+        assert b''.join(body) == data
+
+        fields = parse_multipart(body.content_type, data)
+        assert fields == {'action': b'upload',
+                          'comment': u'Ærø'.encode('utf-8'),
+                          'chunk': b'\x00binary\r\n--data'}
+
+
+class TestUpload(unittest.TestCase):
+
+    def setUp(self):
+        self.stub = Stub()
+        self.server = serve(self.stub)
+        self.site = mwklient.Site(
+            '127.0.0.1:%d' % self.server.server_address[1], scheme='http')
+        self.site.chunk_size = 1000
+        self.data = os.urandom(3500)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def test_stream(self):
+        response = self.site.upload(io.BytesIO(self.data), 'Test.bin')
+        assert response['upload']['result'] == 'Success'
+        assert self.stub.chunks == [1000, 1000, 1000, 500]
+        assert self.stub.uploads == [('Test.bin', self.data)]
+
+    def test_mmap(self):
+        path = os.path.join(self.directory, 'test.bin')
+        with open(path, 'wb') as fd:
+            fd.write(self.data)
+        with open(path, 'rb') as fd:
+            data = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+            response = self.site.upload(data, 'Test.bin')
+            # No view of the mapping is left
+            data.close()
+        assert response['upload']['result'] == 'Success'
+        assert self.stub.chunks == [1000, 1000, 1000, 500]
+        assert self.stub.uploads == [('Test.bin', self.data)]
+        metrics = self.site.metrics.snapshot()['upload']
+        assert metrics['bytes_out'] > len(self.data)
+
+    def test_small_buffer(self):
+        self.site.upload(bytearray(b'small'), 'Small.bin')
+        assert self.stub.chunks == []
+        assert self.stub.uploads == [('Small.bin', b'small')]
+
+    @mock.patch('time.sleep')
+    def test_retry(self, sleep):
+        # The file is sent again from its start
+        self.stub.failures = 1
+        self.site.upload(io.BytesIO(b'small'), 'Small.bin')
+        assert self.stub.uploads == [('Small.bin', b'small')]
+
+        self.stub.failures = 1
+        self.site.upload(self.data, 'Test.bin')
+        assert self.stub.uploads[-1] == ('Test.bin', self.data)
+        assert sleep.call_count == 2
+
+    @mock.patch('time.sleep')
+    def test_pipelined(self, sleep):
+        data = os.urandom(3 * MIB + 500)
+        self.site.chunk_size = MIB
+        self.site.max_chunk_size = 4 * MIB
+        response = self.site.upload(io.BytesIO(data), 'Test.bin',
+                                    pipelined=True)
+        assert response['upload'] == {'result': 'Success',
+                                      'filename': 'Test.bin'}
+        assert self.stub.uploads == [('Test.bin', data)]
+        assert self.stub.chunks[0] == MIB
+        assert sum(self.stub.chunks) == len(data)
+        # The assembly and the publication are polled twice each
+        assert sleep.call_count == 4
+        assert self.stub.queued == {'key0': []}
+
+    def test_default_chunk_sizes(self):
+        # The tuned chunks can grow from their initial size by default
+        site = mwklient.Site(self.site.host, path=self.site.path,
+                             scheme='http')
+        assert site._max_chunk_size() == 2 * MIB > site.chunk_size
+        tuner = ChunkSizeTuner(site.chunk_size,
+                               maximum=site._max_chunk_size())
+        assert tuner.observe(site.chunk_size, 1.0) == 2 * MIB
+        assert tuner.observe(2 * MIB, 1.0) == 2 * MIB
+
+    def test_max_chunk_size(self):
+        self.site.max_chunk_size = 8 * MIB
+        assert self.site._max_chunk_size() == 8 * MIB
+        self.site.site['maxuploadsize'] = 4 * MIB
+        assert self.site._max_chunk_size() == 4 * MIB
+        self.site.max_chunk_size = MIB // 2
+        assert self.site._max_chunk_size() == MIB // 2
+
+    @mock.patch('time.sleep')
+    def test_pipelined_stalled(self, sleep):
+        self.site.max_upload_polls = 3
+        self.stub.queue = lambda params, result, stage: {
+            'result': 'Poll', 'stage': 'queued', 'filekey': 'key0'}
+        self.stub.queued['key0'] = [{'result': 'Poll', 'stage': 'queued'}] * 5
+        with self.assertRaises(mwklient.errors.MaximumRetriesExceeded):
+            self.site.upload(self.data, 'Test.bin', pipelined=True)
+        assert [args[0][0] for args in sleep.call_args_list] == [0.5, 1, 2]
+
+    def interrupted_upload(self, file, state):
+        self.stub.fail_after = 2
+        with self.assertRaises(requests.exceptions.HTTPError):
+            self.site.upload(file, 'Test.bin', 'Description', state=state)
+        self.stub.fail_after = None
+        progress = UploadState.load(state)
+        assert (progress.filekey, progress.offset) == ('key0', 2000)
+        assert progress.filesize == len(self.data)
+        assert progress.comment == 'Description'
+
+    def test_resume(self):
+        path = os.path.join(self.directory, 'test.bin')
+        state = os.path.join(self.directory, 'upload.json')
+        with open(path, 'wb') as fd:
+            fd.write(self.data)
+        self.interrupted_upload(open(path, 'rb'), state)
+
+        response = self.site.resume_upload(path, state)
+        assert response['upload']['result'] == 'Success'
+        assert self.stub.chunks == [1000, 1000, 1000, 500]
+        assert self.stub.uploads == [('Test.bin', self.data)]
+        assert not os.path.exists(state)
+
+    def test_resume_from_server_offset(self):
+        # The server got a chunk whose acknowledgement was lost
+        state = os.path.join(self.directory, 'upload.json')
+        self.interrupted_upload(self.data, state)
+        self.stub.stash['key0'].extend(self.data[2000:3000])
+
+        self.site.resume_upload(bytearray(self.data), state)
+        assert self.stub.chunks == [1000, 1000, 500]
+        assert self.stub.uploads == [('Test.bin', self.data)]
+
+    def test_resume_errors(self):
+        state = os.path.join(self.directory, 'upload.json')
+        self.interrupted_upload(self.data, state)
+
+        with self.assertRaises(mwklient.errors.UploadStateError):
+            self.site.resume_upload(self.data[:-1], state)
+        with self.assertRaises(mwklient.errors.UploadStateError):
+            self.site.resume_upload(b'X' + self.data[1:], state)
+
+        del self.stub.stash['key0']
+        with self.assertRaises(mwklient.errors.APIError):
+            self.site.resume_upload(self.data, state)
+
+        with open(state, 'w') as fd:
+            fd.write('{}')
+        with self.assertRaises(mwklient.errors.UploadStateError):
+            self.site.resume_upload(self.data, state)
+
+
+if __name__ == '__main__':
+    unittest.main()
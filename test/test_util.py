@@ -4,7 +4,10 @@ The class TestUtil defines unit test cases.
 """
 import unittest
 import time
-from mwklient.util import parse_timestamp
+import json
+from collections import OrderedDict
+import mock
+from mwklient.util import parse_timestamp, TimestampedItem, get_json_decoder
 
 
 class TestUtil(unittest.TestCase):
@@ -28,6 +31,57 @@ class TestUtil(unittest.TestCase):
         nice_ts = time.struct_time((2015, 1, 2, 20, 18, 36, 4, 2, -1))
         self.assertEqual(nice_ts, parse_timestamp('2015-01-02T20:18:36Z'))
 
+    def test_parse_timestamp_fast_path(self):
+        # The fast path must agree with time.strptime
+        for timestamp in ('2016-02-29T23:59:59Z', '1999-12-31T00:00:00Z',
+                          '2019-07-14T12:34:56Z', '2019-07-14T12:34:56Z'):
+            self.assertEqual(
+                time.strptime(timestamp, '%Y-%m-%dT%H:%M:%SZ'),
+                parse_timestamp(timestamp))
+
+    def test_parse_parsed_timestamp(self):
+        nice_ts = time.struct_time((2015, 1, 2, 20, 18, 36, 4, 2, -1))
+        self.assertIs(nice_ts, parse_timestamp(nice_ts))
+
+    def test_parse_invalid_timestamp(self):
+        for timestamp in ('2015-02-30T20:18:36Z', '2015-01-02T24:18:36Z',
+                          '2015/01/02T20:18:36Z', '2015-01-02'):
+            with self.assertRaises(ValueError):
+                parse_timestamp(timestamp)
+
+    def test_timestamped_item(self):
+        item = TimestampedItem({'timestamp': '2015-01-02T20:18:36Z'})
+        self.assertEqual(dict.__getitem__(item, 'timestamp'),
+                         '2015-01-02T20:18:36Z')
+        self.assertEqual(item['timestamp'].tm_year, 2015)
+        self.assertEqual(item.get('timestamp').tm_mday, 2)
+        self.assertEqual(list(item.values())[0].tm_mon, 1)
+        self.assertIsNone(item.get('user'))
+
+        for copy in (dict, TimestampedItem.copy, lambda item: {**item},
+                     lambda item: json.loads(json.dumps(item))):
+            item = TimestampedItem({'timestamp': '2015-01-02T20:18:36Z'})
+            self.assertEqual(tuple(copy(item)['timestamp'])[:3],
+                             (2015, 1, 2))
+
+    def test_json_decoder(self):
+        response = '{"query": {"pages": {"2": {}, "1": {}}}}'
+        decoded = get_json_decoder()(response)
+        self.assertIs(type(decoded), dict)
+        self.assertEqual(list(decoded['query']['pages']), ['2', '1'])
+
+        decoded = get_json_decoder('ordered')(response)
+        self.assertIsInstance(decoded['query'], OrderedDict)
+        with mock.patch('sys.version_info', (3, 6, 9)):
+            self.assertIsInstance(get_json_decoder()(response)['query'],
+                                  OrderedDict)
+
+        self.assertEqual(get_json_decoder('auto')(response), decoded)
+        self.assertIs(get_json_decoder(len), len)
+
+        with self.assertRaises(RuntimeError):
+            get_json_decoder('yaml')
+
 
 if __name__ == '__main__':
     unittest.main()